@@ -1,6 +1,6 @@
 import unittest
 
-from question import Question
+from question import DISCORD_UNDERSCORE, Hints, Question
 
 class TestStringMethods(unittest.TestCase):
 
@@ -9,6 +9,11 @@ class TestStringMethods(unittest.TestCase):
         self.assertFalse(q.is_answer_correct("2"))
         self.assertTrue(q.is_answer_correct("8"))
 
+    def test_single_numeric_character(self):
+        q = Question("Which fraction?", "½")
+        self.assertTrue(q.is_answer_correct("½"))
+        self.assertFalse(q.is_answer_correct("2"))
+
     def test_remove_stop_words(self):
         q = Question("", "California and Hawaii")
         self.assertTrue(q.is_answer_correct("California Hawaii"))
@@ -79,6 +84,45 @@ class TestStringMethods(unittest.TestCase):
         q = Question("", "One, earth")
         self.assertTrue(q.is_answer_correct("1 earth"))
 
+    def test_first_correct_in_burst(self):
+        q = Question("", "Yellowstone National Park")
+        matcher = q.get_matcher()
+        self.assertEqual(matcher.first_correct(["yosemite", "park", "yelowstone", "yellowstone"]), 2)
+        self.assertIsNone(matcher.first_correct(["yosemite", "park", "yosemite"]))
+
+    def test_prefilter_keeps_correct_guesses(self):
+        q = Question("Who is the only US president to serve more than two terms?", "President Franklin Delano Roosevelt")
+        matcher = q.get_matcher()
+        for guess in ["Franklin Roosevelt", "rosevelt", "FDR Roosevelt!", "Fránklin"]:
+            self.assertTrue(matcher.could_match(guess))
+        self.assertFalse(matcher.could_match("lol"))
+        self.assertFalse(matcher.could_match("gg wp"))
+
+    def test_hints_extend_each_other(self):
+        hints = Hints("Leonardo da Vinci, Jr.", (1/5, 3/5, 1))
+        levels = [hints.hint(level) for level in range(len(hints))]
+        self.assertEqual(levels[-1], 'Leonardo  da  Vinci,  Jr.')
+        self.assertEqual(levels[0].count('  '), 3)
+        self.assertTrue(levels[0].endswith('.'))
+
+        revealed = [self.revealed(level) for level in levels]
+        self.assertEqual([len(letters) for letters in revealed], [3, 10, 17])
+        self.assertTrue(revealed[0] <= revealed[1] <= revealed[2])
+        self.assertEqual(Hints("8").hint(0), DISCORD_UNDERSCORE)
+
+    def revealed(self, hint):
+        characters = []
+        i = 0
+        while i < len(hint):
+            if hint.startswith(DISCORD_UNDERSCORE, i) or hint.startswith('  ', i):
+                characters.append(None)
+                i += 2
+            else:
+                characters.append(hint[i])
+                i += 1
+        return {i for i, character in enumerate(characters) if character and character.isalnum()}
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,148 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from question import DIFFICULTIES, Question
+
+BANK_PATH = 'questions.bank'
+MAGIC = b'TRVB'
+# version 2 added categories and difficulties, version 1 banks still map without them
+VERSION = 2
+
+# magic, version, question count
+HEADER = struct.Struct('<4sIQ')
+# every question has three strings in the heap: question, answer and details
+FIELDS = 3
+
+
+# writes the bank as a header, one offset per string boundary, one category number, ignore
+# flag byte and difficulty byte per question and a single utf-8 string heap followed by the
+# newline separated category names, so readers can map it without parsing. numbers are in
+# native byte order, the file is meant to be shared on one host
+def export_bank(questions, path=BANK_PATH):
+    heap = bytearray()
+    offsets = [0]
+    flags = bytearray()
+    # 0 is no category or difficulty
+    category_numbers = {}
+    categories = array('I')
+    difficulties = bytearray()
+    for question in questions:
+        for text in (question.get_question(), question.get_answer(), question.get_details() or ''):
+            heap += text.encode()
+            offsets.append(len(heap))
+        flags.append(question.is_ignored())
+        category = question.get_category()
+        if category:
+            category = category.replace('\n', ' ')
+            categories.append(category_numbers.setdefault(category, len(category_numbers) + 1))
+        else:
+            categories.append(0)
+        difficulty = question.get_difficulty()
+        difficulties.append(DIFFICULTIES.index(difficulty) + 1 if difficulty in DIFFICULTIES else 0)
+
+    # written aside and renamed so processes that have the old file mapped keep working
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(flags)))
+        f.write(array('Q', offsets).tobytes())
+        f.write(categories.tobytes())
+        f.write(flags)
+        f.write(difficulties)
+        f.write(heap)
+        f.write('\n'.join(category_numbers).encode())
+    os.replace(tmp_path, path)
+
+
+# read-only view of an exported bank, questions are decoded from the page cache on access
+# so every process on the host shares one copy of the corpus
+class MappedBank:
+
+    def __init__(self, path=BANK_PATH):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version not in (1, VERSION):
+            raise ValueError(f'{path} is not a question bank')
+
+        self._count = count
+        self._view = memoryview(self._map)
+        offsets_start = HEADER.size
+        offsets_end = offsets_start + 8 * (FIELDS * count + 1)
+        self._offsets = self._view[offsets_start:offsets_end].cast('Q')
+        if version == 1:
+            self.category_names = [None]
+            self._categories = None
+            self._difficulties = None
+            flags_start = offsets_end
+            self._heap_start = flags_start + count
+        else:
+            flags_start = offsets_end + 4 * count
+            self._heap_start = flags_start + 2 * count
+            self._categories = self._view[offsets_end:flags_start].cast('I')
+            self._difficulties = self._view[flags_start + count:self._heap_start]
+            names = str(self._map[self._heap_start + self._offsets[FIELDS * count]:], 'utf-8')
+            self.category_names = [None] + (names.split('\n') if names else [])
+        self._flags = self._view[flags_start:flags_start + count]
+        # questions ignored after the export, the mapping itself is read-only
+        self._ignored = set()
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError('question index out of range')
+
+        base = FIELDS * index
+        question, answer, details = [self._string(base + i) for i in range(FIELDS)]
+        category = difficulty = None
+        if self._categories is not None:
+            category = self.category_names[self._categories[index]]
+            difficulty = self._difficulties[index]
+            difficulty = DIFFICULTIES[difficulty - 1] if difficulty else None
+        q = Question(question, answer, details or None, category, difficulty)
+        if self._flags[index] or (self._ignored and q.get_id() in self._ignored):
+            q.ignore_question()
+        return q
+
+    def _string(self, field):
+        start = self._heap_start + self._offsets[field]
+        end = self._heap_start + self._offsets[field + 1]
+        return str(self._map[start:end], 'utf-8')
+
+    def mark_ignored(self, question):
+        self._ignored.add(question.get_id())
+
+    # category names, the category number and difficulty number of every question, read
+    # straight from the mapping so indexing the bank decodes no question
+    def metadata(self):
+        if self._categories is None:
+            return self.category_names, bytes(self._count), bytes(self._count)
+        return self.category_names, self._categories, self._difficulties
+
+    def close(self):
+        self._offsets.release()
+        if self._categories is not None:
+            self._categories.release()
+            self._difficulties.release()
+        self._flags.release()
+        self._view.release()
+        self._map.close()
+
+
+# python bank.py [questions.db] [questions.bank]
+if __name__ == '__main__':
+    from store import QuestionStore
+
+    store_path = sys.argv[1] if len(sys.argv) > 1 else 'questions.db'
+    bank_path = sys.argv[2] if len(sys.argv) > 2 else BANK_PATH
+    questions = QuestionStore(store_path).load()
+    export_bank(questions, bank_path)
+    print(f'Exported {len(questions)} questions to {bank_path}')
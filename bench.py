@@ -0,0 +1,971 @@
+import mmap
+import os
+import pickle
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from math import floor
+
+import Levenshtein
+from num2words import num2words
+from unidecode import unidecode
+
+from fixtures import FixtureServer
+from loadtest import CHATTER, FakeAuthor, FakeChannel, FakeContext, FakeGuild, FakeMessage, _typo
+from question import DISCORD_UNDERSCORE, Question, STOP_WORDS, MAXMIMUM_DISTANCE
+
+# (question, answer, guesses) taken from answer_test.py
+CASES = [
+    ("", "8", ["2", "8"]),
+    ("", "California and Hawaii", ["California Hawaii", "Hawaii California", "Hawaii and"]),
+    ("", "\n!%#answer{}()", ["answer"]),
+    ("", "Baking soda", ["Baking", "soda"]),
+    ("", "The Emerald City", ["Emeralz City"]),
+    ("", "The I we ours you they chicken was doing a the and", ["chicken"]),
+    ("", "321", ["321", "322", "421", "32"]),
+    ("", "Twenty-Seven", ["27"]),
+    ("", "Yellowstone National Park", ["yellowstone"]),
+    ("Who is the only US president to serve more than two terms?", "President Franklin Delano Roosevelt", ["Franklin Roosevelt", "Roosevelt"]),
+    ("", "tin", ["tin", "bin"]),
+    ("", "The I.D.P.D", ["idpd", "idps"]),
+    ("", "Adiós", ["adios", "adiós"]),
+    ("", "Marine One", ["Airforce One"]),
+    ("", "20", ["twenty"]),
+    ("", "One, earth", ["1 earth"]),
+]
+
+
+# membership checks were linear scans over a list before the frozenset
+LEGACY_STOP_WORDS = list(STOP_WORDS)
+
+
+# the answer check as it was before the precompiled matcher, kept for comparison
+def legacy_is_answer_correct(question, answer, guess):
+    if len(answer) == 1:
+        return guess.lower() == answer
+
+    if guess.isnumeric():
+        if guess.lower() == answer.lower():
+            return True
+        guess = num2words(guess)
+
+    if answer.isnumeric():
+        if guess.lower() == num2words(answer).lower():
+            return True
+
+    question = unidecode(question.lower())
+    question = re.sub(r'[^A-Za-z0-9 ]+', '', question)
+    answer = unidecode(answer.lower())
+    answer = re.sub(r'[^A-Za-z0-9 ]+', '', answer)
+    guess = unidecode(guess.lower())
+    guess = re.sub(r'[^A-Za-z0-9 ]+', '', guess)
+
+    question_tokens = question.split(' ')
+    answer_tokens = answer.split(' ')
+    guess_tokens = guess.split(' ')
+
+    answer_tokens = list(filter(lambda x: x not in LEGACY_STOP_WORDS and x not in question_tokens, answer_tokens))
+    guess_tokens = list(filter(lambda x: x not in LEGACY_STOP_WORDS and x not in question_tokens, guess_tokens))
+
+    correct_tokens = 0
+    for guess_token in guess_tokens:
+        for answer_token in answer_tokens:
+            max_distance = MAXMIMUM_DISTANCE
+            if len(answer_token) > 6:
+                max_distance = 1
+            elif len(answer_token) < 5:
+                max_distance = 0
+
+            if Levenshtein.distance(answer_token, guess_token) <= max_distance:
+                correct_tokens += 1
+                if len(answer_token) > 8:
+                    correct_tokens += 1
+
+    if len(answer_tokens) == 1:
+        return correct_tokens >= 1
+
+    return correct_tokens > floor(len(answer_tokens) / 2)
+
+
+def _guesses_per_second(check, cases, seconds=1.0):
+    checked = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for question, guesses in cases:
+            for guess in guesses:
+                check(question, guess)
+            checked += len(guesses)
+    return checked / (time.perf_counter() - start)
+
+
+def bench_matcher():
+    cases = [(Question(q, a), guesses) for q, a, guesses in CASES]
+    for question, guesses in cases:
+        for guess in guesses:
+            assert question.is_answer_correct(guess) == legacy_is_answer_correct(question.get_question(), question.get_answer(), guess)
+
+    legacy = _guesses_per_second(lambda q, g: legacy_is_answer_correct(q.get_question(), q.get_answer(), g), cases)
+    compiled = _guesses_per_second(lambda q, g: q.is_answer_correct(g), cases)
+    print(f'matcher: legacy {legacy:,.0f} guesses/s, compiled {compiled:,.0f} guesses/s ({compiled / legacy:.1f}x)')
+
+
+# real scraped answers when a snapshot is around, the test cases otherwise
+def _load_corpus(limit=2000):
+    questions = [Question(q, a) for q, a, _ in CASES]
+    if os.path.exists('questions.db'):
+        from store import QuestionStore
+        questions = QuestionStore().load() or questions
+    random.seed(0)
+    return random.sample(questions, min(limit, len(questions)))
+
+
+def bench_pipeline():
+    corpus = _load_corpus()
+    cases = []
+    for question in corpus:
+        other = random.choice(corpus).get_answer()
+        cases.append((question, [question.get_answer(), _typo(question.get_answer()), other]))
+
+    guesses = sum(len(g) for _, g in cases)
+    start = time.perf_counter()
+    for question, guess_list in cases:
+        for guess in guess_list:
+            legacy_is_answer_correct(question.get_question(), question.get_answer(), guess)
+    legacy = (time.perf_counter() - start) / guesses
+
+    for question, _ in cases:
+        question.get_matcher()
+    start = time.perf_counter()
+    for question, guess_list in cases:
+        for guess in guess_list:
+            question.is_answer_correct(guess)
+    current = (time.perf_counter() - start) / guesses
+
+    print(f'pipeline: {len(corpus)} answers, legacy {legacy * 1e6:.1f} us/guess, current {current * 1e6:.1f} us/guess')
+
+
+def _timed_scrape(scraper):
+    start = time.perf_counter()
+    questions = scraper.scrape()
+    elapsed = time.perf_counter() - start
+    return len(questions), scraper.pages, elapsed
+
+
+def bench_scrape():
+    from scraper import Scraper
+
+    # 50ms per request stands in for the round trip to the real sites
+    with FixtureServer(categories=12, pages=8, articles=20, opentdb_batches=4, latency=0.05) as server:
+        urls = server.scraper_urls()
+        for name, scraper in [('sequential', Scraper(workers=1, pages_ahead=1, **urls)), ('concurrent', Scraper(**urls))]:
+            questions, pages, elapsed = _timed_scrape(scraper)
+            print(f'scrape {name}: {questions} questions, {pages} pages in {elapsed:.2f}s ({pages / elapsed:.1f} pages/s)')
+
+
+# the page parser as it was before streaming, kept for comparison
+def legacy_parse_page(content):
+    from bs4 import BeautifulSoup
+    from question import parse_answer
+
+    questions = []
+    bs = BeautifulSoup(content, "html.parser")
+    for q in bs.find_all('article'):
+        question = q.find('a').text
+        answer, details = parse_answer(q.find('div', {'class': 'su-spoiler-content'}).text)
+        questions.append(Question(question, answer, details))
+    return questions
+
+
+def _peak_memory(parse):
+    import tracemalloc
+
+    tracemalloc.start()
+    parse()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def bench_parse(pages=40, articles=50, chunk=16 * 1024):
+    from scraper import iter_questions
+
+    # category pages saved from the fixture, with realistic padding around every article
+    server = FixtureServer(articles=articles)
+    padding = '<div class="sidebar">' + '<p><a href="/tag">tag</a> lorem ipsum dolor sit amet</p>' * 20 + '</div>'
+    saved = [server.category_page(i % 3, i + 1).replace('</article>', '</article>' + padding).encode() for i in range(pages)]
+    server._server.server_close()
+    size = sum(len(page) for page in saved)
+
+    def legacy():
+        return [len(legacy_parse_page(page)) for page in saved]
+
+    def streaming():
+        return [sum(1 for _ in iter_questions(page[i:i + chunk] for i in range(0, len(page), chunk))) for page in saved]
+
+    assert legacy() == streaming()
+    for name, parse in [('beautifulsoup', legacy), ('streaming', streaming)]:
+        start = time.perf_counter()
+        parse()
+        elapsed = time.perf_counter() - start
+        # pages are parsed one after the other, so the peak is what one page needs
+        peak = _peak_memory(parse)
+        print(f'parse {name:>13}: {size / elapsed / 1024 / 1024:.1f} MiB/s, {pages * articles / elapsed:,.0f} articles/s, '
+              f'peak {peak / 1024:.0f} KiB over {size / 1024 / pages:.0f} KiB pages')
+
+
+def _cold_start(statement, runs=5):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', statement], check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_rescrape(categories=20, pages=10, articles=20, latency=0.01):
+    from scraper import Checkpoint, Scraper, ScrapeCache
+
+    with FixtureServer(categories=categories, pages=pages, articles=articles, latency=latency) as server, \
+            tempfile.TemporaryDirectory() as directory:
+        urls = server.scraper_urls()
+        full = Scraper(**urls)
+        start = time.perf_counter()
+        questions = full.scrape()
+        elapsed = time.perf_counter() - start
+        print(f'rescrape full: {len(questions)} questions, {full.pages} pages, {full.bytes / 1024:.0f} KiB in {elapsed:.2f}s')
+
+        seen = {q.get_id() for q in questions}
+        cache = ScrapeCache(os.path.join(directory, 'cache.db'))
+        checkpoint = Checkpoint(os.path.join(directory, 'checkpoint.jsonl'))
+        # the first incremental run fills the cache
+        Scraper(cache=cache, checkpoint=checkpoint, **urls).scrape(seen)
+        checkpoint.clear()
+
+        for name, added in [('no change', 0), ('5 new articles', 5)]:
+            if added:
+                server.add_articles(0, added)
+            incremental = Scraper(cache=cache, checkpoint=checkpoint, **urls)
+            start = time.perf_counter()
+            new = incremental.scrape(seen)
+            elapsed = time.perf_counter() - start
+            checkpoint.clear()
+            print(f'rescrape incremental, {name}: {len(new)} new questions, {incremental.pages} requests, '
+                  f'{incremental.bytes / 1024:.1f} KiB in {elapsed:.2f}s')
+        cache.close()
+
+
+def bench_startup():
+    interpreter = _cold_start('pass')
+    for module in ['question', 'game']:
+        elapsed = _cold_start(f'import {module}') - interpreter
+        print(f'startup: cold import of {module} {elapsed * 1000:.0f}ms')
+
+    if os.path.exists('questions.db'):
+        elapsed = _cold_start('from question import Question_Database; Question_Database.get_questions()') - interpreter
+        print(f'startup: import and load questions.db {elapsed * 1000:.0f}ms')
+
+
+def _synthetic_questions(count):
+    return [Question(f'{i}: synthetic question about something?', f'Answer {i}', f'(detail {i})') for i in range(count)]
+
+
+def _pickle_ignore(path, question):
+    with open(path, 'rb') as f:
+        all_questions = pickle.load(f)
+    all_questions[all_questions.index(question)].ignore_question()
+    with open(path, 'wb') as f:
+        pickle.dump(all_questions, f)
+
+
+def bench_store(sizes=(10_000, 100_000, 1_000_000)):
+    from store import QuestionStore
+
+    for size in sizes:
+        questions = _synthetic_questions(size)
+        target = questions[-1]
+        with tempfile.TemporaryDirectory() as directory:
+            pickle_path = os.path.join(directory, 'questions.pkl')
+            with open(pickle_path, 'wb') as f:
+                pickle.dump(questions, f)
+            start = time.perf_counter()
+            with open(pickle_path, 'rb') as f:
+                pickle.load(f)
+            pickle_load = time.perf_counter() - start
+            start = time.perf_counter()
+            _pickle_ignore(pickle_path, target)
+            pickle_ignore = time.perf_counter() - start
+
+            start = time.perf_counter()
+            store = QuestionStore(os.path.join(directory, 'questions.db'), pickle_path)
+            migrate = time.perf_counter() - start
+            start = time.perf_counter()
+            store.load()
+            store_load = time.perf_counter() - start
+            start = time.perf_counter()
+            store.ignore(target.get_id())
+            store_ignore = time.perf_counter() - start
+            store.close()
+
+        print(f'store {size:>9,}: pickle load {pickle_load * 1000:.0f}ms ignore {pickle_ignore * 1000:.1f}ms | '
+              f'sqlite migrate {migrate * 1000:.0f}ms load {store_load * 1000:.0f}ms ignore {store_ignore * 1000:.2f}ms')
+
+
+def bench_journal(size=100_000, mutations=5_000, pickled=20):
+    import asyncio
+    from journal import Journal
+    from question import QuestionDatabase
+
+    questions = _synthetic_questions(size)
+    with tempfile.TemporaryDirectory() as directory:
+        # the whole bank loaded and written again on the event loop for every ignore
+        pickle_path = os.path.join(directory, 'questions.pkl')
+        with open(pickle_path, 'wb') as f:
+            pickle.dump(questions, f)
+        start = time.perf_counter()
+        for question in questions[:pickled]:
+            _pickle_ignore(pickle_path, question)
+        elapsed = time.perf_counter() - start
+        print(f'journal pickle rewrite: loop blocked {elapsed / pickled * 1000:.0f}ms per mutation, {pickled / elapsed:,.1f} mutations/s')
+
+        database = QuestionDatabase(store_path=os.path.join(directory, 'questions.db'))
+        database._write(questions)
+
+        async def burst():
+            from loadtest import _percentile
+
+            # a task that wants the loop every millisecond, how late it gets it is the stall
+            lags = []
+            done = asyncio.Event()
+
+            async def probe():
+                while not done.is_set():
+                    before = time.perf_counter()
+                    await asyncio.sleep(0.001)
+                    lags.append(time.perf_counter() - before - 0.001)
+
+            probing = asyncio.ensure_future(probe())
+            start = time.perf_counter()
+            for question in questions[:mutations]:
+                await database.ignore_question(question)
+                # every ignore is its own command, other events run in between
+                await asyncio.sleep(0)
+            if database.journal is not None:
+                await asyncio.get_event_loop().run_in_executor(None, database.journal.wait)
+            elapsed = time.perf_counter() - start
+            done.set()
+            await probing
+            return _percentile(lags, 99), max(lags), elapsed
+
+        p99, worst, elapsed = asyncio.run(burst())
+        print(f'journal sqlite per write: loop lag p99 {p99 * 1000:.1f}ms max {worst * 1000:.1f}ms, {mutations / elapsed:,.0f} mutations/s')
+
+        database.journal = Journal(os.path.join(directory, 'questions.journal'), database._get_store())
+        p99, worst, elapsed = asyncio.run(burst())
+        fsyncs = database.journal.fsyncs
+        start = time.perf_counter()
+        for question in questions[:mutations]:
+            database.question_asked(question)
+        appended = time.perf_counter() - start
+        database.journal.wait()
+        database.journal.close()
+        print(f'journal write-behind: loop lag p99 {p99 * 1000:.1f}ms max {worst * 1000:.1f}ms, {mutations / elapsed:,.0f} mutations/s '
+              f'durable, {fsyncs} fsyncs for {mutations:,} ignores, {appended / mutations * 1e6:.1f} us per stats append')
+
+
+# the merge as it was before fingerprints, kept for comparison
+def legacy_merge(all_questions, old_questions):
+    old_question_map = {}
+    for question in old_questions:
+        old_question_map[question.get_question() + question.get_answer()] = question
+
+    for question in old_questions:
+        if question.get_question() + question.get_answer() not in old_question_map:
+            all_questions.append(question)
+        elif question.is_ignored():
+            all_questions[all_questions.index(question)].ignore_question()
+    return all_questions
+
+
+def _merge_inputs(size):
+    random.seed(0)
+    scraped = _synthetic_questions(size)
+    # the other site carries some of the same questions with different punctuation and case
+    for i in random.sample(range(size), size // 20):
+        scraped.append(Question(scraped[i].get_question().upper().replace('?', ' ?'), scraped[i].get_answer() + '.'))
+    stored = _synthetic_questions(size)
+    for i in random.sample(range(size), size // 100):
+        stored[i].ignore_question()
+    return scraped, stored
+
+
+def bench_dedup(sizes=(5_000, 20_000, 100_000, 1_000_000)):
+    from dedup import merge_questions
+
+    for size in sizes:
+        scraped, stored = _merge_inputs(size)
+        start = time.perf_counter()
+        _, stats = merge_questions(scraped, stored)
+        elapsed = time.perf_counter() - start
+        line = f'dedup {size:>9,}: fingerprint merge {elapsed:.2f}s, {stats["duplicates"]} duplicates collapsed, {stats["ignored"]} ignored'
+
+        if size <= 20_000:
+            scraped, stored = _merge_inputs(size)
+            start = time.perf_counter()
+            legacy_merge(scraped, stored)
+            line += f' | legacy merge {time.perf_counter() - start:.2f}s'
+        print(line)
+
+
+class _StaticDatabase:
+
+    def __init__(self, questions):
+        self.questions = questions
+        self.version = 1
+
+    def get_questions(self):
+        return self.questions
+
+
+def bench_dealer(size=500_000, games=1_000, draws=20):
+    import tracemalloc
+    from game import QuestionsManager
+
+    bank = _synthetic_questions(size)
+    database = _StaticDatabase(bank)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    managers = [QuestionsManager(database) for _ in range(games)]
+    start = time.perf_counter()
+    for _ in range(draws):
+        for manager in managers:
+            manager.next()
+    elapsed = time.perf_counter() - start
+    per_game = (tracemalloc.get_traced_memory()[0] - before) / games
+    tracemalloc.stop()
+    print(f'dealer: {games} games x {draws} draws over {size:,} questions, {games * draws / elapsed:,.0f} draws/s, {per_game / 1024:.1f} KiB per game')
+
+    # before, games popped from the shared list and an independent pool meant a full copy per game
+    pool = list(bank)
+    start = time.perf_counter()
+    for _ in range(games):
+        pool.pop(random.randint(0, len(pool) - 1))
+    elapsed = time.perf_counter() - start
+    print(f'dealer legacy: {games / elapsed:,.0f} draws/s, {sys.getsizeof(pool) / 1024:.0f} KiB per copied pool')
+
+
+OPENTDB_CATEGORIES = ['General Knowledge', 'Entertainment: Books', 'Entertainment: Film', 'Entertainment: Music',
+                      'Entertainment: Television', 'Entertainment: Video Games', 'Science & Nature', 'Science: Computers',
+                      'Science: Mathematics', 'Mythology', 'Sports', 'Geography', 'History', 'Politics', 'Art',
+                      'Celebrities', 'Animals', 'Vehicles', 'Science: Gadgets']
+
+
+def bench_filtered(size=1_000_000, games=1_000, draws=20):
+    from bank import MappedBank, export_bank
+    from catalog import parse_filter
+    from game import QuestionsManager
+    from question import DIFFICULTIES, QuestionDatabase
+
+    random.seed(0)
+    # a third of the bank from trivia.fyi without a difficulty
+    bank = [Question(f'{i}: synthetic question about something?', f'Answer {i}', None, random.choice(OPENTDB_CATEGORIES),
+                     random.choice(DIFFICULTIES) if i % 3 else None) for i in range(size)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'questions.bank')
+        export_bank(bank, path)
+        del bank
+        database = QuestionDatabase()
+        database._set_questions(MappedBank(path))
+
+        start = time.perf_counter()
+        database.get_index()
+        print(f'filtered {size:,}: index built in {(time.perf_counter() - start) * 1000:.0f}ms')
+
+        for options in (['science', 'hard'], ['history'], ['easy'], ['video', 'games', 'medium']):
+            question_filter = parse_filter(options)
+            start = time.perf_counter()
+            matching = database.matching(question_filter)
+            first = time.perf_counter() - start
+            start = time.perf_counter()
+            managers = [QuestionsManager(database, question_filter) for _ in range(games)]
+            for _ in range(draws):
+                for manager in managers:
+                    manager.next()
+            elapsed = time.perf_counter() - start
+            print(f'filtered {" ".join(options):>17}: {len(matching):,} questions, first lookup {first * 1000:.1f}ms, '
+                  f'{games * draws / elapsed:,.0f} draws/s')
+
+        # finding the matching questions by looking at every one of them
+        _, difficulty = parse_filter(['science', 'hard'])
+        start = time.perf_counter()
+        [q for q in database.get_questions() if q.get_difficulty() == difficulty and 'Science' in q.get_category()]
+        print(f'filtered scan: {(time.perf_counter() - start) * 1000:.0f}ms per filtered game')
+        database.get_questions().close()
+
+
+# the question layout before __slots__, kept for comparison
+class LegacyQuestion:
+
+    def __init__(self, question, answer, detail=None):
+        self.question = question
+        self.answer = answer
+        self.ignore = False
+        self.details = detail
+
+
+def _resident(build):
+    import tracemalloc
+
+    tracemalloc.start()
+    objects = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return objects, size
+
+
+def bench_memory(size=100_000):
+    texts = [(f'{i}: synthetic question about something?', f'Answer {i}', f'(detail {i})') for i in range(size)]
+    for name, cls in [('dict', LegacyQuestion), ('slots', Question)]:
+        questions, resident = _resident(lambda: [cls(q, a, d) for q, a, d in texts])
+        start = time.perf_counter()
+        data = pickle.dumps(questions)
+        dump = time.perf_counter() - start
+        start = time.perf_counter()
+        pickle.loads(data)
+        load = time.perf_counter() - start
+        print(f'memory {name:>5}: {resident / 2 ** 20:.1f} MiB per {size:,} questions, pickle {len(data) / 2 ** 20:.1f} MiB, dump {dump * 1000:.0f}ms, load {load * 1000:.0f}ms')
+
+
+def _memory_status():
+    status = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'):
+                status[parts[0][:-1]] = int(parts[1]) * 1024
+    return status
+
+
+def _bank_worker(kind, path, barrier, results):
+    start = time.perf_counter()
+    if kind == 'pickle':
+        with open(path, 'rb') as f:
+            questions = pickle.load(f)
+    else:
+        from bank import MappedBank
+        questions = MappedBank(path)
+        # a long running shard ends up touching the whole corpus
+        for offset in range(0, len(questions._map), mmap.PAGESIZE):
+            questions._map[offset]
+    startup = time.perf_counter() - start
+    for _ in range(1000):
+        questions[random.randint(0, len(questions) - 1)].get_answer()
+
+    # every process holds the corpus at the same time so shared pages are accounted for
+    barrier.wait()
+    results.put((startup, _memory_status()))
+    barrier.wait()
+
+
+def bench_mmap(size=200_000, processes=4):
+    import multiprocessing
+    from bank import export_bank
+
+    questions = _synthetic_questions(size)
+    context = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as directory:
+        paths = {'pickle': os.path.join(directory, 'questions.pkl'), 'mmap': os.path.join(directory, 'questions.bank')}
+        with open(paths['pickle'], 'wb') as f:
+            pickle.dump(questions, f)
+        export_bank(questions, paths['mmap'])
+
+        for kind, path in paths.items():
+            barrier = context.Barrier(processes)
+            results = context.Queue()
+            workers = [context.Process(target=_bank_worker, args=(kind, path, barrier, results)) for _ in range(processes)]
+            for worker in workers:
+                worker.start()
+            stats = [results.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+
+            startup = sum(s for s, _ in stats) / processes
+            rss = sum(m['Rss'] for _, m in stats) / 2 ** 20
+            pss = sum(m['Pss'] for _, m in stats) / 2 ** 20
+            print(f'mmap {kind:>6}: {processes} processes x {size:,} questions, startup {startup * 1000:.0f}ms, total RSS {rss:.0f} MiB, total PSS {pss:.0f} MiB')
+
+
+WRONG_GUESSES = ['paris', '1945', 'blue', 'london', 'no idea', 'lincoln', 'washington', 'the moon', 'gold', 'red',
+                 'pacific ocean', 'einstein', 'i think it is rome', 'jupiter', 'mars', 'newton', 'lol', '42']
+
+
+def _burst(size, answer):
+    guesses = [random.choice(WRONG_GUESSES) for _ in range(size - 1)]
+    return guesses + [answer.lower()]
+
+
+def bench_burst(sizes=(10, 100, 1_000), rounds=200):
+    random.seed(0)
+    questions = [Question("Who is the only US president to serve more than two terms?", "President Franklin Delano Roosevelt"),
+                 Question("", "Yellowstone National Park"), Question("", "The Emerald City")]
+    for size in sizes:
+        bursts = [(q, _burst(size, q.get_answer())) for q in questions for _ in range(rounds // len(questions))]
+        for q, _ in bursts:
+            q.get_matcher()
+
+        start = time.perf_counter()
+        for q, guesses in bursts:
+            for guess in guesses:
+                if q.is_answer_correct(guess):
+                    break
+        serial = len(bursts) * size / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for q, guesses in bursts:
+            q.get_matcher().first_correct(guesses)
+        batched = len(bursts) * size / (time.perf_counter() - start)
+        print(f'burst {size:>5}: serial {serial:,.0f} guesses/s, batched {batched:,.0f} guesses/s ({batched / serial:.1f}x)')
+
+
+_GUILD = FakeGuild(1)
+
+
+def _channel(id):
+    return FakeChannel(id, _GUILD)
+
+
+def _context(channel_id):
+    return FakeContext(_channel(channel_id), {'sends': 0, 'ack_latencies': []})
+
+
+# chat in a channel with a question up: mostly chatter, some wrong guesses, a rare right one
+def _chat_replay(answer, size):
+    channel = _channel(1)
+    messages = []
+    for i in range(size):
+        roll = random.random()
+        if roll < 0.6:
+            content = random.choice(CHATTER)
+        elif roll < 0.98:
+            content = random.choice(WRONG_GUESSES)
+        else:
+            content = _typo(answer)
+        messages.append(FakeMessage(channel, FakeAuthor(random.randint(1, 50)), content, i))
+    return messages
+
+
+def _replay(messages, question, prefilter):
+    import asyncio
+    from game import GameManager, GameState
+    from question import Question_Database
+
+    Question_Database._set_questions([question])
+
+    async def run():
+        manager = GameManager()
+        manager.start_game(_context(1), 1, 1)
+        game = manager.games[1]
+        game.batch_window = 0
+        game.question = question
+        game.asked_at = 0
+        matcher = question.get_matcher()
+        if not prefilter:
+            matcher.could_match = lambda guess: True
+        start = time.perf_counter()
+        for message in messages:
+            # keep the question open so every message is judged
+            game.state = GameState.AWAIT_ANSWER
+            game.question_answered = False
+            await manager.process_message(message)
+        elapsed = time.perf_counter() - start
+        if not prefilter:
+            del matcher.could_match
+        return elapsed
+
+    return asyncio.run(run())
+
+
+def bench_prefilter(size=20_000):
+    random.seed(0)
+    question = Question("Who is the only US president to serve more than two terms?", "President Franklin Delano Roosevelt")
+    messages = _chat_replay(question.get_answer(), size)
+    matcher = question.get_matcher()
+    rejected = sum(1 for m in messages if not matcher.could_match(m.content))
+
+    without = _replay(messages, question, prefilter=False)
+    with_prefilter = _replay(messages, question, prefilter=True)
+    print(f'prefilter: {rejected / size:.0%} of {size:,} messages short-circuited, '
+          f'{without / size * 1e6:.1f} us/message without, {with_prefilter / size * 1e6:.1f} us/message with')
+
+
+def bench_leaderboard(players=1_000_000, updates=200_000, queries=10_000):
+    import asyncio
+    from leaderboard import Leaderboard, RankIndex, channel_scope
+
+    random.seed(0)
+    index = RankIndex()
+    start = time.perf_counter()
+    for player in range(players):
+        index.update(player, random.randint(0, 10_000))
+    build = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(updates):
+        index.add(random.randrange(players), random.choice((10, 5, 3)))
+    update = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(queries):
+        index.rank(random.randrange(players))
+    rank = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(queries):
+        index.top(10)
+    top = time.perf_counter() - start
+    print(f'leaderboard {players:,} players: built in {build:.1f}s, {updates / update:,.0f} updates/s, '
+          f'rank {rank / queries * 1e6:.1f} us, top 10 {top / queries * 1e6:.1f} us')
+
+    # what answering one query cost when the board was sorted from scratch
+    start = time.perf_counter()
+    sorted(index.scores.items(), key=lambda item: item[1], reverse=True)
+    print(f'leaderboard legacy: one full sort {(time.perf_counter() - start) * 1000:.0f}ms per query')
+
+    with tempfile.TemporaryDirectory() as directory:
+        board = Leaderboard(os.path.join(directory, 'leaderboard.db'))
+        start = time.perf_counter()
+        for _ in range(updates):
+            board.add(random.randrange(100), random.randrange(10), random.randrange(players), 'player', 10)
+        add = time.perf_counter() - start
+        start = time.perf_counter()
+        asyncio.run(board.flush())
+        flush = time.perf_counter() - start
+        start = time.perf_counter()
+        board.top(channel_scope(0))
+        load = time.perf_counter() - start
+        board.close()
+    print(f'leaderboard sqlite: {updates / add:,.0f} adds/s, flushed {updates * 4:,} rows in {flush:.2f}s, '
+          f'first query of a board {load * 1000:.0f}ms')
+
+
+LONG_ANSWER = 'The Association of Southeast Asian Nations Regional Forum on Maritime Cooperation and Security'
+
+
+def _near_miss(answer):
+    # shuffled typo'd words that get past the prefilter but never reach a majority
+    words = [_typo(word) for word in answer.split()]
+    random.shuffle(words)
+    return ' '.join(words[:len(words) // 3] + [_typo(random.choice(WRONG_GUESSES)) for _ in range(6)])
+
+
+def bench_offload(channels=20, burst=100, seconds=3.0):
+    import asyncio
+    from game import MATCH_INLINE, MATCH_PROCESS, MATCH_THREAD, GameManager, GameState
+    from loadtest import VirtualClock, _percentile
+    from question import Question_Database
+
+    random.seed(0)
+    Question_Database._set_questions([Question(f'{i}: which forum is this?', LONG_ANSWER) for i in range(100)])
+
+    async def run(mode):
+        manager = GameManager(VirtualClock(), match_mode=mode)
+        channel_ids = list(range(channels))
+        for channel_id in channel_ids:
+            manager.start_game(_context(channel_id), channel_id, 1)
+            game = manager.games[channel_id]
+            game.question = Question_Database.get_questions()[channel_id]
+            game.asked_at = 0
+            game.state = GameState.AWAIT_ANSWER
+
+        lags = []
+        checked = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < seconds:
+            tick = time.perf_counter()
+            tasks = []
+            for channel_id in channel_ids:
+                for i in range(burst):
+                    message = FakeMessage(_channel(channel_id), FakeAuthor(i), _near_miss(LONG_ANSWER), checked)
+                    tasks.append(manager.process_message(message))
+                    checked += 1
+            # the flood is queued, then the loop is timed on a short sleep while it is worked off
+            gathered = asyncio.gather(*tasks)
+            while not gathered.done():
+                before = time.perf_counter()
+                await asyncio.sleep(0.005)
+                lags.append(time.perf_counter() - before - 0.005)
+            await gathered
+            await asyncio.sleep(max(0, 0.1 - (time.perf_counter() - tick)))
+        if manager.match_executor is not None:
+            manager.match_executor.shutdown()
+        return checked / (time.perf_counter() - start), lags
+
+    for mode in (MATCH_INLINE, MATCH_THREAD, MATCH_PROCESS):
+        rate, lags = asyncio.run(run(mode))
+        print(f'offload {mode:>7}: {rate:,.0f} guesses/s, loop lag p50 {_percentile(lags, 50) * 1000:.1f}ms '
+              f'p99 {_percentile(lags, 99) * 1000:.1f}ms max {max(lags, default=0) * 1000:.1f}ms ({os.cpu_count()} cpu)')
+
+
+# the same questions up in many channels at once, players repeat a few popular wrong guesses
+# (zipf weighted), spell out their own variants and now and then get close to the answer
+def _guess_trace(questions, channels, rounds, per_round):
+    trace = []
+    for round in range(rounds):
+        for channel_id in range(channels):
+            # about five channels share each question in a round
+            question = questions[(round * 7 + channel_id // 5) % len(questions)]
+            answers = [q.get_answer() for q in questions if q is not question]
+            popular = WRONG_GUESSES + answers[:20]
+            weights = [1 / (rank + 1) for rank in range(len(popular))]
+            guesses = []
+            for _ in range(per_round):
+                roll = random.random()
+                if roll < 0.8:
+                    guess = random.choices(popular, weights)[0]
+                    guesses.append(guess.upper() if random.random() < 0.1 else guess)
+                elif roll < 0.95:
+                    guesses.append(_typo(random.choice(popular)))
+                else:
+                    guesses.append(_typo(question.get_answer()))
+            trace.append((channel_id, question, guesses))
+    return trace
+
+
+def bench_verdicts(channels=100, rounds=40, per_round=20):
+    import asyncio
+    from game import GameManager, GameState
+    from loadtest import VirtualClock
+    from question import Question_Database
+
+    random.seed(0)
+    questions = _load_corpus(200)
+    Question_Database._set_questions(questions)
+    trace = _guess_trace(questions, channels, rounds, per_round)
+
+    async def run(cached):
+        manager = GameManager(VirtualClock(), match_mode='inline')
+        if not cached:
+            manager.verdicts = None
+        for channel_id in range(channels):
+            manager.start_game(_context(channel_id), channel_id, 1)
+            manager.games[channel_id].batch_window = 0
+        correct = 0
+        start = time.perf_counter()
+        for channel_id, question, guesses in trace:
+            game = manager.games[channel_id]
+            if game.question is not question:
+                game.question = question
+                game.asked_at = 0
+                game._hold(question)
+            for guess in guesses:
+                # keep the question open so every guess is judged
+                game.state = GameState.AWAIT_ANSWER
+                game.question_answered = False
+                await manager.process_message(FakeMessage(_channel(channel_id), FakeAuthor(1), guess, 0))
+                correct += game.question_answered
+        return time.perf_counter() - start, correct, manager.verdicts
+
+    messages = len(trace) * per_round
+    without, expected, _ = asyncio.run(run(False))
+    elapsed, correct, verdicts = asyncio.run(run(True))
+    assert correct == expected
+    print(f'verdicts {messages:,} guesses over {channels} channels: {without / messages * 1e6:.1f} us/guess uncached, '
+          f'{elapsed / messages * 1e6:.1f} us/guess cached ({without / elapsed:.1f}x), '
+          f'hit rate {verdicts.hits / (verdicts.hits + verdicts.misses):.0%}, {len(verdicts):,} verdicts held')
+
+
+# the hint as it was before the reveal order was fixed per question, kept for comparison
+def legacy_hint(answer, percentage):
+    if len(answer) == 1:
+        return DISCORD_UNDERSCORE
+
+    answer_length = len(re.sub(r'[^A-Za-z0-9]+', '', answer))
+    num_visible_letter = floor(answer_length * percentage)
+    if num_visible_letter == 0:
+        num_visible_letter = 1
+
+    valid_indexes = []
+    for i in range(answer_length):
+        if answer[i].isalnum():
+            valid_indexes.append(i)
+
+    letter_indexes = []
+    for i in range(num_visible_letter):
+        index = random.randint(0, len(valid_indexes) - 1)
+        letter_indexes.append(valid_indexes[index])
+        valid_indexes.pop(index)
+
+    hint = ''
+    for i in range(len(answer)):
+        if i in letter_indexes:
+            hint += answer[i]
+        elif answer[i] == ' ':
+            hint += '  '
+        elif not answer[i].isalnum():
+            hint += answer[i]
+        else:
+            hint += DISCORD_UNDERSCORE
+    return hint
+
+
+def bench_hints(rounds=2_000):
+    from question import HINT_FRACTIONS, Hints
+
+    random.seed(0)
+    words = LONG_ANSWER.split()
+    for size in (4, 13, 40, 120):
+        answer = ' '.join(random.choice(words) for _ in range(size))
+        rounds_for_size = max(20, rounds * 13 // size)
+
+        start = time.perf_counter()
+        for _ in range(rounds_for_size):
+            for fraction in HINT_FRACTIONS:
+                legacy_hint(answer, fraction)
+        legacy = (time.perf_counter() - start) / rounds_for_size
+
+        start = time.perf_counter()
+        for _ in range(rounds_for_size):
+            hints = Hints(answer)
+            for level in range(len(hints)):
+                hints.hint(level)
+        current = (time.perf_counter() - start) / rounds_for_size
+        print(f'hints {size:>3} words ({len(answer):>4} characters): legacy {legacy * 1e6:,.0f} us, '
+              f'fixed order {current * 1e6:,.0f} us per question ({legacy / current:.0f}x)')
+
+
+def bench_load():
+    import asyncio
+    from loadtest import print_report, run_load
+
+    print_report(asyncio.run(run_load(duration=30)))
+
+
+BENCHMARKS = {
+    'matcher': bench_matcher,
+    'pipeline': bench_pipeline,
+    'scrape': bench_scrape,
+    'rescrape': bench_rescrape,
+    'parse': bench_parse,
+    'startup': bench_startup,
+    'store': bench_store,
+    'journal': bench_journal,
+    'dedup': bench_dedup,
+    'dealer': bench_dealer,
+    'filtered': bench_filtered,
+    'memory': bench_memory,
+    'mmap': bench_mmap,
+    'burst': bench_burst,
+    'prefilter': bench_prefilter,
+    'hints': bench_hints,
+    'load': bench_load,
+    'leaderboard': bench_leaderboard,
+    'offload': bench_offload,
+    'verdicts': bench_verdicts,
+}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
@@ -0,0 +1,107 @@
+from array import array
+
+from question import DIFFICULTIES, STOP_WORDS, normalize
+
+# filtered position lists kept per bank
+FILTER_CACHE_SIZE = 64
+
+
+# words of a category name a filter can match, 'Science & Nature' is found by science or nature
+def category_words(name):
+    return [word for word in normalize(name).split() if word not in STOP_WORDS]
+
+
+# !start 10 science hard: a difficulty picks the difficulty, every other word has to be in
+# the category name. filters are (sorted words, difficulty) so they can be cached
+def parse_filter(options):
+    words = set()
+    difficulty = None
+    for option in options:
+        for word in normalize(option).split():
+            if word in DIFFICULTIES:
+                difficulty = word
+            elif word not in STOP_WORDS:
+                words.add(word)
+    if not words and difficulty is None:
+        return None
+    return tuple(sorted(words)), difficulty
+
+
+def describe_filter(question_filter):
+    words, difficulty = question_filter
+    return ' '.join(words + ((difficulty,) if difficulty else ()))
+
+
+def _metadata(questions):
+    # a mapped bank reads these without decoding a question
+    if hasattr(questions, 'metadata'):
+        return questions.metadata()
+
+    names = [None]
+    numbers = {}
+    categories = array('I')
+    difficulties = bytearray()
+    for question in questions:
+        category = question.get_category()
+        if category:
+            number = numbers.get(category)
+            if number is None:
+                number = numbers[category] = len(names)
+                names.append(category)
+            categories.append(number)
+        else:
+            categories.append(0)
+        difficulty = question.get_difficulty()
+        difficulties.append(DIFFICULTIES.index(difficulty) + 1 if difficulty in DIFFICULTIES else 0)
+    return names, categories, difficulties
+
+
+# bank positions by category and difficulty. a question has one of each, so the index keeps one
+# position list per (category, difficulty) pair and a filter is the union of the pairs it allows,
+# found without looking at a question. games then deal from that list in O(1) per question
+class QuestionIndex:
+
+    def __init__(self, questions):
+        names, categories, difficulties = _metadata(questions)
+        self.names = names
+        # (category number, difficulty number) -> positions, 0 is none
+        self.cells = {}
+        cells = self.cells
+        for position, cell in enumerate(zip(categories, difficulties)):
+            positions = cells.get(cell)
+            if positions is None:
+                positions = cells[cell] = array('I')
+            positions.append(position)
+
+        # category word -> category numbers
+        self.words = {}
+        for number, name in enumerate(names):
+            for word in category_words(name or ''):
+                self.words.setdefault(word, set()).add(number)
+        self._filtered = {}
+
+    def matching(self, question_filter):
+        positions = self._filtered.get(question_filter)
+        if positions is not None:
+            return positions
+
+        words, difficulty = question_filter
+        numbers = None
+        for word in words:
+            found = self.words.get(word, set())
+            numbers = found if numbers is None else numbers & found
+        level = DIFFICULTIES.index(difficulty) + 1 if difficulty else None
+
+        cells = [cell_positions for (number, cell_level), cell_positions in self.cells.items()
+                 if (numbers is None or number in numbers) and (level is None or cell_level == level)]
+        if len(cells) == 1:
+            positions = cells[0]
+        else:
+            positions = array('I')
+            for cell_positions in cells:
+                positions.extend(cell_positions)
+
+        if len(self._filtered) >= FILTER_CACHE_SIZE:
+            self._filtered.clear()
+        self._filtered[question_filter] = positions
+        return positions
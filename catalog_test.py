@@ -0,0 +1,41 @@
+import unittest
+
+from catalog import QuestionIndex, describe_filter, parse_filter
+from question import Question
+
+
+class TestCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.questions = [
+            Question('q0?', 'a0', None, 'Science & Nature', 'easy'),
+            Question('q1?', 'a1', None, 'Science: Computers', 'hard'),
+            Question('q2?', 'a2', None, 'History', 'hard'),
+            Question('q3?', 'a3', None, 'Science', None),
+            Question('q4?', 'a4'),
+            Question('q5?', 'a5', None, 'Science & Nature', 'hard'),
+        ]
+        self.index = QuestionIndex(self.questions)
+
+    def matching(self, *options):
+        return sorted(self.index.matching(parse_filter(options)))
+
+    def test_parses_words_and_difficulty(self):
+        self.assertIsNone(parse_filter([]))
+        self.assertEqual(parse_filter(['Science', 'HARD', 'the']), (('science',), 'hard'))
+        self.assertEqual(describe_filter(parse_filter(['hard', 'nature', 'science'])), 'nature science hard')
+
+    def test_filters_by_category_words_and_difficulty(self):
+        self.assertEqual(self.matching('science'), [0, 1, 3, 5])
+        self.assertEqual(self.matching('science', 'nature'), [0, 5])
+        self.assertEqual(self.matching('hard'), [1, 2, 5])
+        self.assertEqual(self.matching('science', 'hard'), [1, 5])
+        self.assertEqual(self.matching('geography'), [])
+
+    def test_filtered_positions_are_cached(self):
+        question_filter = parse_filter(['science', 'hard'])
+        self.assertIs(self.index.matching(question_filter), self.index.matching(question_filter))
+
+
+if __name__ == '__main__':
+    unittest.main()
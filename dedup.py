@@ -0,0 +1,61 @@
+import hashlib
+
+from question import STOP_WORDS, normalize
+
+
+def _digest(text):
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), 'big', signed=True)
+
+
+# same question and answer once case, accents, punctuation and spacing are ignored
+def fingerprint(question):
+    return _digest(' '.join(normalize(question.get_question()).split()) + '\0' + ' '.join(normalize(question.get_answer()).split()))
+
+
+# also catches reworded copies that only differ in word order or stop words
+def token_set_fingerprint(question):
+    question_tokens = sorted(set(normalize(question.get_question()).split()) - STOP_WORDS)
+    answer_tokens = sorted(set(normalize(question.get_answer()).split()) - STOP_WORDS)
+    return _digest(' '.join(question_tokens) + '\0' + ' '.join(answer_tokens))
+
+
+# linear merge of a fresh scrape with the stored bank, the first copy of a question wins,
+# stored questions missing from the scrape are kept and ignore flags carry over to every copy
+def merge_questions(scraped, stored, near_duplicates=False):
+    key = token_set_fingerprint if near_duplicates else fingerprint
+    stats = {'scraped': len(scraped), 'stored': len(stored), 'duplicates': 0, 'kept': 0, 'ignored': 0}
+
+    merged = {}
+    for question in scraped:
+        k = key(question)
+        if k in merged:
+            stats['duplicates'] += 1
+        else:
+            merged[k] = question
+
+    for question in stored:
+        k = key(question)
+        existing = merged.get(k)
+        if existing is None:
+            merged[k] = question
+            stats['kept'] += 1
+        elif question.is_ignored() and not existing.is_ignored():
+            existing.ignore_question()
+
+    questions = list(merged.values())
+    stats['ignored'] = sum(1 for q in questions if q.is_ignored())
+    return questions, stats
+
+
+# scraped questions the stored bank does not have yet, compared the same way as the merge
+def new_questions(scraped, stored, near_duplicates=False):
+    key = token_set_fingerprint if near_duplicates else fingerprint
+    seen = {key(question) for question in stored}
+
+    new = []
+    for question in scraped:
+        k = key(question)
+        if k not in seen:
+            seen.add(k)
+            new.append(question)
+    return new
@@ -0,0 +1,161 @@
+import hashlib
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CATEGORY_PAGE = '<html><body><table><tr>{}</tr></table></body></html>'
+CATEGORY_TD = '<td><a href="{link}">{name}</a></td>'
+QUESTIONS_PAGE = '<html><body><main>{}</main></body></html>'
+ARTICLE = ('<article class="post"><h2 class="entry-title"><a href="{link}">{question}</a></h2>'
+           '<div class="su-spoiler"><div class="su-spoiler-title">Answer</div>'
+           '<div class="su-spoiler-content">{answer}</div></div></article>')
+
+
+# local stand-in for trivia.fyi and opentdb serving generated pages, for tests and benchmarks
+class FixtureServer:
+
+    def __init__(self, categories=3, pages=3, articles=10, opentdb_batches=2, latency=0, failures=0, etags=True):
+        self.categories = [f'Category {i}' for i in range(categories)]
+        # articles published since the server started, newest first on page 1
+        self.added = [0] * categories
+        self.etags = etags
+        self.not_modified = 0
+        self.pages = pages
+        self.articles = articles
+        self.opentdb_batches = opentdb_batches
+        self.latency = latency
+        self.failures = failures
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._opentdb_calls = {}
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def scraper_urls(self):
+        return {
+            'categories_url': self.url + '/categories/',
+            'opentdb_token_url': self.url + '/api_token.php?command=request',
+            'opentdb_url': self.url + '/api.php?amount=50&encode=url3986&type=multiple&token=',
+        }
+
+    def expected_questions(self):
+        return len(self.categories) * self.pages * self.articles + sum(self.added) + self.opentdb_batches * 50
+
+    def add_articles(self, category, count):
+        with self._lock:
+            self.added[category] += count
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def category_page(self, category, page):
+        articles = []
+        if page == 1:
+            for i in reversed(range(self.added[category])):
+                articles.append(ARTICLE.format(
+                    link=f'{self.url}/q/{category}/new/{i}',
+                    question=f'New question {i} of category {category}?',
+                    answer=f'New answer {category}-{i}'))
+        for i in range(self.articles):
+            articles.append(ARTICLE.format(
+                link=f'{self.url}/q/{category}/{page}/{i}',
+                question=f'Question {i} on page {page} of category {category}?',
+                answer=f'Answer {category}-{page}-{i} (detail {i})'))
+        return QUESTIONS_PAGE.format(''.join(articles))
+
+    def opentdb_batch(self, token):
+        with self._lock:
+            call = self._opentdb_calls.get(token, 0)
+            self._opentdb_calls[token] = call + 1
+        if call >= self.opentdb_batches:
+            return {'response_code': 4, 'results': []}
+        results = []
+        for i in range(50):
+            results.append({
+                'category': urllib.parse.quote('General Knowledge'),
+                'difficulty': ('easy', 'medium', 'hard')[i % 3],
+                'question': urllib.parse.quote(f'Open question {call}-{i}?'),
+                'correct_answer': urllib.parse.quote(f'Open answer {call}-{i}'),
+            })
+        return {'response_code': 0, 'results': results}
+
+    def respond(self, path, query):
+        if path == '/categories/':
+            tds = [CATEGORY_TD.format(link=f'{self.url}/category/{i}', name=name) for i, name in enumerate(self.categories)]
+            return 200, CATEGORY_PAGE.format(''.join(tds)), 'text/html'
+        if path.startswith('/category/'):
+            parts = path.split('/')
+            category = int(parts[2])
+            page = int(parts[4]) if len(parts) > 4 else 1
+            if page > self.pages:
+                return 301, '', 'text/html'
+            return 200, self.category_page(category, page), 'text/html'
+        if path == '/api_token.php':
+            return 200, json.dumps({'response_code': 0, 'token': f'token{time.monotonic_ns()}'}), 'application/json'
+        if path == '/api.php':
+            return 200, json.dumps(self.opentdb_batch(query.get('token', [''])[0])), 'application/json'
+        return 404, '', 'text/plain'
+
+    def _handler(self):
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with fixture._lock:
+                    fixture.requests += 1
+                    fixture.in_flight += 1
+                    fixture.max_in_flight = max(fixture.max_in_flight, fixture.in_flight)
+                    failing = fixture.failures > 0
+                    fixture.failures -= 1
+                try:
+                    if fixture.latency:
+                        time.sleep(fixture.latency)
+                    url = urllib.parse.urlparse(self.path)
+                    if failing:
+                        status, body, content_type = 503, '', 'text/plain'
+                    else:
+                        status, body, content_type = fixture.respond(url.path, urllib.parse.parse_qs(url.query))
+                finally:
+                    with fixture._lock:
+                        fixture.in_flight -= 1
+                body = body.encode()
+                headers = {}
+                if status == 200 and content_type == 'text/html' and fixture.etags:
+                    headers['ETag'] = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+                    headers['Last-Modified'] = 'Thu, 01 Oct 2020 00:00:00 GMT'
+                    if self.headers.get('If-None-Match') == headers['ETag']:
+                        status, body = 304, b''
+                        with fixture._lock:
+                            fixture.not_modified += 1
+                self.send_response(status)
+                if status == 301:
+                    self.send_header('Location', fixture.url + '/categories/')
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
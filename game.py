@@ -1,66 +1,149 @@
-from datetime import datetime
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from random import randint
 
 from asyncio import Lock
-from question import Question_Database
+from metrics import metrics
+from outbox import ChannelOutbox
+from question import Hints, Question, Question_Database, pooled_first_correct
+from scheduler import Scheduler
+from verdicts import VERDICT_CACHE_SIZE, VerdictCache
 
 
-class GameManager:
+# where guesses are matched: on the event loop, in a thread pool or in a process pool
+MATCH_INLINE = 'inline'
+MATCH_THREAD = 'thread'
+MATCH_PROCESS = 'process'
+MATCH_MODE = os.getenv('MATCH_MODE', MATCH_INLINE)
+MATCH_WORKERS = int(os.getenv('MATCH_WORKERS', os.cpu_count() or 1))
 
-    def __init__(self):
-        self.games = {}
 
-    def _get_key(self, guild, channel):
-        return f'{guild}:{channel}'
+def match_executor(mode, workers=MATCH_WORKERS):
+    if mode == MATCH_THREAD:
+        return ThreadPoolExecutor(workers)
+    if mode == MATCH_PROCESS:
+        # forking a process with a running event loop and threads is not safe
+        return ProcessPoolExecutor(workers, multiprocessing.get_context('spawn'))
+    if mode != MATCH_INLINE:
+        raise ValueError(f'Unknown match mode {mode}')
+    return None
 
-    def start_game(self, ctx, guild, channel, num_questions):
-        key = self._get_key(guild, channel)
-        if key in self.games:
-            return self.games[key].start(ctx, num_questions)
 
-        self.games[key] = TriviaGame(ctx, num_questions)
-        return True
+class GameManager:
 
-    async def stop_game(self, guild, channel):
-        key = self._get_key(guild, channel)
-        if key in self.games:
-            return await self.games[key].stop()
+    def __init__(self, clock=time.monotonic, leaderboard=None, match_mode=MATCH_MODE):
+        self.games = {}
+        self.clock = clock
+        self.leaderboard = leaderboard
+        self.match_mode = match_mode
+        self.match_executor = match_executor(match_mode)
+        self.scheduler = Scheduler(clock)
+        self.verdicts = VerdictCache(clock=clock) if VERDICT_CACHE_SIZE else None
+
+    def start_game(self, ctx, channel_id, num_questions, question_filter=None):
+        if channel_id in self.games:
+            started = self.games[channel_id].start(ctx, num_questions, question_filter)
+        else:
+            self.games[channel_id] = TriviaGame(ctx, num_questions, self.clock, self.leaderboard, self.match_executor,
+                                                 self.verdicts, question_filter)
+            started = True
+
+        self.scheduler.schedule(self.games[channel_id])
+        return started
+
+    # a game saved by TriviaGame.snapshot() carries on where it was, timers included
+    def restore_game(self, ctx, channel_id, snapshot, offset=0):
+        question_filter = snapshot['filter']
+        if question_filter is not None:
+            question_filter = (tuple(question_filter[0]), question_filter[1])
+        game = TriviaGame(ctx, snapshot['num_questions'], self.clock, self.leaderboard, self.match_executor,
+                          self.verdicts, question_filter)
+        game.restore(snapshot, offset)
+        self.games[channel_id] = game
+        self.scheduler.schedule(game)
+        return game
+
+    async def stop_game(self, channel_id):
+        if channel_id in self.games:
+            stopped = await self.games[channel_id].stop()
+            self.scheduler.schedule(self.games[channel_id])
+            return stopped
         return False
 
-    async def ignore_question(self, guild, channel):
-        key = self._get_key(guild, channel)
-        if key in self.games:
-            return await self.games[key].ignore()
+    async def ignore_question(self, channel_id):
+        if channel_id in self.games:
+            question = await self.games[channel_id].ignore()
+            self.scheduler.schedule(self.games[channel_id])
+            return question
 
+    @metrics.timed('process_message')
     async def process_message(self, message):
-        guild = message.guild.name
-        channel = message.channel.name
-        key = self._get_key(guild, channel)
-        if key not in self.games:
+        metrics.inc('messages')
+        game = self.games.get(message.channel.id)
+        # most chat can be told apart from an answer without waiting on the game
+        if game is None or not game.might_be_answer(message.content):
             return
 
-        await self.games[key].process_answer(message)
+        metrics.inc('possible_answers')
 
+        await game.process_answer(message)
+        # a correct answer moves the game on right away
+        self.scheduler.schedule(game)
 
+
+# deals from the shared bank without copying or mutating it, every game walks its own
+# lazily built Fisher-Yates permutation and only remembers the positions it swapped.
+# with a filter the permutation is over the positions of the matching questions
 class QuestionsManager:
 
-    def __init__(self, questions):
-        self.questions = questions
-        self.asked = []
-        if not self.questions:
+    def __init__(self, database, question_filter=None):
+        self.database = database
+        self.question_filter = question_filter
+        self._load()
+        if not self.size:
             raise RuntimeError('No questions found')
 
-    def next(self):
-        if not self.questions:
-            self.questions = self.asked.copy()
-            self.asked = []
+    def _load(self):
+        self.questions = self.database.get_questions()
+        self.positions = None if self.question_filter is None else self.database.matching(self.question_filter)
+        self.size = len(self.questions if self.positions is None else self.positions)
+        self.version = self.database.version
+        self._reshuffle()
+
+    def _reshuffle(self):
+        self.position = 0
+        self.swapped = {}
+
+    def _draw(self):
+        if self.position >= self.size:
+            self._reshuffle()
+
+        i = self.position
+        j = randint(i, self.size - 1)
+        at_i = self.swapped.pop(i, i)
+        if j == i:
+            drawn = at_i
+        else:
+            drawn = self.swapped.get(j, j)
+            self.swapped[j] = at_i
+        self.position += 1
+        return drawn
 
-        index = randint(0, len(self.questions) - 1)
-        question = self.questions[index]
+    def next(self):
+        # a refreshed bank is picked up between questions
+        if self.version != self.database.version:
+            self._load()
 
-        self.questions.pop(index)
-        self.asked.append(question)
-        return question
+        for _ in range(self.size):
+            drawn = self._draw()
+            question = self.questions[drawn if self.positions is None else self.positions[drawn]]
+            if not question.is_ignored():
+                return question
+        raise RuntimeError('No questions found')
 
 class GameState:
     BEFORE_QUESTION = 1
@@ -73,28 +156,53 @@ DELAY_GAME_START_SECONDS = 4
 NO_HINT_DELAY = 6
 ONE_HINT_DELAY = 6
 TWO_HINT_DELAY = 6
+# guesses arriving this close together are checked in one batch
+BATCH_WINDOW_SECONDS = 0.05
+
+STATE_DELAYS = {
+    GameState.BEFORE_QUESTION: DELAY_GAME_START_SECONDS,
+    GameState.AWAIT_ANSWER: NO_HINT_DELAY,
+    GameState.AWAIT_ANSWER_HINT_ONE: ONE_HINT_DELAY,
+    GameState.AWAIT_ANSWER_HINT_TWO: TWO_HINT_DELAY,
+}
 
 class TriviaGame:
 
-    def __init__(self, ctx, num_questions):
+    def __init__(self, ctx, num_questions, clock=time.monotonic, leaderboard=None, match_executor=None, verdicts=None,
+                 question_filter=None):
         self.lock = Lock()
+        self.clock = clock
+        self.leaderboard = leaderboard
+        self.match_executor = match_executor
+        self.verdicts = verdicts
+        # id of the question this game holds in the verdict cache
+        self.held_question_id = None
+        self.batch_window = BATCH_WINDOW_SECONDS
+        self.pending = []
+        # sends are queued so neither the lock nor answer checks wait on discord
+        self.outbox = ChannelOutbox(self._deliver)
         self.games_played = 0
-        self.questions_manager = QuestionsManager(Question_Database.get_questions())
+        self.questions_manager = QuestionsManager(Question_Database, question_filter)
         self._reset(ctx, num_questions)
 
     def _reset(self, ctx, num_questions):
         self.ctx = ctx
         self.num_questions = num_questions
         self.question_counter = 0
-        self.last_state = datetime.now()
+        self.last_state = self.clock()
         self.state = GameState.BEFORE_QUESTION
         self.games_played += 1
         self.question = None
+        self.hints = None
+        self.asked_at = None
         self.question_answered = False
         self.score_board = {}
 
-    def start(self, ctx, num_questions):
+    def start(self, ctx, num_questions, question_filter=None):
         if self.state == GameState.OVER:
+            # the same filter carries on through its permutation
+            if question_filter != self.questions_manager.question_filter:
+                self.questions_manager = QuestionsManager(Question_Database, question_filter)
             self._reset(ctx, num_questions)
             return True
         return False
@@ -104,6 +212,7 @@ class TriviaGame:
             stopped = False
             if self.state != GameState.OVER:
                 self.state = GameState.OVER
+                self._hold(None)
                 stopped = True
             return stopped
 
@@ -117,6 +226,53 @@ class TriviaGame:
             return self.question
 
 
+    # what restore() needs to carry the game on in another process. times are saved on a clock
+    # that outlives the process, offset is what that clock is ahead of this game's clock, and
+    # they stay the same from one snapshot to the next while the game does not move
+    def snapshot(self, offset=0):
+        question = self.question
+        return {
+            'num_questions': self.num_questions,
+            'counter': self.question_counter,
+            'state': self.state,
+            'deadline': None if self.state == GameState.OVER else self.last_state + STATE_DELAYS[self.state] + offset,
+            'played': self.games_played,
+            'answered': self.question_answered,
+            'filter': self.questions_manager.question_filter,
+            'question': None if question is None else [question.get_question(), question.get_answer(), question.get_details(),
+                                                       question.get_category(), question.get_difficulty()],
+            'ignored': question is not None and question.is_ignored(),
+            'hints': None if self.hints is None else self.hints.order,
+            'asked': None if self.asked_at is None else self.asked_at + offset,
+            'scores': [[author_id, score['name'], score['score']] for author_id, score in self.score_board.items()],
+        }
+
+    def restore(self, snapshot, offset=0):
+        self.num_questions = snapshot['num_questions']
+        self.question_counter = snapshot['counter']
+        self.state = snapshot['state']
+        self.games_played = snapshot['played']
+        self.question_answered = snapshot['answered']
+        self.score_board = {author_id: {'name': name, 'score': score} for author_id, name, score in snapshot['scores']}
+        if snapshot['deadline'] is not None:
+            # as if the state had started long enough ago to end at the saved deadline
+            self.last_state = snapshot['deadline'] - offset - STATE_DELAYS[self.state]
+
+        if snapshot['question'] is not None:
+            self.question = Question(*snapshot['question'])
+            if snapshot['ignored']:
+                self.question.ignore_question()
+            self.question.get_matcher()
+            self._hold(self.question)
+            self.hints = Hints(self.question.get_answer())
+            if snapshot['hints'] is not None:
+                self.hints.order = snapshot['hints']
+            self.asked_at = None if snapshot['asked'] is None else snapshot['asked'] - offset
+            # whoever is in the channel may have missed it while the bot was away
+            if self.state in (GameState.AWAIT_ANSWER, GameState.AWAIT_ANSWER_HINT_ONE, GameState.AWAIT_ANSWER_HINT_TWO) \
+                    and not self.question_answered:
+                self._send(f"Question {self.question_counter + 1}:\n{self.question.get_question()}")
+
     def _update_scoreboard(self, author_id, author_name):
         points = 0
         if self.state == GameState.AWAIT_ANSWER:
@@ -131,23 +287,16 @@ class TriviaGame:
         else:
             self.score_board[author_id]['score'] += points
 
+        if self.leaderboard is not None and points:
+            self.leaderboard.add(self.ctx.channel.id, self._guild_id(), author_id, author_name, points)
+
+    def _guild_id(self):
+        guild = getattr(self.ctx, 'guild', None)
+        return None if guild is None else guild.id
+
     def _print_scoreboard(self):
-        sorted_scores = []
-        for score in self.score_board.values():
-            if not sorted_scores:
-                sorted_scores.append(score)
-            else:
-                inserted = False
-                for i in range(len(sorted_scores)):
-                    if sorted_scores[i]['score'] >= score['score']:
-                        continue
-                    else:
-                        sorted_scores.insert(i, score)
-                        inserted = True
-                        break
-
-                if not inserted:
-                    sorted_scores.append(score)
+        # ties keep the order players first scored in
+        sorted_scores = sorted(self.score_board.values(), key=lambda score: score['score'], reverse=True)
 
         scoreboard = ''
         for score in sorted_scores:
@@ -156,64 +305,168 @@ class TriviaGame:
 
 
 
+    def might_be_answer(self, content):
+        if self.state == GameState.BEFORE_QUESTION or self.state == GameState.OVER or self.question_answered:
+            return False
+        return self.question.get_matcher().could_match(content)
+
+    @metrics.timed('process_answer')
     async def process_answer(self, message):
         if self.state == GameState.BEFORE_QUESTION or self.state == GameState.OVER:
             return
+
+        # the first guess of a burst waits a moment for the rest, then all of them are checked together
+        self.pending.append(message)
+        if len(self.pending) > 1:
+            return
+        await asyncio.sleep(self.batch_window)
+        await self._check_pending()
+
+    @metrics.timed('check_pending')
+    async def _check_pending(self):
         async with self.lock:
-            if self.question_answered:
+            messages = self.pending
+            self.pending = []
+            if self.question_answered or not messages or self.question is None:
+                return
+            # the answer was revealed or the game stopped while the guesses waited
+            if self.state in (GameState.BEFORE_QUESTION, GameState.OVER):
                 return
-            author_id = message.author.id
-            author_name = message.author.name
-            content = message.content
 
-            if self.question.is_answer_correct(content):
+            # the earliest correct message wins, whatever order they were delivered in
+            messages.sort(key=lambda m: m.created_at)
+            index = await self._first_correct([m.content for m in messages])
+            if index is not None:
+                author_id = messages[index].author.id
+                author_name = messages[index].author.name
                 self.question_answered = True
+                Question_Database.question_answered(self.question, self.clock() - self.asked_at)
                 self._update_scoreboard(author_id, author_name)
-                await self.ctx.send(f'Correct answer {author_name}! Answer: {self.question.get_answer()}')
+                metrics.inc('correct_answers')
+                self._send(f'Correct answer {author_name}! Answer: {self.question.get_answer()}')
+
+    # guesses with a cached verdict are not matched again, the rest are matched and remembered
+    async def _first_correct(self, guesses):
+        if self.verdicts is None:
+            return await self._match(guesses)
+
+        question_id = self.question.get_id()
+        known, misses = self.verdicts.lookup(question_id, guesses)
+        if misses:
+            index = await self._match(misses)
+            # guesses after the first correct one were never matched
+            for i, guess in enumerate(misses if index is None else misses[:index + 1]):
+                known[guess.lower()] = i == index
+                self.verdicts.put(question_id, guess, i == index)
+
+        for index, guess in enumerate(guesses):
+            if known.get(guess.lower()):
+                return index
+        return None
+
+    # the lock is held while a pool matches, so later bursts still wait their turn
+    async def _match(self, guesses):
+        if self.match_executor is None:
+            return self.question.get_matcher().first_correct(guesses)
+
+        loop = asyncio.get_event_loop()
+        if isinstance(self.match_executor, ProcessPoolExecutor):
+            try:
+                return await loop.run_in_executor(self.match_executor, pooled_first_correct,
+                                                  self.question.get_question(), self.question.get_answer(), guesses)
+            except BrokenProcessPool as e:
+                print(f'Matching inline, process pool failed: {e!r}')
+                self.match_executor = None
+                return self.question.get_matcher().first_correct(guesses)
+        return await loop.run_in_executor(self.match_executor, self.question.get_matcher().first_correct, guesses)
+
+    def _needs_advance(self):
+        if self.question_answered or (self.question and self.question.is_ignored()):
+            return True
+        return self.question_counter >= self.num_questions and self.state == GameState.BEFORE_QUESTION
+
+    def _state_expired(self):
+        return self.clock() - self.last_state >= STATE_DELAYS[self.state]
+
+    def next_deadline(self):
+        if self.state == GameState.OVER:
+            return None
+        if self._needs_advance():
+            return self.clock()
+        return self.last_state + STATE_DELAYS[self.state]
+
+    # a question leaves rotation in the verdict cache once no game holds it
+    def _hold(self, question):
+        if self.verdicts is None:
+            return
+        if self.held_question_id is not None:
+            self.verdicts.release(self.held_question_id)
+        self.held_question_id = None if question is None else question.get_id()
+        if self.held_question_id is not None:
+            self.verdicts.acquire(self.held_question_id)
+
+    def _send(self, message):
+        self.outbox.put(message)
+
+    @metrics.timed('send')
+    async def _deliver(self, text):
+        await self.ctx.send(text)
 
+    @metrics.timed('advance_game')
     async def advance_game(self):
         if self.state == GameState.OVER:
             return
 
         if self.question_counter >= self.num_questions and self.state == GameState.BEFORE_QUESTION:
             self.state = GameState.OVER
-            await self.ctx.send(f'Game over\n\nGame {self.games_played} ScoreBoard:\n\n{self._print_scoreboard()}\n')
+            if self.leaderboard is not None:
+                self.leaderboard.record_game(self.ctx.channel.id, self._guild_id(), self.score_board)
+            self._hold(None)
+            self._send(f'Game over\n\nGame {self.games_played} ScoreBoard:\n\n{self._print_scoreboard()}\n')
             return
 
         if self.question_answered or (self.question and self.question.is_ignored()):
             self.state = GameState.BEFORE_QUESTION
-            self.last_state = datetime.now()
+            self.last_state = self.clock()
             self.question_counter += 1
             self.question_answered = False
             self.question = None
 
 
         if self.state == GameState.BEFORE_QUESTION:
-            if (datetime.now() - self.last_state).total_seconds() > DELAY_GAME_START_SECONDS:
+            if self._state_expired():
                 async with self.lock:
                     self.question = self.questions_manager.next()
-                    await self.ctx.send(f"Question {self.question_counter + 1}:\n{self.question.get_question()}")
+                    self._hold(self.question)
+                    self.pending = []
+                    # build the answer matcher now instead of on the first guess
+                    self.question.get_matcher()
+                    # the letters every hint reveals are fixed now, the second extends the first
+                    self.hints = Hints(self.question.get_answer())
+                    self.asked_at = self.clock()
+                    Question_Database.question_asked(self.question)
+                    self._send(f"Question {self.question_counter + 1}:\n{self.question.get_question()}")
                     self.state = GameState.AWAIT_ANSWER
-                    self.last_state = datetime.now()
+                    self.last_state = self.clock()
         elif self.state == GameState.AWAIT_ANSWER:
-            if (datetime.now() - self.last_state).total_seconds() > NO_HINT_DELAY:
+            if self._state_expired():
                 async with self.lock:
                     if not self.question_answered:
-                        await self.ctx.send(f"Hint 1:\n{self.question.get_first_hint()}")
+                        self._send(f"Hint 1:\n{self.hints.hint(0)}")
                         self.state = GameState.AWAIT_ANSWER_HINT_ONE
-                        self.last_state = datetime.now()
+                        self.last_state = self.clock()
         elif self.state == GameState.AWAIT_ANSWER_HINT_ONE:
-            if (datetime.now() - self.last_state).total_seconds() > ONE_HINT_DELAY:
+            if self._state_expired():
                 async with self.lock:
                     if not self.question_answered:
-                        await self.ctx.send(f"Hint 2:\n{self.question.get_second_hint()}")
+                        self._send(f"Hint 2:\n{self.hints.hint(1)}")
                         self.state = GameState.AWAIT_ANSWER_HINT_TWO
-                        self.last_state = datetime.now()
+                        self.last_state = self.clock()
         elif self.state == GameState.AWAIT_ANSWER_HINT_TWO:
-            if (datetime.now() - self.last_state).total_seconds() > TWO_HINT_DELAY:
+            if self._state_expired():
                 async with self.lock:
                     if not self.question_answered:
                         self.state = GameState.BEFORE_QUESTION
-                        self.last_state = datetime.now()
-                        await self.ctx.send(f"Answer:\n{self.question.get_answer()} {'' if self.question.get_details() is None else self.question.get_details()}")
+                        self.last_state = self.clock()
+                        self._send(f"Answer:\n{self.question.get_answer()} {'' if self.question.get_details() is None else self.question.get_details()}")
                         self.question_counter += 1
@@ -0,0 +1,310 @@
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from catalog import parse_filter
+from game import MATCH_PROCESS, MATCH_THREAD, GameManager, GameState, QuestionsManager, DELAY_GAME_START_SECONDS, NO_HINT_DELAY, ONE_HINT_DELAY, TWO_HINT_DELAY
+from loadtest import VirtualClock
+from question import DIFFICULTIES, Question, QuestionDatabase, Question_Database
+
+CHANNEL = 1234
+
+
+class StubContext:
+
+    def __init__(self, delay=0):
+        self.sent = []
+        self.delay = delay
+
+    async def send(self, message):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(message)
+
+
+class StubAuthor:
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+class StubChannel:
+
+    def __init__(self, id):
+        self.id = id
+
+
+class StubMessage:
+    timestamps = itertools.count()
+
+    def __init__(self, channel_id, author, content, created_at=None):
+        self.channel = StubChannel(channel_id)
+        self.author = author
+        self.content = content
+        self.created_at = next(self.timestamps) if created_at is None else created_at
+
+
+class TestScheduler(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        Question_Database.questions = [Question("What is the capital of France?", "Paris") for _ in range(4)]
+        self.clock = VirtualClock()
+        self.manager = GameManager(self.clock)
+
+    async def advance(self, seconds):
+        self.clock.now += seconds
+        await asyncio.gather(*self.manager.scheduler.run_due())
+        await self.flush()
+
+    async def flush(self):
+        await asyncio.gather(*[game.outbox.flush() for game in self.manager.games.values()])
+
+    async def test_question_waits_for_start_delay(self):
+        ctx = StubContext()
+        self.manager.start_game(ctx, CHANNEL, 1)
+
+        await self.advance(DELAY_GAME_START_SECONDS - 1)
+        self.assertEqual(ctx.sent, [])
+
+        await self.advance(1)
+        self.assertEqual(ctx.sent, ['Question 1:\nWhat is the capital of France?'])
+
+    async def test_hints_then_answer(self):
+        ctx = StubContext()
+        self.manager.start_game(ctx, CHANNEL, 1)
+
+        await self.advance(DELAY_GAME_START_SECONDS)
+        await self.advance(NO_HINT_DELAY)
+        self.assertTrue(ctx.sent[-1].startswith('Hint 1:'))
+        await self.advance(ONE_HINT_DELAY)
+        self.assertTrue(ctx.sent[-1].startswith('Hint 2:'))
+        await self.advance(TWO_HINT_DELAY)
+        self.assertTrue(ctx.sent[-1].startswith('Answer:\nParis'))
+
+        await self.advance(0)
+        self.assertTrue(ctx.sent[-1].startswith('Game over'))
+        self.assertEqual(len(self.manager.scheduler), 0)
+
+    async def test_correct_answer_advances_immediately(self):
+        ctx = StubContext()
+        self.manager.start_game(ctx, CHANNEL, 1)
+        await self.advance(DELAY_GAME_START_SECONDS)
+
+        await self.manager.process_message(StubMessage(CHANNEL, StubAuthor(1, 'alice'), 'paris'))
+        await self.flush()
+        self.assertEqual(ctx.sent[-1], 'Correct answer alice! Answer: Paris')
+
+        await self.advance(0)
+        await self.advance(0)
+        self.assertTrue(ctx.sent[-1].startswith('Game over'))
+        self.assertIn('alice - 10 pts', ctx.sent[-1])
+        self.assertEqual(self.manager.games[CHANNEL].state, GameState.OVER)
+
+    async def test_earliest_correct_guess_in_a_burst_wins(self):
+        ctx = StubContext()
+        self.manager.start_game(ctx, CHANNEL, 1)
+        await self.advance(DELAY_GAME_START_SECONDS)
+
+        late = StubMessage(CHANNEL, StubAuthor(1, 'alice'), 'paris', created_at=10)
+        wrong = StubMessage(CHANNEL, StubAuthor(3, 'carol'), 'london', created_at=1)
+        early = StubMessage(CHANNEL, StubAuthor(2, 'bob'), 'Paris!', created_at=2)
+        await asyncio.gather(*[self.manager.process_message(m) for m in (late, wrong, early)])
+        await self.flush()
+
+        self.assertEqual([m for m in ctx.sent if m.startswith('Correct')], ['Correct answer bob! Answer: Paris'])
+
+    async def test_pooled_matching_keeps_first_correct_wins(self):
+        for mode in (MATCH_THREAD, MATCH_PROCESS):
+            self.manager = GameManager(self.clock, match_mode=mode)
+            ctx = StubContext()
+            self.manager.start_game(ctx, CHANNEL, 1)
+            await self.advance(DELAY_GAME_START_SECONDS)
+
+            late = StubMessage(CHANNEL, StubAuthor(1, 'alice'), 'paris', created_at=10)
+            early = StubMessage(CHANNEL, StubAuthor(2, 'bob'), 'Paris!', created_at=2)
+            await asyncio.gather(*[self.manager.process_message(m) for m in (late, early)])
+            await self.flush()
+            self.manager.match_executor.shutdown()
+
+            self.assertEqual([m for m in ctx.sent if m.startswith('Correct')], ['Correct answer bob! Answer: Paris'])
+
+    async def test_channels_share_verdicts_until_the_question_leaves(self):
+        contexts = [StubContext(), StubContext()]
+        for channel_id, ctx in enumerate(contexts):
+            self.manager.start_game(ctx, channel_id, 1)
+        await self.advance(DELAY_GAME_START_SECONDS)
+
+        for channel_id in (0, 1):
+            await self.manager.process_message(StubMessage(channel_id, StubAuthor(1, 'alice'), 'Spain'))
+            await self.manager.process_message(StubMessage(channel_id, StubAuthor(2, 'bob'), 'paris'))
+        await self.flush()
+        verdicts = self.manager.verdicts
+        self.assertEqual((verdicts.hits, verdicts.misses), (2, 2))
+        self.assertEqual([ctx.sent[-1] for ctx in contexts], ['Correct answer bob! Answer: Paris'] * 2)
+
+        await self.advance(0)
+        await self.advance(0)
+        self.assertEqual(len(verdicts), 0)
+
+    async def test_guess_pending_when_the_answer_is_revealed_does_not_count(self):
+        ctx = StubContext()
+        self.manager.start_game(ctx, CHANNEL, 3)
+        await self.advance(DELAY_GAME_START_SECONDS)
+        await self.advance(NO_HINT_DELAY)
+        await self.advance(ONE_HINT_DELAY)
+
+        guess = asyncio.ensure_future(self.manager.process_message(StubMessage(CHANNEL, StubAuthor(1, 'alice'), 'paris')))
+        await asyncio.sleep(0)
+        # the timer runs out inside the batch window
+        self.clock.now += TWO_HINT_DELAY
+        await asyncio.gather(*self.manager.scheduler.run_due())
+        await guess
+        await self.flush()
+        game = self.manager.games[CHANNEL]
+
+        self.assertTrue(ctx.sent[-1].startswith('Answer:\nParis'))
+        self.assertFalse(any(m.startswith('Correct') for m in ctx.sent))
+        self.assertEqual((game.question_counter, game.question_answered, game.score_board), (1, False, {}))
+
+    async def test_guess_pending_when_the_game_stops_does_not_count(self):
+        ctx = StubContext()
+        self.manager.start_game(ctx, CHANNEL, 1)
+        await self.advance(DELAY_GAME_START_SECONDS)
+
+        guess = asyncio.ensure_future(self.manager.process_message(StubMessage(CHANNEL, StubAuthor(1, 'alice'), 'paris')))
+        await asyncio.sleep(0)
+        await self.manager.stop_game(CHANNEL)
+        await guess
+        await self.flush()
+        self.assertEqual([m for m in ctx.sent if m.startswith('Correct')], [])
+
+    async def test_idle_games_are_not_woken(self):
+        ctx = StubContext()
+        self.manager.start_game(ctx, CHANNEL, 1)
+        await self.manager.stop_game(CHANNEL)
+
+        self.assertEqual(len(self.manager.scheduler), 0)
+        await self.advance(DELAY_GAME_START_SECONDS)
+        self.assertEqual(ctx.sent, [])
+
+    async def test_slow_channel_does_not_block_others(self):
+        slow = StubContext(delay=0.2)
+        fast = StubContext()
+        self.manager.start_game(slow, 1, 1)
+        self.manager.start_game(fast, 2, 1)
+
+        self.clock.now += DELAY_GAME_START_SECONDS
+        # the transitions finish without waiting on either channel
+        await asyncio.gather(*self.manager.scheduler.run_due())
+        self.assertEqual(self.manager.games[1].state, GameState.AWAIT_ANSWER)
+
+        await self.manager.games[2].outbox.flush()
+        self.assertEqual(len(fast.sent), 1)
+        self.assertEqual(len(slow.sent), 0)
+        await self.manager.games[1].outbox.flush()
+        self.assertEqual(len(slow.sent), 1)
+
+    async def test_answer_and_game_over_go_out_together(self):
+        ctx = StubContext()
+        self.manager.start_game(ctx, CHANNEL, 1)
+        await self.advance(DELAY_GAME_START_SECONDS)
+
+        await self.manager.process_message(StubMessage(CHANNEL, StubAuthor(1, 'alice'), 'paris'))
+        await asyncio.gather(*self.manager.scheduler.run_due())
+        await asyncio.gather(*self.manager.scheduler.run_due())
+        await self.flush()
+        self.assertEqual(len(ctx.sent), 2)
+        self.assertTrue(ctx.sent[-1].startswith('Correct answer alice! Answer: Paris\n\nGame over'))
+
+
+# laid out like trivia.py: spawned pool workers import the script as __mp_main__, so whatever
+# opens files or starts the bot has to stay behind the guard
+SCRIPT = """
+import sys
+from game import MATCH_PROCESS, match_executor
+from question import pooled_first_correct
+
+def main():
+    with open(sys.argv[1], 'a') as f:
+        f.write('main\\n')
+    executor = match_executor(MATCH_PROCESS, 2)
+    print(executor.submit(pooled_first_correct, 'What is the capital of France?', 'Paris', ['london', 'paris']).result(30))
+    executor.shutdown()
+
+if __name__ == '__main__':
+    main()
+"""
+
+
+class TestProcessPool(unittest.TestCase):
+
+    def test_pool_started_from_a_guarded_script(self):
+        with tempfile.TemporaryDirectory() as directory:
+            script = os.path.join(directory, 'bot.py')
+            with open(script, 'w') as f:
+                f.write(SCRIPT)
+            started = os.path.join(directory, 'started')
+            env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+            result = subprocess.run([sys.executable, script, started], env=env, capture_output=True, text=True, timeout=60)
+
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertEqual(result.stdout.strip(), '1')
+            # the workers did not run the entry point again
+            with open(started) as f:
+                self.assertEqual(f.read(), 'main\n')
+
+
+class TestLoad(unittest.IsolatedAsyncioTestCase):
+
+    async def test_engine_keeps_up_with_synthetic_chat(self):
+        from loadtest import run_load
+
+        report = await run_load(guilds=2, channels=2, users=10, rate=1, correct=0.2, duration=20, speed=100)
+        self.assertGreater(report['messages'], 0)
+        self.assertGreater(report['answers'], 0)
+
+
+class TestQuestionsManager(unittest.TestCase):
+
+    def test_refreshed_bank_is_picked_up(self):
+        database = QuestionDatabase()
+        database._set_questions([Question("old?", "old")])
+        manager = QuestionsManager(database)
+        self.assertEqual(manager.next().get_answer(), 'old')
+
+        database._set_questions([Question("new?", "new")])
+        self.assertEqual(manager.next().get_answer(), 'new')
+
+    def test_deals_every_question_once_per_cycle(self):
+        database = QuestionDatabase()
+        bank = [Question(f"{i}?", str(i)) for i in range(50)]
+        bank[7].ignore_question()
+        database._set_questions(bank)
+        first = QuestionsManager(database)
+        second = QuestionsManager(database)
+
+        dealt = [first.next().get_answer() for _ in range(49)]
+        self.assertEqual(sorted(dealt, key=int), [str(i) for i in range(50) if i != 7])
+        self.assertEqual(len(bank), 50)
+        # the other game still has the whole bank to draw from
+        self.assertEqual(len({second.next().get_answer() for _ in range(49)}), 49)
+
+    def test_deals_only_filtered_questions(self):
+        database = QuestionDatabase()
+        database._set_questions([Question(f"{i}?", str(i), None, 'Science' if i % 2 else 'History', DIFFICULTIES[i % 3])
+                                 for i in range(60)])
+        manager = QuestionsManager(database, parse_filter(['science', 'hard']))
+        dealt = {manager.next().get_answer() for _ in range(10)}
+        self.assertEqual(dealt, {str(i) for i in range(60) if i % 2 and i % 3 == 2})
+
+        with self.assertRaises(RuntimeError):
+            QuestionsManager(database, parse_filter(['geography']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,165 @@
+import itertools
+import json
+import os
+import queue
+import threading
+import time
+
+# record kinds
+IGNORE = 'ignore'
+ASKED = 'asked'
+ANSWERED = 'answered'
+SCORES = 'scores'
+
+# how often, and after how many records, the journal is folded into its store
+COMPACT_SECONDS = 30
+COMPACT_RECORDS = 10_000
+
+PROGRESS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS journal_progress (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    seq INTEGER NOT NULL
+)
+'''
+
+_STOP = object()
+_COMPACT = object()
+
+
+# the last record a store has applied, kept in the same transaction as the records
+def applied_seq(connection):
+    row = connection.execute('SELECT seq FROM journal_progress WHERE id = 0').fetchone()
+    return 0 if row is None else row[0]
+
+
+def save_applied_seq(connection, seq):
+    connection.execute('INSERT OR REPLACE INTO journal_progress VALUES (0, ?)', (seq,))
+
+
+# append-only write-behind log in front of a store. the event loop only queues records, a
+# thread appends them as json lines with one fsync for everything queued meanwhile, and now
+# and then folds them into the store and empties the file. records are numbered and the store
+# keeps the last number it applied, so a crash at any point replays each record exactly once.
+# the store has journal_seq() and apply_journal(records, seq), called on the journal thread
+class Journal:
+
+    def __init__(self, path, store, compact_seconds=COMPACT_SECONDS, compact_records=COMPACT_RECORDS):
+        self.path = path
+        self.store = store
+        self.compact_seconds = compact_seconds
+        self.compact_records = compact_records
+        self.appended = 0
+        self.written = 0
+        # the last record folded into the store
+        self.applied = 0
+        self.fsyncs = 0
+        self._queue = queue.Queue()
+        self._unapplied = []
+        self._written = threading.Condition()
+
+        last = self.replay()
+        self.appended = self.written = self.applied = last
+        self._seq = itertools.count(last + 1)
+        self._file = open(path, 'a')
+        self._thread = threading.Thread(target=self._run, name='journal', daemon=True)
+        self._thread.start()
+
+    # records left by a run that did not get to fold them in
+    def replay(self):
+        applied = self.store.journal_seq()
+        records = []
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # the last line of a crash can be cut short, it was never acknowledged as durable
+                        break
+        except FileNotFoundError:
+            pass
+
+        last = max([applied] + [record[0] for record in records])
+        records = [record for record in records if record[0] > applied]
+        if records:
+            print(f'Replaying {len(records)} journal records into the store')
+            self.store.apply_journal([record[1:] for record in records], records[-1][0])
+        with open(self.path, 'w'):
+            pass
+        return last
+
+    # never blocks on disk. records are numbered in the order they are queued, so they come
+    # from one thread, the event loop's
+    def append(self, *record):
+        seq = self.appended = next(self._seq)
+        self._queue.put((seq, record))
+        return seq
+
+    # until everything appended so far is on disk
+    def wait(self, timeout=None):
+        seq = self.appended
+        with self._written:
+            return self._written.wait_for(lambda: self.written >= seq, timeout)
+
+    def compact(self):
+        self._queue.put((None, _COMPACT))
+
+    # until everything appended so far is folded into the store, for readers of the store
+    def sync(self, timeout=None):
+        seq = self.appended
+        self.compact()
+        with self._written:
+            return self._written.wait_for(lambda: self.applied >= seq, timeout)
+
+    def close(self):
+        self._queue.put((None, _STOP))
+        self._thread.join()
+
+    def _run(self):
+        last_compaction = time.monotonic()
+        running = True
+        while running:
+            try:
+                batch = [self._queue.get(timeout=self.compact_seconds)]
+            except queue.Empty:
+                batch = []
+            # whatever else is queued shares the write and the fsync
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            records = [(seq, record) for seq, record in batch if seq is not None]
+            compact = any(record is _COMPACT for _, record in batch)
+            running = not any(record is _STOP for _, record in batch)
+            try:
+                if records:
+                    self._append(records)
+                if (not running or compact or len(self._unapplied) >= self.compact_records
+                        or time.monotonic() - last_compaction >= self.compact_seconds):
+                    self._compact()
+                    last_compaction = time.monotonic()
+            except Exception as e:
+                print(f'Failed to write journal: {e!r}')
+        self._file.close()
+
+    def _append(self, records):
+        self._file.write(''.join(json.dumps([seq, *record], separators=(',', ':')) + '\n' for seq, record in records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.fsyncs += 1
+        self._unapplied.extend(records)
+        with self._written:
+            self.written = records[-1][0]
+            self._written.notify_all()
+
+    def _compact(self):
+        if not self._unapplied:
+            return
+        self.store.apply_journal([list(record) for _, record in self._unapplied], self._unapplied[-1][0])
+        with self._written:
+            self.applied = self._unapplied[-1][0]
+            self._written.notify_all()
+        self._unapplied = []
+        self._file.truncate(0)
@@ -0,0 +1,178 @@
+import os
+import asyncio
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from journal import ANSWERED, ASKED, IGNORE, Journal
+from leaderboard import JournaledLeaderboard, channel_scope
+from question import Question, QuestionDatabase
+from store import QuestionStore
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.questions = [Question(f'Question {i}?', f'Answer {i}') for i in range(3)]
+        self.store = self.open_store('questions.db')
+        self.path = self.file('questions.journal')
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def file(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def open_store(self, name):
+        store = QuestionStore(self.file(name), None)
+        store.replace_all(self.questions)
+        return store
+
+    def append_records(self, journal):
+        first, second = (q.get_id() for q in self.questions[:2])
+        journal.append(IGNORE, second)
+        journal.append(ASKED, first)
+        journal.append(ASKED, first)
+        journal.append(ANSWERED, first, 2.5)
+
+    def ignored(self, store):
+        return [q.get_answer() for q in store.load() if q.is_ignored()]
+
+    def test_records_are_folded_into_the_store(self):
+        journal = Journal(self.path, self.store, compact_seconds=3600)
+        self.append_records(journal)
+        self.assertTrue(journal.wait(5))
+        self.assertEqual(self.ignored(self.store), [])
+
+        journal.close()
+        self.assertEqual(self.ignored(self.store), ['Answer 1'])
+        self.assertEqual(self.store.stats(self.questions[0].get_id()), (2, 1, 2.5))
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+    def test_replays_each_record_once_after_a_crash(self):
+        journal = Journal(self.path, self.store, compact_seconds=3600)
+        self.append_records(journal)
+        journal.wait(5)
+        # the file as a crash would leave it, with the last line cut short
+        crashed = self.file('crashed.journal')
+        shutil.copy(self.path, crashed)
+        with open(crashed, 'a') as f:
+            f.write('[5,"ign')
+        journal.close()
+
+        # already folded in, nothing is counted twice
+        Journal(shutil.copy(crashed, self.file('again.journal')), self.store).close()
+        self.assertEqual(self.store.stats(self.questions[0].get_id()), (2, 1, 2.5))
+
+        other = self.open_store('other.db')
+        journal = Journal(crashed, other)
+        self.assertEqual(self.ignored(other), ['Answer 1'])
+        self.assertEqual(other.stats(self.questions[0].get_id()), (2, 1, 2.5))
+        # numbering carries on after the replayed records
+        self.assertEqual(journal.append(IGNORE, self.questions[2].get_id()), 5)
+        journal.close()
+        other.close()
+
+    def test_leaderboard_scores_survive_without_a_flush(self):
+        board = JournaledLeaderboard(self.file('leaderboard.db'), self.file('leaderboard.journal'), compact_seconds=3600)
+        board.add(1, None, 100, 'alice', 10)
+        board.record_game(1, None, {100: {'name': 'alice', 'score': 10}})
+        board.journal.wait(5)
+        self.assertEqual(board.top(channel_scope(1)), [('alice', 10)])
+        crashed = shutil.copy(self.file('leaderboard.journal'), self.file('crashed.journal'))
+        board.close()
+
+        board = JournaledLeaderboard(self.file('leaderboard.db'), crashed)
+        board.add(1, None, 100, 'alice', 5)
+        self.assertEqual(board.top(channel_scope(1)), [('alice', 15)])
+        board.close()
+        board = JournaledLeaderboard(self.file('leaderboard.db'), self.file('leaderboard.journal'))
+        self.assertEqual(board.top(channel_scope(1)), [('alice', 15)])
+        self.assertEqual(board._connection.execute('SELECT COUNT(*) FROM games').fetchone()[0], 1)
+        board.close()
+
+    def test_leaderboard_forgets_batches_once_folded_in(self):
+        board = JournaledLeaderboard(self.file('leaderboard.db'), self.file('leaderboard.journal'), compact_seconds=3600)
+        for points in range(1, 4):
+            board.add(1, None, 100, 'alice', points)
+        board.journal.compact()
+        board.journal.wait(5)
+        for _ in range(500):
+            if board.journal.applied == 3:
+                break
+            time.sleep(0.01)
+
+        board.add(1, None, 100, 'alice', 4)
+        self.assertEqual([seq for seq, _ in board._sent], [4])
+        self.assertEqual(board.top(channel_scope(1)), [('alice', 10)])
+        board.close()
+
+
+
+class TestRefreshKeepsIgnores(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.questions = [Question(f'Question {i}?', f'Answer {i}') for i in range(3)]
+
+    def tearDown(self):
+        self.database.journal.close()
+        self.database.store.close()
+        self.directory.cleanup()
+
+    def open_database(self, incremental):
+        path = self.directory.name
+        database = QuestionDatabase(store_path=os.path.join(path, 'questions.db'), incremental=incremental,
+                                    checkpoint_path=os.path.join(path, 'checkpoint.jsonl'))
+        database._get_store().replace_all(self.questions)
+        database.journal = Journal(os.path.join(path, 'questions.journal'), database.store, compact_seconds=3600)
+        database._set_questions(database._read())
+        database._scrape = lambda: []
+        self.database = database
+        return database
+
+    def ignored(self, questions):
+        return [q.get_answer() for q in questions if q.is_ignored()]
+
+    def loaded(self, answer):
+        return next(q for q in self.database.questions if q.get_answer() == answer)
+
+    async def ignore_then_refresh(self, incremental):
+        database = self.open_database(incremental)
+        await database.ignore_question(self.loaded('Answer 1'))
+        self.assertEqual(self.ignored(await database.refresh()), ['Answer 1'])
+
+    async def test_ignore_then_incremental_refresh(self):
+        await self.ignore_then_refresh(True)
+
+    async def test_ignore_then_full_refresh(self):
+        await self.ignore_then_refresh(False)
+
+    async def test_ignore_while_refreshing(self):
+        database = self.open_database(True)
+        merging = threading.Event()
+        ignored = threading.Event()
+        read = database._read
+
+        def slow_read():
+            questions = read()
+            merging.set()
+            ignored.wait(5)
+            return questions
+
+        # the ignore comes in after the merge read the store, the new bank still has to carry it
+        database._read = slow_read
+        refresh = asyncio.ensure_future(database.refresh())
+        await asyncio.get_event_loop().run_in_executor(None, merging.wait, 5)
+        await database.ignore_question(self.loaded('Answer 2'))
+        ignored.set()
+        self.assertEqual(self.ignored(await refresh), ['Answer 2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
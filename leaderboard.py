@@ -0,0 +1,330 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, insort
+
+from journal import PROGRESS_SCHEMA, SCORES, Journal, applied_seq, save_applied_seq
+
+LEADERBOARD_PATH = 'leaderboard.db'
+JOURNAL_PATH = 'leaderboard.journal'
+ALL_TIME = 'all'
+# buckets are split in two once they grow past twice this
+BUCKET_SIZE = 512
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS scores (
+    scope TEXT NOT NULL,
+    period TEXT NOT NULL,
+    player_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    PRIMARY KEY (scope, period, player_id)
+);
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel_id INTEGER NOT NULL,
+    guild_id INTEGER,
+    played_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS game_scores (
+    game_id INTEGER NOT NULL REFERENCES games (id),
+    player_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    score INTEGER NOT NULL,
+    PRIMARY KEY (game_id, player_id)
+);
+'''
+
+UPSERT = '''
+INSERT INTO scores VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (scope, period, player_id) DO UPDATE SET score = score + excluded.score, name = excluded.name
+'''
+
+
+def channel_scope(channel_id):
+    return f'channel:{channel_id}'
+
+
+def guild_scope(guild_id):
+    return f'guild:{guild_id}'
+
+
+def week_period(now):
+    return time.strftime('week:%G-%V', time.gmtime(now))
+
+
+# players ordered by score in a list of small sorted buckets, a fenwick tree over the bucket
+# sizes gives a player's rank without walking the buckets before it
+class RankIndex:
+
+    def __init__(self):
+        self.scores = {}
+        # keys are (-score, player_id) so the best player comes first
+        self._buckets = []
+        self._maxes = []
+        self._tree = None
+
+    def __len__(self):
+        return len(self.scores)
+
+    def update(self, player_id, score):
+        old = self.scores.get(player_id)
+        if old == score:
+            return
+        if old is not None:
+            self._remove((-old, player_id))
+        self.scores[player_id] = score
+        self._insert((-score, player_id))
+
+    def add(self, player_id, points):
+        self.update(player_id, self.scores.get(player_id, 0) + points)
+
+    # 1 for the best player, players with the same score share a rank
+    def rank(self, player_id):
+        score = self.scores.get(player_id)
+        if score is None:
+            return None
+        return self._position((-score,)) + 1
+
+    def top(self, n):
+        players = []
+        for bucket in self._buckets:
+            for score, player_id in bucket:
+                if len(players) >= n:
+                    return players
+                players.append((player_id, -score))
+        return players
+
+    def _position(self, key):
+        i = bisect_left(self._maxes, key)
+        if i == len(self._buckets):
+            return len(self.scores)
+        return self._prefix(i) + bisect_left(self._buckets[i], key)
+
+    def _insert(self, key):
+        if not self._buckets:
+            self._buckets.append([key])
+            self._maxes.append(key)
+            self._tree = None
+            return
+
+        i = min(bisect_left(self._maxes, key), len(self._buckets) - 1)
+        bucket = self._buckets[i]
+        insort(bucket, key)
+        self._maxes[i] = bucket[-1]
+        if len(bucket) > 2 * BUCKET_SIZE:
+            self._buckets[i:i + 1] = [bucket[:BUCKET_SIZE], bucket[BUCKET_SIZE:]]
+            self._maxes[i:i + 1] = [bucket[BUCKET_SIZE - 1], bucket[-1]]
+            self._tree = None
+        else:
+            self._tree_add(i, 1)
+
+    def _remove(self, key):
+        i = bisect_left(self._maxes, key)
+        bucket = self._buckets[i]
+        del bucket[bisect_left(bucket, key)]
+        if bucket:
+            self._maxes[i] = bucket[-1]
+            self._tree_add(i, -1)
+        else:
+            del self._buckets[i]
+            del self._maxes[i]
+            self._tree = None
+
+    # the tree is rebuilt lazily after buckets are split or dropped
+    def _build_tree(self):
+        tree = [0] + [len(bucket) for bucket in self._buckets]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+
+    def _tree_add(self, i, delta):
+        if self._tree is None:
+            return
+        i += 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    # players in the buckets before bucket i
+    def _prefix(self, i):
+        if self._tree is None:
+            self._build_tree()
+        total = 0
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+
+# scores per channel and per guild, all time and per week, kept in memory for ranking and
+# written to sqlite in batches by flush()
+class Leaderboard:
+
+    def __init__(self, path=LEADERBOARD_PATH, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(SCHEMA)
+        self._indexes = {}
+        self.names = {}
+        self._pending_scores = []
+        # taken by a flush and not committed yet
+        self._in_flight = []
+        self._pending_games = []
+
+    # whatever flush_every() has not written yet is written before closing, the event loop
+    # may be gone by then
+    def close(self):
+        scores, self._pending_scores = self._pending_scores, []
+        games, self._pending_games = self._pending_games, []
+        if scores or games:
+            self._write(scores, games)
+        with self._lock:
+            self._connection.close()
+
+    def _scopes(self, channel_id, guild_id):
+        scopes = [channel_scope(channel_id)]
+        if guild_id is not None:
+            scopes.append(guild_scope(guild_id))
+        return scopes
+
+    def _periods(self):
+        return [ALL_TIME, week_period(self.clock())]
+
+    # a board is read from the database the first time it is ranked or updated
+    def _index(self, scope, period):
+        index = self._indexes.get((scope, period))
+        if index is None:
+            index = RankIndex()
+            with self._lock:
+                rows, unwritten = self._read_board(scope, period)
+            for player_id, name, score in rows:
+                self.names.setdefault(player_id, name)
+                index.update(player_id, score)
+            # updates not committed yet are not in the rows
+            for pending_scope, pending_period, player_id, _, points in unwritten:
+                if pending_scope == scope and pending_period == period:
+                    index.add(player_id, points)
+            self._indexes[(scope, period)] = index
+        return index
+
+    # committed rows of a board and the updates that are not committed yet, called with the lock held
+    def _read_board(self, scope, period):
+        rows = self._connection.execute('SELECT player_id, name, score FROM scores WHERE scope = ? AND period = ?',
+                                        (scope, period)).fetchall()
+        return rows, self._in_flight + self._pending_scores
+
+    def add(self, channel_id, guild_id, player_id, name, points):
+        self.names[player_id] = name
+        for scope in self._scopes(channel_id, guild_id):
+            for period in self._periods():
+                self._pending_scores.append((scope, period, player_id, name, points))
+                index = self._indexes.get((scope, period))
+                if index is not None:
+                    index.add(player_id, points)
+
+    def record_game(self, channel_id, guild_id, score_board):
+        scores = [(player_id, score['name'], score['score']) for player_id, score in score_board.items()]
+        self._pending_games.append((channel_id, guild_id, self.clock(), scores))
+
+    def top(self, scope, n=10, period=ALL_TIME):
+        return [(self.names.get(player_id, str(player_id)), score) for player_id, score in self._index(scope, period).top(n)]
+
+    def rank(self, scope, player_id, period=ALL_TIME):
+        index = self._index(scope, period)
+        rank = index.rank(player_id)
+        if rank is None:
+            return None
+        return rank, index.scores[player_id], len(index)
+
+    def _write_rows(self, scores, games):
+        self._connection.executemany(UPSERT, scores)
+        for channel_id, guild_id, played_at, game_scores in games:
+            game_id = self._connection.execute('INSERT INTO games (channel_id, guild_id, played_at) VALUES (?, ?, ?)',
+                                               (channel_id, guild_id, played_at)).lastrowid
+            self._connection.executemany('INSERT INTO game_scores VALUES (?, ?, ?, ?)',
+                                         [(game_id, player_id, name, score) for player_id, name, score in game_scores])
+
+    def _write(self, scores, games):
+        with self._lock:
+            try:
+                with self._connection:
+                    self._write_rows(scores, games)
+            finally:
+                self._in_flight = []
+
+    # one transaction for everything scored since the last flush, written off the event loop
+    async def flush(self):
+        scores, self._pending_scores = self._pending_scores, []
+        games, self._pending_games = self._pending_games, []
+        if scores or games:
+            self._in_flight = scores
+            await asyncio.get_event_loop().run_in_executor(None, self._write, scores, games)
+
+    async def flush_every(self, interval=5):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f'Failed to save leaderboard: {e!r}')
+
+
+# scores and finished games go to a journal.Journal as soon as they happen instead of waiting
+# for the next flush, the journal folds them into the database. like a shard's board, a board
+# read from the database adds the journaled batches it does not hold yet
+class JournaledLeaderboard(Leaderboard):
+
+    def __init__(self, path=LEADERBOARD_PATH, journal_path=JOURNAL_PATH, clock=time.time, **journal_options):
+        super().__init__(path, clock)
+        self._connection.execute(PROGRESS_SCHEMA)
+        self._sent = []
+        self.journal = Journal(journal_path, self, **journal_options)
+
+    def close(self):
+        self.journal.close()
+        super().close()
+
+    def journal_seq(self):
+        with self._lock:
+            return applied_seq(self._connection)
+
+    def apply_journal(self, records, seq):
+        with self._lock, self._connection:
+            for _, scores, games in records:
+                self._write_rows(scores, games)
+            save_applied_seq(self._connection, seq)
+
+    def _read_board(self, scope, period):
+        committed = applied_seq(self._connection)
+        rows, unwritten = super()._read_board(scope, period)
+        self._sent = [(seq, scores) for seq, scores in self._sent if seq > committed]
+        return rows, [score for _, scores in self._sent for score in scores] + unwritten
+
+    def add(self, channel_id, guild_id, player_id, name, points):
+        super().add(channel_id, guild_id, player_id, name, points)
+        self._journal()
+
+    def record_game(self, channel_id, guild_id, score_board):
+        super().record_game(channel_id, guild_id, score_board)
+        self._journal()
+
+    def _journal(self):
+        scores, self._pending_scores = self._pending_scores, []
+        games, self._pending_games = self._pending_games, []
+        if scores or games:
+            # batches the journal folded in are read back from the database
+            applied = self.journal.applied
+            if self._sent and self._sent[0][0] <= applied:
+                self._sent = [(seq, batch) for seq, batch in self._sent if seq > applied]
+            self._sent.append((self.journal.append(SCORES, scores, games), scores))
+
+    async def flush(self):
+        self._journal()
@@ -0,0 +1,92 @@
+import os
+import random
+import tempfile
+import unittest
+
+import leaderboard
+from leaderboard import ALL_TIME, Leaderboard, RankIndex, channel_scope, guild_scope, week_period
+from loadtest import VirtualClock
+
+WEEK = 7 * 24 * 60 * 60
+
+
+class TestRankIndex(unittest.TestCase):
+
+    def test_matches_sorting(self):
+        random.seed(1)
+        # small buckets so splits and empty buckets happen
+        bucket_size, leaderboard.BUCKET_SIZE = leaderboard.BUCKET_SIZE, 4
+        try:
+            index = RankIndex()
+            scores = {}
+            for _ in range(3000):
+                player = random.randint(0, 300)
+                score = random.choice([0, 3, 5, 10, random.randint(0, 500)])
+                index.update(player, score)
+                scores[player] = score
+
+                if random.random() < 0.05:
+                    ordered = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+                    self.assertEqual(index.top(10), ordered[:10])
+                    for player, score in random.sample(list(scores.items()), 10):
+                        self.assertEqual(index.rank(player), 1 + sum(1 for s in scores.values() if s > score))
+        finally:
+            leaderboard.BUCKET_SIZE = bucket_size
+
+        self.assertIsNone(index.rank(-1))
+
+
+class TestLeaderboard(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'leaderboard.db')
+        self.clock = VirtualClock(1_600_000_000)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def test_scores_survive_a_restart(self):
+        board = Leaderboard(self.path, self.clock)
+        board.add(1, 10, 100, 'alice', 10)
+        board.add(1, 10, 200, 'bob', 5)
+        board.add(2, 10, 200, 'bob', 10)
+        board.record_game(1, 10, {100: {'name': 'alice', 'score': 10}, 200: {'name': 'bob', 'score': 5}})
+        await board.flush()
+        board.close()
+
+        board = Leaderboard(self.path, self.clock)
+        self.assertEqual(board.top(channel_scope(1)), [('alice', 10), ('bob', 5)])
+        self.assertEqual(board.top(guild_scope(10)), [('bob', 15), ('alice', 10)])
+        self.assertEqual(board.rank(guild_scope(10), 100), (2, 10, 2))
+
+        # updates apply to boards already in memory and to ones read later
+        board.add(1, 10, 200, 'bob', 10)
+        self.assertEqual(board.rank(channel_scope(1), 200), (1, 15, 2))
+        self.assertEqual(board.top(channel_scope(1), period=week_period(self.clock())), [('bob', 15), ('alice', 10)])
+        board.close()
+
+    async def test_closing_writes_what_was_not_flushed(self):
+        board = Leaderboard(self.path, self.clock)
+        board.add(1, None, 100, 'alice', 10)
+        board.record_game(1, None, {100: {'name': 'alice', 'score': 10}})
+        board.close()
+
+        board = Leaderboard(self.path, self.clock)
+        self.assertEqual(board.top(channel_scope(1)), [('alice', 10)])
+        self.assertEqual(board._connection.execute('SELECT COUNT(*) FROM games').fetchone()[0], 1)
+        board.close()
+
+    async def test_weekly_boards_start_over(self):
+        board = Leaderboard(self.path, self.clock)
+        board.add(1, None, 100, 'alice', 10)
+        self.clock.now += WEEK
+        board.add(1, None, 200, 'bob', 3)
+
+        self.assertEqual(board.top(channel_scope(1), period=ALL_TIME), [('alice', 10), ('bob', 3)])
+        self.assertEqual(board.top(channel_scope(1), period=week_period(self.clock())), [('bob', 3)])
+        board.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+import argparse
+import asyncio
+import random
+import resource
+import time
+
+from game import MATCH_INLINE, GameManager, GameState
+from question import Question, Question_Database
+
+ANSWERS = ['Paris', 'Abraham Lincoln', 'Mount Everest', 'Yellowstone National Park', 'The Emerald City', 'Jupiter',
+           'Leonardo da Vinci', 'Pacific Ocean', 'Marie Curie', '1945', 'Twenty-Seven', 'Baking soda', 'Adiós', 'tin']
+CHATTER = ['lol', 'gg', 'hi', 'ok', 'brb', 'what', 'no way', 'haha', 'nice', 'wait what', 'too fast', 'hmm',
+           'this one is hard', 'who knows this', 'i knew it', 'gg wp', 'ugh', 'next', 'yes', 'same']
+
+
+class VirtualClock:
+
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeGuild:
+
+    def __init__(self, id):
+        self.id = id
+        self.name = f'guild{id}'
+
+
+class FakeChannel:
+
+    def __init__(self, id, guild):
+        self.id = id
+        self.name = f'channel{id}'
+        self.guild = guild
+
+
+class FakeAuthor:
+
+    def __init__(self, id):
+        self.id = id
+        self.name = f'user{id}'
+
+
+class FakeMessage:
+
+    def __init__(self, channel, author, content, created_at):
+        self.guild = channel.guild
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.created_at = created_at
+
+
+# stands in for a discord ctx and measures how long a correct answer took to be acknowledged
+class FakeContext:
+
+    def __init__(self, channel, stats):
+        self.channel = channel
+        self.guild = channel.guild
+        self.stats = stats
+        self.first_correct_at = None
+
+    async def send(self, message):
+        self.stats['sends'] += 1
+        if message.startswith('Correct answer') and self.first_correct_at is not None:
+            self.stats['ack_latencies'].append(time.perf_counter() - self.first_correct_at)
+        if message.startswith(('Correct answer', 'Answer:', 'Question')):
+            self.first_correct_at = None
+
+
+def _typo(text):
+    if len(text) < 6:
+        return text
+    i = random.randint(0, len(text) - 2)
+    return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+
+
+def _percentile(values, percentile):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percentile / 100))]
+
+
+async def _sample_loop_lag(interval, lags, stop):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+# n guilds x m channels x k users typing at a given rate against one GameManager,
+# game timers run on a virtual clock that advances `speed` times faster than real time
+async def run_load(guilds=10, channels=5, users=20, rate=0.2, correct=0.05, duration=60.0, speed=5.0, tick=0.1,
+                   questions=10, bank_size=1000, seed=0, match_mode=MATCH_INLINE):
+    random.seed(seed)
+    Question_Database._set_questions([Question(f'Synthetic question {i}?', random.choice(ANSWERS)) for i in range(bank_size)])
+
+    clock = VirtualClock()
+    manager = GameManager(clock, match_mode=match_mode)
+    stats = {'messages': 0, 'sends': 0, 'ack_latencies': []}
+
+    contexts = []
+    for g in range(guilds):
+        guild = FakeGuild(g)
+        for c in range(channels):
+            channel = FakeChannel(g * channels + c, guild)
+            ctx = FakeContext(channel, stats)
+            authors = [FakeAuthor(channel.id * users + u) for u in range(users)]
+            contexts.append((ctx, authors))
+            manager.start_game(ctx, channel.id, questions)
+
+    lags = []
+    stop = asyncio.Event()
+    sampler = asyncio.ensure_future(_sample_loop_lag(0.01, lags, stop))
+    in_flight = set()
+
+    start = time.perf_counter()
+    while clock.now < duration:
+        clock.now += tick
+        manager.scheduler.run_due()
+
+        for ctx, authors in contexts:
+            game = manager.games[ctx.channel.id]
+            if game.state == GameState.OVER:
+                manager.start_game(ctx, ctx.channel.id, questions)
+            for author in authors:
+                if random.random() >= rate * tick:
+                    continue
+                content = random.choice(CHATTER)
+                if game.question is not None and game.state != GameState.BEFORE_QUESTION:
+                    if random.random() < correct:
+                        content = _typo(game.question.get_answer())
+                        # a typo can turn it into a miss, latency counts from the first real hit
+                        if ctx.first_correct_at is None and game.question.is_answer_correct(content):
+                            ctx.first_correct_at = time.perf_counter()
+                    elif random.random() < 0.5:
+                        content = random.choice(ANSWERS)
+                message = FakeMessage(ctx.channel, author, content, clock.now)
+                stats['messages'] += 1
+                # discord dispatches every message in its own task
+                task = asyncio.ensure_future(manager.process_message(message))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+
+        await asyncio.sleep(tick / speed)
+
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    if manager.match_executor is not None:
+        manager.match_executor.shutdown()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await sampler
+
+    latencies = stats['ack_latencies']
+    return {
+        'channels': len(contexts),
+        'users': len(contexts) * users,
+        'messages': stats['messages'],
+        'messages_per_second': stats['messages'] / elapsed,
+        'sends': stats['sends'],
+        'answers': len(latencies),
+        'ack_p50_ms': _percentile(latencies, 50) * 1000,
+        'ack_p99_ms': _percentile(latencies, 99) * 1000,
+        'loop_lag_p50_ms': _percentile(lags, 50) * 1000,
+        'loop_lag_p99_ms': _percentile(lags, 99) * 1000,
+        'loop_lag_max_ms': max(lags, default=0) * 1000,
+        'max_rss_mib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'elapsed_seconds': elapsed,
+    }
+
+
+def print_report(report):
+    print(f'load: {report["channels"]} channels, {report["users"]} users, {report["messages"]:,} messages '
+          f'({report["messages_per_second"]:,.0f}/s) in {report["elapsed_seconds"]:.1f}s')
+    print(f'load: {report["answers"]} answers acknowledged, p50 {report["ack_p50_ms"]:.1f}ms, p99 {report["ack_p99_ms"]:.1f}ms')
+    print(f'load: event loop lag p50 {report["loop_lag_p50_ms"]:.1f}ms, p99 {report["loop_lag_p99_ms"]:.1f}ms, '
+          f'max {report["loop_lag_max_ms"]:.1f}ms, max RSS {report["max_rss_mib"]:.0f} MiB')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Drive the game engine with synthetic chat, no discord needed')
+    parser.add_argument('--guilds', type=int, default=10)
+    parser.add_argument('--channels', type=int, default=5, help='channels per guild')
+    parser.add_argument('--users', type=int, default=20, help='users per channel')
+    parser.add_argument('--rate', type=float, default=0.2, help='messages per user per virtual second')
+    parser.add_argument('--correct', type=float, default=0.05, help='chance a message is the right answer')
+    parser.add_argument('--duration', type=float, default=60.0, help='virtual seconds to simulate')
+    parser.add_argument('--speed', type=float, default=5.0, help='virtual seconds per real second')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--match-mode', default=MATCH_INLINE, choices=['inline', 'thread', 'process'])
+    args = parser.parse_args()
+
+    print_report(asyncio.run(run_load(args.guilds, args.channels, args.users, args.rate, args.correct,
+                                      args.duration, args.speed, seed=args.seed, match_mode=args.match_mode)))
@@ -0,0 +1,140 @@
+import asyncio
+import bisect
+import json
+import os
+import time
+from functools import wraps
+
+# read once at import, with metrics off the timed functions are left unwrapped
+ENABLED = os.getenv('TRIVIA_METRICS', '') not in ('', '0')
+
+# upper bounds in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    # upper bound of the bucket holding the quantile
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float('inf')
+        return float('inf')
+
+
+class Metrics:
+
+    def __init__(self, enabled=ENABLED):
+        self.enabled = enabled
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, value=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        if self.enabled:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    # times every call of a function or coroutine function into the named histogram
+    def timed(self, name):
+        def decorator(function):
+            if not self.enabled:
+                return function
+
+            if asyncio.iscoroutinefunction(function):
+                @wraps(function)
+                async def timed_coroutine(*args, **kwargs):
+                    start = time.perf_counter()
+                    try:
+                        return await function(*args, **kwargs)
+                    finally:
+                        self.observe(name, time.perf_counter() - start)
+                return timed_coroutine
+
+            @wraps(function)
+            def timed_function(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return timed_function
+        return decorator
+
+    def snapshot(self):
+        histograms = {}
+        for name, histogram in self.histograms.items():
+            histograms[name] = {
+                'count': histogram.count,
+                'sum': histogram.sum,
+                'p50': histogram.quantile(0.5),
+                'p99': histogram.quantile(0.99),
+            }
+        return {'counters': dict(self.counters), 'histograms': histograms}
+
+    def render_prometheus(self):
+        lines = []
+        for name, value in sorted(self.counters.items()):
+            lines.append(f'# TYPE trivia_{name}_total counter')
+            lines.append(f'trivia_{name}_total {value}')
+        for name, histogram in sorted(self.histograms.items()):
+            lines.append(f'# TYPE trivia_{name}_seconds histogram')
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'trivia_{name}_seconds_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'trivia_{name}_seconds_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f'trivia_{name}_seconds_sum {histogram.sum}')
+            lines.append(f'trivia_{name}_seconds_count {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    async def sample_loop_lag(self, interval=0.5):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.observe('event_loop_lag', max(0.0, time.perf_counter() - start - interval))
+
+    # minimal http endpoint for a prometheus scraper, every request gets the metrics
+    async def serve(self, host='127.0.0.1', port=9100):
+        async def handle(reader, writer):
+            try:
+                await reader.readuntil(b'\r\n\r\n')
+                body = self.render_prometheus().encode()
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n'
+                             b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+                await writer.drain()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                pass
+            finally:
+                writer.close()
+
+        return await asyncio.start_server(handle, host, port)
+
+    async def dump_json(self, path, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            with open(path, 'w') as f:
+                json.dump(self.snapshot(), f)
+
+
+metrics = Metrics()
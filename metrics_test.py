@@ -0,0 +1,47 @@
+import asyncio
+import unittest
+
+from metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_disabled_leaves_functions_alone(self):
+        metrics = Metrics(enabled=False)
+
+        def f():
+            return 1
+
+        self.assertIs(metrics.timed('f')(f), f)
+        metrics.inc('calls')
+        self.assertEqual(metrics.snapshot(), {'counters': {}, 'histograms': {}})
+
+    def test_times_functions_and_coroutines(self):
+        metrics = Metrics(enabled=True)
+
+        @metrics.timed('sync')
+        def f(x):
+            return x + 1
+
+        @metrics.timed('async')
+        async def g(x):
+            await asyncio.sleep(0)
+            return x * 2
+
+        self.assertEqual(f(1), 2)
+        self.assertEqual(asyncio.run(g(2)), 4)
+        metrics.inc('calls', 2)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['counters'], {'calls': 2})
+        self.assertEqual(snapshot['histograms']['sync']['count'], 1)
+        self.assertEqual(snapshot['histograms']['async']['count'], 1)
+
+        text = metrics.render_prometheus()
+        self.assertIn('trivia_calls_total 2', text)
+        self.assertIn('trivia_sync_seconds_bucket{le="+Inf"} 1', text)
+        self.assertIn('trivia_async_seconds_count 1', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import asyncio
+import time
+
+from metrics import metrics
+
+# discord lets a bot send about 5 messages every 5 seconds to a channel
+SEND_BURST = 5
+SEND_INTERVAL_SECONDS = 1
+# messages queued this close together go out as one
+COALESCE_SECONDS = 0.02
+MAX_MESSAGE_LENGTH = 2000
+SEPARATOR = '\n\n'
+
+
+class TokenBucket:
+
+    def __init__(self, burst=SEND_BURST, interval=SEND_INTERVAL_SECONDS, clock=time.monotonic):
+        self.burst = burst
+        self.interval = interval
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) / self.interval)
+        self.updated = now
+
+    # seconds until a token is available
+    def delay(self):
+        self._refill()
+        return 0 if self.tokens >= 1 else (1 - self.tokens) * self.interval
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1
+
+
+# joins queued messages up to the length limit, a message that is too long on its own is split
+def _pack(messages):
+    text = messages[0]
+    if len(text) > MAX_MESSAGE_LENGTH:
+        return text[:MAX_MESSAGE_LENGTH], [text[MAX_MESSAGE_LENGTH:]] + messages[1:]
+
+    i = 1
+    while i < len(messages) and len(text) + len(SEPARATOR) + len(messages[i]) <= MAX_MESSAGE_LENGTH:
+        text += SEPARATOR + messages[i]
+        i += 1
+    return text, messages[i:]
+
+
+# queues a channel's messages so callers never wait on discord, one task drains the queue
+# and whatever piled up while it waited for the window or the rate limit is sent together
+class ChannelOutbox:
+
+    def __init__(self, send, window=COALESCE_SECONDS, bucket=None):
+        self.send = send
+        self.window = window
+        self.bucket = bucket or TokenBucket()
+        self.queue = []
+        self._task = None
+
+    def __len__(self):
+        return len(self.queue)
+
+    def put(self, message):
+        self.queue.append(message)
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._drain())
+
+    async def flush(self):
+        while self._task is not None and not self._task.done():
+            await self._task
+
+    async def _drain(self):
+        await asyncio.sleep(self.window)
+        while self.queue:
+            delay = self.bucket.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            queued = len(self.queue)
+            text, self.queue = _pack(self.queue)
+            if queued - len(self.queue) > 1:
+                metrics.inc('coalesced_messages', queued - len(self.queue) - 1)
+            self.bucket.take()
+            try:
+                await self.send(text)
+            except Exception as e:
+                print(f'Failed to send message: {e!r}')
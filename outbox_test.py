@@ -0,0 +1,52 @@
+import asyncio
+import time
+import unittest
+
+from outbox import MAX_MESSAGE_LENGTH, ChannelOutbox, TokenBucket
+
+
+class StubSender:
+
+    def __init__(self):
+        self.sent = []
+        self.times = []
+
+    async def __call__(self, text):
+        self.sent.append(text)
+        self.times.append(time.monotonic())
+
+
+class TestChannelOutbox(unittest.IsolatedAsyncioTestCase):
+
+    async def test_coalesces_messages_in_window(self):
+        sender = StubSender()
+        outbox = ChannelOutbox(sender, window=0.01)
+        outbox.put('Answer:\nParis')
+        outbox.put('Game over')
+        await outbox.flush()
+        self.assertEqual(sender.sent, ['Answer:\nParis\n\nGame over'])
+
+    async def test_splits_long_messages(self):
+        sender = StubSender()
+        outbox = ChannelOutbox(sender, window=0)
+        outbox.put('a' * (MAX_MESSAGE_LENGTH + 10))
+        outbox.put('b' * (MAX_MESSAGE_LENGTH - 5))
+        await outbox.flush()
+        self.assertEqual([len(text) for text in sender.sent], [MAX_MESSAGE_LENGTH, 10, MAX_MESSAGE_LENGTH - 5])
+
+    async def test_respects_rate_limit(self):
+        sender = StubSender()
+        outbox = ChannelOutbox(sender, window=0, bucket=TokenBucket(burst=2, interval=0.05))
+        for i in range(3):
+            outbox.put('x' * MAX_MESSAGE_LENGTH)
+            await asyncio.sleep(0)
+        start = time.monotonic()
+        await outbox.flush()
+        self.assertEqual(len(sender.sent), 3)
+        # the first two go out right away, the third waits for a token
+        self.assertLess(sender.times[1] - start, 0.04)
+        self.assertGreaterEqual(sender.times[2] - start, 0.04)
+
+
+if __name__ == '__main__':
+    unittest.main()
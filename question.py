@@ -1,45 +1,102 @@
 from math import floor
-from random import randint
-import pickle
-import json
-import urllib
+from random import shuffle
+import asyncio
+import hashlib
+import os
 import re
+import time
 
 import Levenshtein
-import requests
-from bs4 import BeautifulSoup
 from num2words import num2words
 from unidecode import unidecode
 from asyncio import Lock
+from journal import ANSWERED, ASKED, IGNORE
+from metrics import metrics
 
-STOP_WORDS = ['i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', "you're", "you've", "you'll", "you'd", 'your', 'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', "she's", 'her', 'hers', 'herself', 'it', "it's", 'its', 'itself', 'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which', 'who', 'whom', 'this', 'that', "that'll", 'these', 'those', 'am', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does', 'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as', 'until', 'while', 'of', 'at', 'by', 'for', 'with', 'about', 'against', 'between', 'into', 'through', 'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up', 'down', 'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further', 'then', 'once', 'here', 'there', 'when', 'where', 'why', 'how', 'all', 'any', 'both', 'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own', 'same', 'so', 'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don', "don't", 'should', "should've", 'now', 'd', 'll', 'm', 'o', 're', 've', 'y', 'ain', 'aren', "aren't", 'couldn', "couldn't", 'didn', "didn't", 'doesn', "doesn't", 'hadn', "hadn't", 'hasn', "hasn't", 'haven', "haven't", 'isn', "isn't", 'ma', 'mightn', "mightn't", 'mustn', "mustn't", 'needn', "needn't", 'shan', "shan't", 'shouldn', "shouldn't", 'wasn', "wasn't", 'weren', "weren't", 'won', "won't", 'wouldn', "wouldn't"]
+STOP_WORDS = frozenset(['i', 'me', 'my', 'myself', 'we', 'our', 'ours', 'ourselves', 'you', "you're", "you've", "you'll", "you'd", 'your', 'yours', 'yourself', 'yourselves', 'he', 'him', 'his', 'himself', 'she', "she's", 'her', 'hers', 'herself', 'it', "it's", 'its', 'itself', 'they', 'them', 'their', 'theirs', 'themselves', 'what', 'which', 'who', 'whom', 'this', 'that', "that'll", 'these', 'those', 'am', 'is', 'are', 'was', 'were', 'be', 'been', 'being', 'have', 'has', 'had', 'having', 'do', 'does', 'did', 'doing', 'a', 'an', 'the', 'and', 'but', 'if', 'or', 'because', 'as', 'until', 'while', 'of', 'at', 'by', 'for', 'with', 'about', 'against', 'between', 'into', 'through', 'during', 'before', 'after', 'above', 'below', 'to', 'from', 'up', 'down', 'in', 'out', 'on', 'off', 'over', 'under', 'again', 'further', 'then', 'once', 'here', 'there', 'when', 'where', 'why', 'how', 'all', 'any', 'both', 'each', 'few', 'more', 'most', 'other', 'some', 'such', 'no', 'nor', 'not', 'only', 'own', 'same', 'so', 'than', 'too', 'very', 's', 't', 'can', 'will', 'just', 'don', "don't", 'should', "should've", 'now', 'd', 'll', 'm', 'o', 're', 've', 'y', 'ain', 'aren', "aren't", 'couldn', "couldn't", 'didn', "didn't", 'doesn', "doesn't", 'hadn', "hadn't", 'hasn', "hasn't", 'haven', "haven't", 'isn', "isn't", 'ma', 'mightn', "mightn't", 'mustn', "mustn't", 'needn', "needn't", 'shan', "shan't", 'shouldn', "shouldn't", 'wasn', "wasn't", 'weren', "weren't", 'won', "won't", 'wouldn', "wouldn't"])
 
-CATEGORIES_URL = 'https://trivia.fyi/categories/'
+DISCORD_UNDERSCORE = '\_'
+MAXMIMUM_DISTANCE = 2
+# opentdb difficulties, scraped trivia.fyi questions have none
+DIFFICULTIES = ('easy', 'medium', 'hard')
 
+_NON_ALNUM_OR_SPACE = re.compile(r'[^A-Za-z0-9 ]+')
 
-OPENT_SESSION_TOKEN_URL = 'https://opentdb.com/api_token.php?command=request'
-OPENT_CATEGORY_URL = 'https://opentdb.com/api_category.php'
-OPENT_URL = 'https://opentdb.com/api.php?amount=50&encode=url3986&type=multiple&token='
 
-DISCORD_UNDERSCORE = '\_'
-MAXMIMUM_DISTANCE = 2
+# str.translate table that lowercases, folds accents to ascii and drops punctuation
+# in a single pass, characters are resolved with unidecode the first time they are seen
+class _FoldTable(dict):
+
+    def __missing__(self, codepoint):
+        folded = _NON_ALNUM_OR_SPACE.sub('', unidecode(chr(codepoint).lower()))
+        self[codepoint] = folded
+        return folded
+
+
+_FOLD_TABLE = _FoldTable()
+_NEWLINE_TABLE = str.maketrans('\n', ' ')
+
+
+# pure ascii text, by far the common case, takes a cheaper bytes.translate pass
+_ASCII_LOWER = bytes.maketrans(b'ABCDEFGHIJKLMNOPQRSTUVWXYZ', b'abcdefghijklmnopqrstuvwxyz')
+_ASCII_DROP = bytes(c for c in range(128) if _NON_ALNUM_OR_SPACE.fullmatch(chr(c)))
+
+
+def normalize(text):
+    if text.isascii():
+        return text.encode().translate(_ASCII_LOWER, _ASCII_DROP).decode()
+    return text.translate(_FOLD_TABLE)
+
 
 # wrapper that will generate hints
 class Question:
+    # no per instance __dict__, the bank holds a lot of these
+    __slots__ = ('question', 'answer', 'ignore', 'details', 'category', 'difficulty', '_matcher')
 
-    def __init__(self, question, answer, detail=None):
+    def __init__(self, question, answer, detail=None, category=None, difficulty=None):
         self.question = question
         self.answer = answer
         self.ignore = False
-        self.details = None
+        self.details = detail
+        self.category = category
+        self.difficulty = difficulty
+        self._matcher = None
+
+    def __getstate__(self):
+        # the matcher is rebuilt on demand, no need to persist it
+        return {'question': self.question, 'answer': self.answer, 'ignore': self.ignore, 'details': self.details,
+                'category': self.category, 'difficulty': self.difficulty}
+
+    def __setstate__(self, state):
+        # snapshots pickled before __slots__ hold a plain __dict__
+        if isinstance(state, tuple):
+            state = dict(state[0] or {}, **(state[1] or {}))
+        self.question = state['question']
+        self.answer = state['answer']
+        self.ignore = state.get('ignore', False)
+        self.details = state.get('details')
+        self.category = state.get('category')
+        self.difficulty = state.get('difficulty')
+        self._matcher = None
 
     def __eq__(self, other):
         # substrings to speed up comparison
         return other.get_question()[0:25] == self.get_question()[0:25] and other.get_answer()[0:25] == self.get_answer()[0:25]
 
+    # stable across runs, used as the key in the question store
+    def get_id(self):
+        digest = hashlib.blake2b(f'{self.question}\0{self.answer}'.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, 'big', signed=True)
+
     def get_details(self):
         return self.details
 
+    def get_category(self):
+        return self.category
+
+    def get_difficulty(self):
+        return self.difficulty
+
     def is_ignored(self):
         return self.ignore
 
@@ -52,101 +109,169 @@ class Question:
     def get_answer(self):
         return self.answer
 
+    def get_matcher(self):
+        matcher = self._matcher
+        if matcher is None:
+            matcher = AnswerMatcher(self.question, self.answer)
+            self._matcher = matcher
+        return matcher
+
+    @metrics.timed('is_answer_correct')
     def is_answer_correct(self, guess):
-        if len(self.answer) == 1:
-            return guess.lower() == self.answer
+        return self.get_matcher().is_correct(guess)
 
-        if guess.isnumeric():
-            if guess.lower() == self.answer.lower():
-                return True
-            guess = num2words(guess)
 
-        if self.answer.isnumeric():
-            if guess.lower() == num2words(self.answer).lower():
-                return True
+# share of the answer's letters shown by each hint, every hint extends the one before
+HINT_FRACTIONS = (1/5, 3/5)
 
-        question = unidecode(self.question.lower())
-        question = re.sub(r'[^A-Za-z0-9 ]+', '', question)
-        answer = unidecode(self.answer.lower())
-        answer = re.sub(r'[^A-Za-z0-9 ]+', '', answer)
-        guess = unidecode(guess.lower())
-        guess = re.sub(r'[^A-Za-z0-9 ]+', '', guess)
 
-        question_tokens = question.split(' ')
-        answer_tokens = answer.split(' ')
-        guess_tokens = guess.split(' ')
+# the reveal order of an asked question is fixed once, hint n shows the first letters of that
+# order for its fraction and is joined in one pass over the answer
+class Hints:
 
-        answer_tokens = list(filter(lambda x: x not in STOP_WORDS and x not in question_tokens, answer_tokens))
-        guess_tokens = list(filter(lambda x: x not in STOP_WORDS and x not in question_tokens, guess_tokens))
+    def __init__(self, answer, fractions=HINT_FRACTIONS):
+        self.answer = answer
+        self.fractions = fractions
+        self.order = [i for i, character in enumerate(answer) if character.isalnum()]
+        shuffle(self.order)
+        # spaces are doubled for better formatting and punctuation is kept
+        self.hidden = ['  ' if character == ' ' else DISCORD_UNDERSCORE if character.isalnum() else character
+                       for character in answer]
 
-        correct_tokens = 0
-        for guess_token in guess_tokens:
-            for answer_token in answer_tokens:
-                max_distance = MAXMIMUM_DISTANCE
-                if len(answer_token) > 6:
-                    max_distance = 1
-                elif len(answer_token) < 5:
-                    max_distance = 0
-
-                if Levenshtein.distance(answer_token, guess_token) <= max_distance:
-                    correct_tokens += 1
-                    # significant word should be worth more
-                    if len(answer_token) > 8:
-                        correct_tokens += 1
-
-        if len(answer_tokens) == 1:
-            return correct_tokens >= 1
-
-        return correct_tokens > floor(len(answer_tokens) / 2)
-
-    def _get_hint(self, percentage):
+    def __len__(self):
+        return len(self.fractions)
+
+    def hint(self, level):
         if len(self.answer) == 1:
             return DISCORD_UNDERSCORE
 
-        answer_length = len(re.sub(r'[^A-Za-z0-9]+', '', self.answer))
-        num_visible_letter = floor(answer_length * percentage)
-        if num_visible_letter == 0:
-            num_visible_letter = 1
+        visible = max(1, floor(len(self.order) * self.fractions[level]))
+        parts = self.hidden.copy()
+        for i in self.order[:visible]:
+            parts[i] = self.answer[i]
+        return ''.join(parts)
 
-        valid_indexes = []
-        for i in range(answer_length):
-            # if self.answer[i] != ' ':
-            if self.answer[i].isalnum():
-                valid_indexes.append(i)
 
-        letter_indexes = []
-        for i in range(num_visible_letter):
-            index = randint(0, len(valid_indexes) - 1)
-            letter_indexes.append(valid_indexes[index])
-            valid_indexes.pop(index)
+def _max_distance(answer_token):
+    if len(answer_token) > 6:
+        return 1
+    elif len(answer_token) < 5:
+        return 0
+    return MAXMIMUM_DISTANCE
 
-        hint = ''
-        for i in range(len(self.answer)):
-            if i in letter_indexes:
-                hint += self.answer[i]
-            elif self.answer[i] == ' ':
-                # two spaces for better formatting
-                hint += '  '
-            elif not self.answer[i].isalnum():
-                # keep punctuation
-                hint += self.answer[i]
-            else:
-                hint += DISCORD_UNDERSCORE
 
+# everything about the answer that does not depend on the guess, computed once per question
+class AnswerMatcher:
 
-        return hint
+    def __init__(self, question, answer):
+        self.answer = answer
+        self.single_character = len(answer) == 1
+        self.answer_lower = answer.lower()
+        # single characters are compared as they are, num2words fails on ones like ½
+        self.spelled_answer = num2words(answer).lower() if answer.isnumeric() and not self.single_character else None
+
+        # stop words and words already in the question never count
+        self.ignored_tokens = STOP_WORDS.union(normalize(question).split(' '))
+        answer_tokens = [x for x in normalize(answer).split(' ') if x not in self.ignored_tokens]
+
+        # (token, max distance, points), significant words are worth more
+        self.answer_tokens = [(x, _max_distance(x), 2 if len(x) > 8 else 1) for x in answer_tokens]
+        # a single token needs one match, otherwise more than half of them
+        self.required = floor(len(answer_tokens) / 2) + 1
+
+        # a word within k edits of an answer word still has all but k of its distinct characters
+        self.token_signatures = [(frozenset(x), len(set(x)) - max_distance) for x, max_distance, _ in self.answer_tokens]
+
+    # cheap check that never rejects a correct guess, used to drop chat before the full match
+    def could_match(self, guess):
+        if self.single_character:
+            return guess.lower() == self.answer
+        if guess.isnumeric() or (self.spelled_answer is not None and guess.lower() == self.spelled_answer):
+            return True
 
-    def get_first_hint(self):
-        return self._get_hint(1/5)
+        characters = set(normalize(guess))
+        for token_characters, needed in self.token_signatures:
+            if len(token_characters & characters) >= needed:
+                return True
+        return False
 
-    def get_second_hint(self):
-        return self._get_hint(3/5)
+    # token_points can be shared between guesses to only match each distinct word once
+    def is_correct(self, guess, token_points=None):
+        if self.single_character:
+            return guess.lower() == self.answer
+
+        if guess.isnumeric():
+            if guess.lower() == self.answer_lower:
+                return True
+            guess = num2words(guess)
+
+        if self.spelled_answer is not None and guess.lower() == self.spelled_answer:
+            return True
+
+        if token_points is None:
+            token_points = {}
+
+        correct_tokens = 0
+        for guess_token in normalize(guess).split(' '):
+            if guess_token in self.ignored_tokens:
+                continue
+            points = token_points.get(guess_token)
+            if points is None:
+                points = token_points[guess_token] = self._token_points(guess_token)
+            correct_tokens += points
+            if correct_tokens >= self.required:
+                return True
+
+        return False
+
+    def _token_points(self, guess_token):
+        points = 0
+        for answer_token, max_distance, answer_points in self.answer_tokens:
+            # the length difference is a lower bound on the edit distance
+            if abs(len(answer_token) - len(guess_token)) > max_distance:
+                continue
+            if max_distance == 0:
+                if answer_token != guess_token:
+                    continue
+            elif Levenshtein.distance(answer_token, guess_token) > max_distance:
+                continue
+            points += answer_points
+        return points
+
+    # checks a burst of guesses in one pass and returns the index of the first correct one,
+    # repeated guesses and words are only matched once
+    @metrics.timed('first_correct')
+    def first_correct(self, guesses):
+        verdicts = {}
+        token_points = {}
+        for index, guess in enumerate(guesses):
+            verdict = verdicts.get(guess)
+            if verdict is None:
+                verdict = verdicts[guess] = self.is_correct(guess, token_points)
+            if verdict:
+                return index
+        return None
+
+
+# matchers built inside pool worker processes, only the question and answer cross the
+# process boundary and each worker compiles a question once
+_pooled_matchers = {}
+POOLED_MATCHERS = 256
+
+
+def pooled_first_correct(question, answer, guesses):
+    key = (question, answer)
+    matcher = _pooled_matchers.get(key)
+    if matcher is None:
+        if len(_pooled_matchers) >= POOLED_MATCHERS:
+            _pooled_matchers.clear()
+        matcher = _pooled_matchers[key] = AnswerMatcher(question, answer)
+    return matcher.first_correct(guesses)
 
 
 # extra details in parenthesis
 def parse_answer(answer):
-    parsed = answer
-    parsed.replace('\n', ' ')
+    parsed = answer.translate(_NEWLINE_TABLE)
 
     bracket_index = -1
     if '(' in answer:
@@ -157,127 +282,217 @@ def parse_answer(answer):
         details = parsed[bracket_index:]
         parsed = parsed[0:bracket_index]
 
-
-    if parsed != answer:
-        print(f'{parsed} - {answer}')
-
     parsed = parsed.strip()
     return (parsed, details)
 
 class QuestionDatabase:
 
-    def __init__(self, scrape=True):
+    def __init__(self, scrape=False, store_path='questions.db', near_duplicates=False, bank_path=None, incremental=False,
+                 cache_path='scrape_cache.db', checkpoint_path='scrape_checkpoint.jsonl'):
         self.lock = Lock()
+        self.store_path = store_path
+        # only fetch pages that changed since the last scrape and only store new questions
+        self.incremental = incremental
+        self.cache_path = cache_path
+        self.checkpoint_path = checkpoint_path
+        # when set, games draw from a memory-mapped export shared with other processes
+        self.bank_path = bank_path
+        self.near_duplicates = near_duplicates
+        self.store = None
+        # when set, ignores and question stats are appended to a journal.Journal instead of written
+        self.journal = None
+        # wall time of the last scrape, a warm restart skips scraping while it is recent
+        self.refreshed_at = None
+        # bumped whenever the bank is swapped so running games pick up the new one
+        self.version = 0
+        self.questions = None
+        # ids ignored while a refresh merges, the merged bank was read before they were stored
+        self._ignored_during_refresh = None
+        # category and difficulty index of the current bank, built when a game first filters
+        self.index = None
         if scrape:
-            self.questions = self._scrape_questions()
-        else:
-            self.questions = []
-            try:
-                self.questions = self._read()
-            except Exception:
-                pass
+            self._set_questions(self._scrape_questions())
 
     def get_questions(self):
+        # the last snapshot is only read when a game first needs it
+        if self.questions is None:
+            self._set_questions(self._read_snapshot())
         return self.questions
 
-    def _scrape_trivia_fyi(self):
-        categories = []
-
-        response = requests.get(CATEGORIES_URL)
-        bs = BeautifulSoup(response.content, "html.parser")
-        category_tds = bs.find_all('td')
-        for td in category_tds:
-            link = td.find('a')
-            categories.append({'category': link.text, 'link': link.attrs['href']})
-
-        questions = {}
-        for category in categories:
-            found = True
-            link = category['link']
-            page = 1
-            questions[category['category']] = []
-            while found:
-                response = requests.get(link, allow_redirects=False)
-                bs = BeautifulSoup(response.content, "html.parser")
-                qs = bs.find_all('article')
-
-                if not qs:
-                    found = False
-                for q in qs:
-                    question = q.find('a').text
-                    answer, details = parse_answer(q.find('div', {'class': 'su-spoiler-content'}).text)
-                    questions[category['category']].append(Question(question, answer, details))
-                page += 1
-                link = category['link'] + "/page/" + str(page)
-
-        return [q for c in questions.values() for q in c]
-
-    def _scrape_opentdb(self):
-        token = json.loads(requests.get(OPENT_SESSION_TOKEN_URL).content)['token']
-
-        all_questions = []
+    def _set_questions(self, questions):
+        # a mapped bank keeps the ignores it was told about since its export
+        if hasattr(questions, 'mark_ignored') and getattr(self.questions, '_ignored', None):
+            questions._ignored |= self.questions._ignored
+        self.questions = questions
+        self.index = None
+        self.version += 1
+
+    def get_index(self):
+        from catalog import QuestionIndex
+
+        questions = self.get_questions()
+        if self.index is None:
+            self.index = QuestionIndex(questions)
+        return self.index
+
+    # bank positions of the questions passing a filter from catalog.parse_filter
+    def matching(self, question_filter):
+        return self.get_index().matching(question_filter)
+
+    def _read_snapshot(self):
+        questions = []
+        try:
+            if self.bank_path and os.path.exists(self.bank_path):
+                from bank import MappedBank
+                return MappedBank(self.bank_path)
+            questions = self._read()
+        except Exception:
+            pass
+        return questions
+
+    async def load(self):
+        if self.questions is None:
+            questions = await asyncio.get_event_loop().run_in_executor(None, self._read_snapshot)
+            if self.questions is None:
+                self._set_questions(questions)
+        return self.questions
+
+    # scrape off the event loop and swap the new bank in once it is merged and saved
+    async def refresh(self):
+        loop = asyncio.get_event_loop()
+        scraped = await loop.run_in_executor(None, self._scrape)
+        async with self.lock:
+            self._ignored_during_refresh = set()
+            try:
+                questions = await loop.run_in_executor(None, self._merge, scraped)
+            finally:
+                ignored, self._ignored_during_refresh = self._ignored_during_refresh, None
+        if ignored:
+            mark = getattr(questions, 'mark_ignored', None)
+            for question in questions:
+                if question.get_id() in ignored:
+                    question.ignore_question() if mark is None else mark(question)
+        self._set_questions(questions)
+        self.refreshed_at = time.time()
+        return questions
+
+    # when another process refreshes and re-exports the bank, map the new file once it is swapped in
+    async def watch_bank(self, interval=30):
+        from bank import MappedBank
+
+        def stamp():
+            stat = os.stat(self.bank_path)
+            return stat.st_ino, stat.st_mtime_ns
+
+        last = stamp()
         while True:
-            response = json.loads(requests.get(OPENT_URL + token).content)
-            if response['response_code'] != 0:
-                break
-            for q in response['results']:
-                question = urllib.parse.unquote(q['question']).strip()
-                if 'anime' in question.lower():
-                    continue
-                answer = urllib.parse.unquote(q['correct_answer']).strip()
-                all_questions.append(Question(question, answer))
-        return all_questions
+            await asyncio.sleep(interval)
+            try:
+                current = stamp()
+                if current != last:
+                    self._set_questions(MappedBank(self.bank_path))
+                    last = current
+            except Exception as e:
+                print(f'Failed to reload question bank: {e!r}')
 
+    def _scrape(self):
+        from scraper import Checkpoint, Scraper, ScrapeCache
+
+        if not self.incremental:
+            return Scraper().scrape()
+
+        seen = set()
+        try:
+            seen = {q.get_id() for q in self._read()}
+        except Exception:
+            pass
+        cache = ScrapeCache(self.cache_path)
+        try:
+            return Scraper(cache=cache, checkpoint=Checkpoint(self.checkpoint_path)).scrape(seen)
+        finally:
+            cache.close()
 
     def _scrape_questions(self):
-        all_questions = self._scrape_trivia_fyi() + self._scrape_opentdb()
+        return self._merge(self._scrape())
+
+    def _merge(self, all_questions):
+        from dedup import merge_questions, new_questions
+
+        # ignores still in the journal go into the store before it is read
+        if self.journal is not None:
+            self.journal.sync(timeout=60)
+
         old_questions = []
         try:
             old_questions = self._read()
         except Exception:
             pass
 
-        old_question_map = {}
-        for question in old_questions:
-            old_question_map[question.get_question() + question.get_answer()] = question
-
-        for question in old_questions:
-            if question.get_question() + question.get_answer() not in old_question_map:
-                all_questions.append(question)
-            elif question.is_ignored():
-                all_questions[all_questions.index(question)].ignore_question()
+        if self.incremental:
+            new = new_questions(all_questions, old_questions, self.near_duplicates)
+            print(f'Scraped {len(all_questions)} changed questions, {len(new)} of them new')
+            self._get_store().insert(new)
+            # the scraped questions are stored, an interrupted scrape has nothing left to resume
+            from scraper import Checkpoint
+            Checkpoint(self.checkpoint_path).clear()
+            all_questions = old_questions + new
+        else:
+            all_questions, stats = merge_questions(all_questions, old_questions, self.near_duplicates)
+            print(f'Merged {stats["scraped"]} scraped and {stats["stored"]} stored questions: '
+                  f'{stats["duplicates"]} duplicates collapsed, {stats["kept"]} kept from the store, {stats["ignored"]} ignored')
+            self._write(all_questions)
 
-        self._write(all_questions)
+        if self.bank_path:
+            from bank import MappedBank, export_bank
+            export_bank(all_questions, self.bank_path)
+            return MappedBank(self.bank_path)
         return all_questions
 
     async def read_question_database(self):
         async with self.lock:
             questions = []
             try:
-                questions = self._read()
+                questions = await asyncio.get_event_loop().run_in_executor(None, self._read)
             except Exception as e:
                 pass
             return questions
 
     async def ignore_question(self, question):
+        if self._ignored_during_refresh is not None:
+            self._ignored_during_refresh.add(question.get_id())
+        # a mapped bank is read-only, it remembers ignores on the side
+        if hasattr(self.questions, 'mark_ignored'):
+            self.questions.mark_ignored(question)
+        if self.journal is not None:
+            self.journal.append(IGNORE, question.get_id())
+            return
         async with self.lock:
-            all_questions = self._read()
-            index = all_questions.index(question)
-            if index >= 0:
-                all_questions[index].ignore_question()
-            self._write(all_questions)
+            await asyncio.get_event_loop().run_in_executor(None, self._get_store().ignore, question.get_id())
 
+    # stats are only kept with a journal, they are not worth a write per question
+    def question_asked(self, question):
+        if self.journal is not None:
+            self.journal.append(ASKED, question.get_id())
+
+    def question_answered(self, question, seconds):
+        if self.journal is not None:
+            self.journal.append(ANSWERED, question.get_id(), round(seconds, 3))
+
+    def _get_store(self):
+        from store import QuestionStore
+
+        if self.store is None:
+            self.store = QuestionStore(self.store_path)
+        return self.store
+
+    @metrics.timed('database_write')
     def _write(self, all_questions):
-        f = open('questions.pkl', 'wb')
-        pickle.dump(all_questions, f)
-        f.close()
+        self._get_store().replace_all(all_questions)
 
+    @metrics.timed('database_read')
     def _read(self):
-        f = open('questions.pkl', 'rb')
-        questions = pickle.load(f)
-        f.close()
-        return questions
+        return self._get_store().load()
 
 
-Question_Database = QuestionDatabase(scrape=True)
+Question_Database = QuestionDatabase()
 
@@ -0,0 +1,87 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+# how long to wait before retrying a game whose transition raised
+RETRY_DELAY_SECONDS = 1
+
+
+# wakes each game up at its next state transition instead of polling all of them,
+# games report their deadline through next_deadline() and finished games are dropped
+class Scheduler:
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._heap = []
+        self._deadlines = {}
+        self._running = set()
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, game, not_before=None):
+        # a running transition reschedules itself once it is done
+        if game in self._running:
+            return
+
+        deadline = game.next_deadline()
+        if deadline is None:
+            self._deadlines.pop(game, None)
+            return
+        if not_before is not None:
+            deadline = max(deadline, not_before)
+
+        if self._deadlines.get(game) == deadline:
+            return
+        # older heap entries for the game become stale and are skipped when popped
+        self._deadlines[game] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), game))
+        self._wakeup.set()
+
+    def next_wakeup(self):
+        while self._heap:
+            deadline, _, game = self._heap[0]
+            if self._deadlines.get(game) == deadline:
+                return deadline
+            heapq.heappop(self._heap)
+        return None
+
+    def run_due(self):
+        now = self.clock()
+        tasks = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, game = heapq.heappop(self._heap)
+            if self._deadlines.get(game) != deadline:
+                continue
+            del self._deadlines[game]
+            self._running.add(game)
+            tasks.append(asyncio.ensure_future(self._advance(game)))
+        return tasks
+
+    async def _advance(self, game):
+        not_before = None
+        try:
+            await game.advance_game()
+        except Exception as e:
+            print(f'Failed to advance game: {e!r}')
+            not_before = self.clock() + RETRY_DELAY_SECONDS
+        finally:
+            self._running.discard(game)
+        self.schedule(game, not_before)
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            self.run_due()
+
+            timeout = None
+            deadline = self.next_wakeup()
+            if deadline is not None:
+                timeout = max(0, deadline - self.clock())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,504 @@
+import codecs
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from html.parser import HTMLParser
+
+import requests
+from requests.adapters import HTTPAdapter
+from bs4 import BeautifulSoup
+
+from metrics import metrics
+from question import Question, parse_answer
+
+CATEGORIES_URL = 'https://trivia.fyi/categories/'
+
+OPENT_SESSION_TOKEN_URL = 'https://opentdb.com/api_token.php?command=request'
+OPENT_CATEGORY_URL = 'https://opentdb.com/api_category.php'
+OPENT_URL = 'https://opentdb.com/api.php?amount=50&encode=url3986&type=multiple&token='
+
+# opentdb only allows one request at a time per client
+HOST_LIMITS = {
+    'trivia.fyi': 8,
+    'opentdb.com': 1,
+}
+OPENT_TOKEN_NOT_FOUND = 3
+OPENT_TOKEN_EMPTY = 4
+OPENT_RATE_LIMITED = 5
+
+WORKERS = 16
+# pages of one category requested ahead before knowing where it ends
+PAGES_AHEAD = 4
+RETRIES = 3
+BACKOFF_SECONDS = 0.5
+TIMEOUT_SECONDS = 30
+CHUNK_SIZE = 16 * 1024
+
+CACHE_PATH = 'scrape_cache.db'
+CHECKPOINT_PATH = 'scrape_checkpoint.jsonl'
+# checkpoint lines for opentdb batches, every other line is a finished category
+OPENTDB_SOURCE = 'opentdb'
+
+CACHE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+'''
+
+
+class RetryableResponse(Exception):
+    pass
+
+
+# pulls (question, answer text) pairs out of a category page as it arrives instead of building
+# a tree: the question is the text of the first link in an article, the answer the text of its
+# su-spoiler-content div
+class ArticleParser(HTMLParser):
+
+    def __init__(self):
+        super().__init__()
+        self.articles = []
+        self._article_depth = 0
+        self._question = None
+        self._answer = None
+        # the text parts being collected and the tag that ends them
+        self._capture = None
+        self._capture_tag = None
+        self._capture_depth = 0
+
+    def pop(self):
+        articles, self.articles = self.articles, []
+        return articles
+
+    def _start_capture(self, tag):
+        self._capture = []
+        self._capture_tag = tag
+        self._capture_depth = 1
+        return self._capture
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'article':
+            self._article_depth += 1
+            if self._article_depth == 1:
+                self._question = None
+                self._answer = None
+            return
+        if not self._article_depth:
+            return
+
+        if self._capture is not None:
+            if tag == self._capture_tag:
+                self._capture_depth += 1
+        elif tag == 'a' and self._question is None:
+            self._question = self._start_capture(tag)
+        elif tag == 'div' and self._answer is None and 'su-spoiler-content' in (dict(attrs).get('class') or '').split():
+            self._answer = self._start_capture(tag)
+
+    def handle_endtag(self, tag):
+        if self._capture is not None and tag == self._capture_tag:
+            self._capture_depth -= 1
+            if not self._capture_depth:
+                self._capture = None
+
+        if tag == 'article' and self._article_depth:
+            self._article_depth -= 1
+            if not self._article_depth and self._question is not None and self._answer is not None:
+                self.articles.append((''.join(self._question), ''.join(self._answer)))
+
+    def handle_data(self, data):
+        if self._capture is not None:
+            self._capture.append(data)
+
+
+def iter_articles(chunks, encoding='utf-8'):
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    parser = ArticleParser()
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        yield from parser.pop()
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    yield from parser.pop()
+
+
+def iter_questions(chunks, encoding='utf-8', category=None):
+    for question, answer_text in iter_articles(chunks, encoding):
+        answer, details = parse_answer(answer_text)
+        yield Question(question, answer, details, category)
+
+
+# without a charset in the headers requests assumes latin-1, the site is utf-8
+def _encoding(response):
+    return response.encoding if 'charset' in response.headers.get('Content-Type', '') else 'utf-8'
+
+
+def _content_hash(content):
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+# validators of every page from the last scrape, so an unchanged page costs a 304 or at
+# worst a download that hashes the same, plus the opentdb token and the category list
+class ScrapeCache:
+
+    def __init__(self, path=CACHE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(CACHE_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def get(self, url):
+        with self._lock:
+            return self._connection.execute('SELECT etag, last_modified, content_hash FROM pages WHERE url = ?', (url,)).fetchone()
+
+    def put_many(self, entries):
+        with self._lock, self._connection:
+            self._connection.executemany('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)', entries)
+
+    def get_meta(self, key):
+        with self._lock:
+            row = self._connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def set_meta(self, key, value):
+        with self._lock, self._connection:
+            self._connection.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', (key, json.dumps(value)))
+
+
+# questions of the sources finished so far, one json line each, so an interrupted
+# incremental scrape picks up where it stopped
+def _checkpoint_row(question):
+    return [question.get_question(), question.get_answer(), question.get_details(), question.get_category(), question.get_difficulty()]
+
+
+class Checkpoint:
+
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self):
+        sources = {}
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # a line cut short by the interruption
+                        continue
+                    sources.setdefault(entry['source'], []).extend(entry['questions'])
+        except FileNotFoundError:
+            pass
+        return sources
+
+    def save(self, source, questions):
+        line = json.dumps({'source': source, 'questions': [_checkpoint_row(q) for q in questions]})
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line + '\n')
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+# fetches pages on a bounded thread pool over pooled keep-alive connections,
+# with a concurrency limit per host and retries with exponential backoff
+class Scraper:
+
+    def __init__(self, workers=WORKERS, host_limits=None, pages_ahead=PAGES_AHEAD, retries=RETRIES, backoff=BACKOFF_SECONDS,
+                 categories_url=CATEGORIES_URL, opentdb_token_url=OPENT_SESSION_TOKEN_URL, opentdb_url=OPENT_URL,
+                 cache=None, checkpoint=None):
+        self.workers = workers
+        self.host_limits = dict(HOST_LIMITS, **(host_limits or {}))
+        self.pages_ahead = pages_ahead
+        self.retries = retries
+        self.backoff = backoff
+        self.categories_url = categories_url
+        self.opentdb_token_url = opentdb_token_url
+        self.opentdb_url = opentdb_url
+        # with a cache the scrape is incremental and only returns questions it has not seen
+        self.cache = cache
+        self.checkpoint = checkpoint or Checkpoint()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=len(self.host_limits) + 1, pool_maxsize=workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self._host_semaphores = {}
+        self.pages = 0
+        self.bytes = 0
+
+    def _semaphore(self, url):
+        host = urllib.parse.urlparse(url).hostname
+        with self._lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = threading.BoundedSemaphore(min(self.workers, self.host_limits.get(host, self.workers)))
+            return self._host_semaphores[host]
+
+    def get(self, url, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                with self._semaphore(url):
+                    response = self.session.get(url, timeout=TIMEOUT_SECONDS, **kwargs)
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise RetryableResponse(f'{url} returned {response.status_code}')
+                with self._lock:
+                    self.pages += 1
+                    metrics.inc('scraped_pages')
+                # a streamed body is counted as it is read
+                if not kwargs.get('stream'):
+                    self._count_bytes(len(response.content))
+                return response
+            except (requests.RequestException, RetryableResponse):
+                metrics.inc('scrape_retries')
+                if attempt >= self.retries:
+                    raise
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    def _count_bytes(self, count):
+        with self._lock:
+            self.bytes += count
+        metrics.inc('scraped_bytes', count)
+
+    def _iter_body(self, response):
+        for chunk in response.iter_content(CHUNK_SIZE):
+            self._count_bytes(len(chunk))
+            yield chunk
+
+    def _validators(self, url):
+        headers = {}
+        cached = self.cache.get(url)
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        return cached, headers
+
+    # returns (response, cache entry), the response is None when the page did not change
+    def _conditional_get(self, url, **kwargs):
+        cached, headers = self._validators(url)
+        response = self.get(url, headers=headers, **kwargs)
+        if response.status_code == 304:
+            return None, cached and (url,) + tuple(cached)
+        entry = (url, response.headers.get('ETag'), response.headers.get('Last-Modified'), _content_hash(response.content))
+        if cached is not None and cached[2] == entry[3]:
+            return None, entry
+        return response, entry
+
+    # like _conditional_get but the page is parsed and hashed while it downloads, returns
+    # (questions, cache entry) with questions None when the page did not change
+    def _conditional_page(self, url, category=None):
+        cached, headers = self._validators(url)
+        response = self.get(url, headers=headers, allow_redirects=False, stream=True)
+        try:
+            if response.status_code == 304:
+                return None, cached and (url,) + tuple(cached)
+            digest = hashlib.blake2b(digest_size=16)
+
+            def chunks():
+                for chunk in self._iter_body(response):
+                    digest.update(chunk)
+                    yield chunk
+
+            questions = list(iter_questions(chunks(), _encoding(response), category))
+        finally:
+            response.close()
+        entry = (url, response.headers.get('ETag'), response.headers.get('Last-Modified'), digest.hexdigest())
+        if cached is not None and cached[2] == entry[3]:
+            return None, entry
+        return questions, entry
+
+    def scrape(self, seen=None):
+        with ThreadPoolExecutor(self.workers) as pool:
+            if self.cache is None:
+                opentdb = pool.submit(self.scrape_opentdb)
+                questions = self.scrape_trivia_fyi(pool)
+            else:
+                opentdb = pool.submit(self.scrape_opentdb_incremental)
+                questions = self.scrape_trivia_fyi_incremental(pool, seen or set())
+            return questions + opentdb.result()
+
+    def _parse_categories(self, content):
+        categories = []
+        bs = BeautifulSoup(content, "html.parser")
+        for td in bs.find_all('td'):
+            link = td.find('a')
+            categories.append({'category': link.text, 'link': link.attrs['href']})
+        return categories
+
+    def _fetch_page(self, category, page):
+        link = category['link']
+        if page > 1:
+            link = category['link'] + "/page/" + str(page)
+        # parsed while it downloads, the page is never held whole
+        response = self.get(link, allow_redirects=False, stream=True)
+        try:
+            return list(iter_questions(self._iter_body(response), _encoding(response), category['category']))
+        finally:
+            response.close()
+
+    @metrics.timed('scrape_trivia_fyi')
+    def scrape_trivia_fyi(self, pool):
+        categories = self._parse_categories(self.get(self.categories_url).content)
+
+        # every category keeps a few pages in flight, a category ends at its first empty page
+        pages = [{} for _ in categories]
+        last_page = [None] * len(categories)
+        next_page = [1] * len(categories)
+        in_flight = {}
+
+        def submit(i):
+            if last_page[i] is not None:
+                return
+            limit = max(pages[i], default=0) + self.pages_ahead
+            while next_page[i] <= limit:
+                future = pool.submit(self._fetch_page, categories[i], next_page[i])
+                in_flight[future] = (i, next_page[i])
+                next_page[i] += 1
+
+        for i in range(len(categories)):
+            submit(i)
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, page = in_flight.pop(future)
+                questions = future.result()
+                if not questions:
+                    last_page[i] = page if last_page[i] is None else min(last_page[i], page)
+                else:
+                    pages[i][page] = questions
+                submit(i)
+
+        all_questions = []
+        for i in range(len(categories)):
+            for page in sorted(pages[i]):
+                if page < last_page[i]:
+                    all_questions.extend(pages[i][page])
+        return all_questions
+
+    # pages newest first, a category stops at its first page that did not change or that holds
+    # articles scraped before, everything after it is older
+    def _scrape_category(self, category, seen):
+        questions = []
+        entries = []
+        page = 1
+        while True:
+            link = category['link'] if page == 1 else category['link'] + "/page/" + str(page)
+            page_questions, entry = self._conditional_page(link, category['category'])
+            if entry is not None:
+                entries.append(entry)
+            if page_questions is None:
+                break
+            new = [q for q in page_questions if q.get_id() not in seen]
+            questions.extend(new)
+            if not page_questions or len(new) < len(page_questions):
+                break
+            page += 1
+        return questions, entries
+
+    @metrics.timed('scrape_trivia_fyi')
+    def scrape_trivia_fyi_incremental(self, pool, seen):
+        response, entry = self._conditional_get(self.categories_url)
+        if response is None:
+            categories = self.cache.get_meta('categories')
+        if response is not None or categories is None:
+            response = response or self.get(self.categories_url)
+            categories = self._parse_categories(response.content)
+            self.cache.set_meta('categories', categories)
+
+        finished = self.checkpoint.load()
+        futures = {pool.submit(self._scrape_category, c, seen): c for c in categories if c['link'] not in finished}
+        error = None
+        for future in as_completed(futures):
+            try:
+                questions, entries = future.result()
+            except Exception as e:
+                # the other categories are still saved, a rerun only redoes the failed ones
+                error = error or e
+                continue
+            # a page is only remembered once its questions are safe in the checkpoint
+            self.checkpoint.save(futures[future]['link'], questions)
+            self.cache.put_many(entries)
+            finished[futures[future]['link']] = [_checkpoint_row(q) for q in questions]
+        if error is not None:
+            raise error
+        self.cache.put_many([entry])
+
+        return [Question(*q) for c in categories for q in finished.get(c['link'], [])]
+
+    def _opentdb_batches(self, token):
+        attempt = 0
+        while True:
+            response = json.loads(self.get(self.opentdb_url + token).content)
+            if response['response_code'] == OPENT_RATE_LIMITED and attempt < self.retries:
+                time.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+                continue
+            if response['response_code'] != 0:
+                yield response['response_code'], []
+                return
+            attempt = 0
+            questions = []
+            for q in response['results']:
+                question = urllib.parse.unquote(q['question']).strip()
+                if 'anime' in question.lower():
+                    continue
+                answer = urllib.parse.unquote(q['correct_answer']).strip()
+                category = urllib.parse.unquote(q.get('category', '')).strip() or None
+                questions.append(Question(question, answer, None, category, q.get('difficulty')))
+            yield 0, questions
+
+    def _opentdb_token(self):
+        return json.loads(self.get(self.opentdb_token_url).content)['token']
+
+    @metrics.timed('scrape_opentdb')
+    def scrape_opentdb(self):
+        all_questions = []
+        for _, questions in self._opentdb_batches(self._opentdb_token()):
+            all_questions.extend(questions)
+        return all_questions
+
+    # a session token never hands out a question twice, keeping it between scrapes
+    # means opentdb only sends what is new
+    @metrics.timed('scrape_opentdb')
+    def scrape_opentdb_incremental(self):
+        all_questions = [Question(*q) for q in self.checkpoint.load().get(OPENTDB_SOURCE, [])]
+        token = self.cache.get_meta('opentdb_token')
+        for _ in range(2):
+            if token is None:
+                token = self._opentdb_token()
+                self.cache.set_meta('opentdb_token', token)
+            for code, questions in self._opentdb_batches(token):
+                if questions:
+                    self.checkpoint.save(OPENTDB_SOURCE, questions)
+                    all_questions.extend(questions)
+            # expired after hours without use, a new one starts over from the whole database
+            if code != OPENT_TOKEN_NOT_FOUND:
+                break
+            token = None
+        return all_questions
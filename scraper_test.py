@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+
+from fixtures import FixtureServer
+from scraper import Checkpoint, Scraper, ScrapeCache, iter_articles
+
+
+class TestScraper(unittest.TestCase):
+
+    def test_scrapes_every_page_of_every_category(self):
+        with FixtureServer(categories=3, pages=5, articles=4) as server:
+            questions = Scraper(backoff=0, **server.scraper_urls()).scrape()
+
+        self.assertEqual(len(questions), server.expected_questions())
+        first = questions[0]
+        self.assertEqual(first.get_question(), 'Question 0 on page 1 of category 0?')
+        self.assertEqual(first.get_answer(), 'Answer 0-1-0')
+        self.assertEqual(first.get_category(), 'Category 0')
+        self.assertEqual((questions[-1].get_category(), questions[-1].get_difficulty()), ('General Knowledge', 'medium'))
+        # pages come back in order even though they were fetched concurrently
+        fyi = [q.get_question() for q in questions[:20]]
+        self.assertEqual(fyi, [f'Question {i} on page {p} of category 0?' for p in range(1, 6) for i in range(4)])
+
+    def test_respects_host_limit(self):
+        with FixtureServer(categories=6, pages=4, latency=0.02) as server:
+            Scraper(backoff=0, host_limits={'127.0.0.1': 2}, **server.scraper_urls()).scrape()
+        self.assertLessEqual(server.max_in_flight, 2)
+
+    def test_retries_server_errors(self):
+        with FixtureServer(categories=1, pages=1, opentdb_batches=0, failures=2) as server:
+            scraper = Scraper(workers=1, backoff=0, **server.scraper_urls())
+            questions = scraper.scrape()
+        self.assertEqual(len(questions), server.expected_questions())
+
+    def test_stops_after_last_page(self):
+        with FixtureServer(categories=1, pages=2, opentdb_batches=0) as server:
+            Scraper(backoff=0, pages_ahead=1, **server.scraper_urls()).scrape()
+        # categories, token, one opentdb batch and pages 1 to 3
+        self.assertEqual(server.requests, 6)
+
+    def test_streaming_parser_matches_beautifulsoup(self):
+        from bs4 import BeautifulSoup
+
+        page = ('<html><body><article><h2><a href="/q/1">Who painted the <em>Mona Lisa</em>?</a></h2>'
+                '<a href="/other">more</a><div class="su-spoiler su-spoiler-style-default">'
+                '<div class="su-spoiler-content su-u-clearfix">Leonardo da Vinci &amp; friends<br>\n(born in Vinci, Italy)</div></div>'
+                '</article><p>ad</p><article><a>Ça va?</a><div class="su-spoiler-content">Très <b>bien</b> ☺</div></article>'
+                '</body></html>').encode()
+        expected = [(a.find('a').text, a.find('div', {'class': 'su-spoiler-content'}).text)
+                    for a in BeautifulSoup(page, 'html.parser').find_all('article')]
+
+        # one byte at a time splits tags, entities and multibyte characters
+        self.assertEqual(list(iter_articles(page[i:i + 1] for i in range(len(page)))), expected)
+
+
+class TestIncrementalScrape(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = ScrapeCache(os.path.join(self.directory.name, 'cache.db'))
+        self.checkpoint = Checkpoint(os.path.join(self.directory.name, 'checkpoint.jsonl'))
+
+    def tearDown(self):
+        self.cache.close()
+        self.directory.cleanup()
+
+    def scrape(self, server, seen, **kwargs):
+        scraper = Scraper(backoff=0, cache=self.cache, checkpoint=self.checkpoint, **dict(server.scraper_urls(), **kwargs))
+        questions = scraper.scrape(seen)
+        self.checkpoint.clear()
+        return questions
+
+    def test_rescrape_only_fetches_changes(self):
+        for etags in (True, False):
+            with self.subTest(etags=etags), FixtureServer(categories=3, pages=4, articles=5, etags=etags) as server:
+                first = self.scrape(server, set())
+                self.assertEqual(len(first), server.expected_questions())
+                seen = {q.get_id() for q in first}
+
+                requests = server.requests
+                self.assertEqual(self.scrape(server, seen), [])
+                # categories, the first page of each category and one opentdb call on the kept token
+                self.assertEqual(server.requests - requests, 1 + 3 + 1)
+
+                server.add_articles(1, 2)
+                new = self.scrape(server, seen)
+                self.assertEqual([q.get_question() for q in new], ['New question 1 of category 1?', 'New question 0 of category 1?'])
+
+    def test_resumes_from_checkpoint(self):
+        with FixtureServer(categories=4, pages=2, articles=3, opentdb_batches=0) as server:
+            # the second category keeps failing, the others finish
+            urls = server.scraper_urls()
+            scraper = Scraper(backoff=0, retries=0, cache=self.cache, checkpoint=self.checkpoint, **urls)
+            scraper._scrape_category = self.failing(scraper._scrape_category, server.url + '/category/1')
+            with self.assertRaises(RuntimeError):
+                scraper.scrape(set())
+
+            requests = server.requests
+            questions = Scraper(backoff=0, cache=self.cache, checkpoint=self.checkpoint, **urls).scrape(set())
+            self.assertEqual(len(questions), server.expected_questions())
+            # only the failed category is fetched again, its two pages and the one past the end
+            self.assertEqual(server.requests - requests, 1 + 3 + 1)
+
+    def failing(self, scrape_category, link):
+        def scrape(category, seen):
+            if category['link'] == link:
+                raise RuntimeError('connection reset')
+            return scrape_category(category, seen)
+        return scrape
+
+
+if __name__ == '__main__':
+    unittest.main()
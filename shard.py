@@ -0,0 +1,309 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import runpy
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty
+
+from leaderboard import LEADERBOARD_PATH, Leaderboard
+
+TRIVIA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trivia.py')
+
+# messages on the writer queue
+IGNORE = 'ignore'
+SCORES = 'scores'
+STOP = 'stop'
+
+PROGRESS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS shard_progress (
+    shard_id INTEGER PRIMARY KEY,
+    seq INTEGER NOT NULL
+)
+'''
+
+# set in worker processes before trivia.py runs
+writer_queue = None
+
+
+# discord routes a guild to shard (guild_id >> 22) % shard_count, a guild's channels share a shard
+def shard_for(guild_id, shard_count):
+    return (guild_id >> 22) % shard_count
+
+
+# the question store as seen from a worker, ignores are sent to the writer
+class RemoteStore:
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def ignore(self, question_id):
+        self.queue.put((IGNORE, question_id))
+
+
+# a worker ranks its own guilds in memory and sends its score batches to the writer, every
+# batch is numbered so boards read from the database know which batches are already in it
+class ShardLeaderboard(Leaderboard):
+
+    def __init__(self, queue, shard_id, path=LEADERBOARD_PATH, clock=time.time):
+        super().__init__(path, clock)
+        self._connection.execute(PROGRESS_SCHEMA)
+        self.queue = queue
+        self.shard_id = shard_id
+        self._seq = self._committed()
+        self._sent = []
+
+    def _committed(self):
+        row = self._connection.execute('SELECT seq FROM shard_progress WHERE shard_id = ?', (self.shard_id,)).fetchone()
+        return 0 if row is None else row[0]
+
+    def _read_board(self, scope, period):
+        # progress and scores from the same snapshot
+        self._connection.execute('BEGIN')
+        try:
+            committed = self._committed()
+            rows, unwritten = super()._read_board(scope, period)
+        finally:
+            self._connection.commit()
+
+        self._sent = [(seq, scores) for seq, scores in self._sent if seq > committed]
+        return rows, [score for _, scores in self._sent for score in scores] + unwritten
+
+    async def flush(self):
+        self._send()
+
+    # the writer only stops once every worker has exited, so this last batch is still committed
+    def close(self):
+        self._send()
+        super().close()
+
+    def _send(self):
+        scores, self._pending_scores = self._pending_scores, []
+        games, self._pending_games = self._pending_games, []
+        if scores or games:
+            # batches the writer committed are read back from the database
+            if self._sent:
+                with self._lock:
+                    committed = self._committed()
+                self._sent = [(seq, batch) for seq, batch in self._sent if seq > committed]
+            self._seq += 1
+            self._sent.append((self._seq, scores))
+            self.queue.put((SCORES, self.shard_id, self._seq, scores, games))
+
+
+# the only process writing the question store and the leaderboard, it also refreshes the
+# bank and re-exports it for the workers to map
+def run_writer(queue, store_path, leaderboard_path, bank_path, refresh=False):
+    from question import QuestionDatabase
+    from store import QuestionStore
+
+    database = QuestionDatabase(store_path=store_path, bank_path=bank_path, incremental=not os.getenv('FULL_SCRAPE'))
+    database.store = QuestionStore(store_path)
+    board = Leaderboard(leaderboard_path)
+    board._connection.execute(PROGRESS_SCHEMA)
+
+    scrape = None
+    executor = ThreadPoolExecutor(1)
+    if refresh:
+        scrape = executor.submit(database._scrape)
+
+    running = True
+    while running:
+        if scrape is not None and scrape.done():
+            try:
+                database._merge(scrape.result())
+            except Exception as e:
+                print(f'Failed to refresh questions: {e!r}')
+            scrape = None
+
+        try:
+            messages = [queue.get(timeout=1)]
+        except Empty:
+            continue
+        # whatever else is waiting goes into the same transaction
+        while True:
+            try:
+                messages.append(queue.get_nowait())
+            except Empty:
+                break
+
+        batches = []
+        for message in messages:
+            if message[0] == IGNORE:
+                database.store.ignore(message[1])
+            elif message[0] == SCORES:
+                batches.append(message[1:])
+            elif message[0] == STOP:
+                running = False
+
+        if batches:
+            with board._lock, board._connection:
+                for shard_id, seq, scores, games in batches:
+                    board._write_rows(scores, games)
+                    board._connection.execute('INSERT OR REPLACE INTO shard_progress VALUES (?, ?)', (shard_id, seq))
+
+    executor.shutdown(wait=False)
+    board.close()
+    database.store.close()
+
+
+def run_worker(queue, shard_id, shard_count, bank_path, leaderboard_path):
+    global writer_queue
+
+    writer_queue = queue
+    os.environ.update(SHARD_ID=str(shard_id), SHARD_COUNT=str(shard_count), QUESTION_BANK=bank_path,
+                      LEADERBOARD_PATH=leaderboard_path)
+    runpy.run_path(TRIVIA_PATH, run_name='__main__')
+
+
+def run(shards, store_path, leaderboard_path, bank_path, refresh=True):
+    from bank import export_bank
+    from store import QuestionStore
+
+    # workers start from the stored questions, the writer re-exports after its refresh
+    if not os.path.exists(bank_path):
+        export_bank(QuestionStore(store_path).load(), bank_path)
+
+    queue = multiprocessing.Queue()
+    writer = multiprocessing.Process(target=run_writer, args=(queue, store_path, leaderboard_path, bank_path, refresh))
+    workers = [multiprocessing.Process(target=run_worker, args=(queue, i, shards, bank_path, leaderboard_path))
+               for i in range(shards)]
+    writer.start()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    queue.put((STOP,))
+    writer.join()
+
+
+# stands in for the gateway connection of one shard, plays the events routed to it
+# against a GameManager as fast as it can
+def run_gateway_worker(inbox, results, bank_path):
+    asyncio.run(_gateway_worker(inbox, results, bank_path))
+
+
+async def _gateway_worker(inbox, results, bank_path):
+    from game import GameManager
+    from loadtest import FakeAuthor, FakeChannel, FakeContext, FakeGuild, FakeMessage, VirtualClock
+    from question import Question_Database
+
+    Question_Database.bank_path = bank_path
+    await Question_Database.load()
+    clock = VirtualClock()
+    manager = GameManager(clock)
+    stats = {'messages': 0, 'sends': 0, 'ack_latencies': []}
+    contexts = {}
+    in_flight = set()
+    loop = asyncio.get_event_loop()
+    results.put('ready')
+
+    processed = 0
+    while True:
+        events = await loop.run_in_executor(None, inbox.get)
+        if events is None:
+            break
+        for now, guild_id, channel_id, author_id, content in events:
+            clock.now = max(clock.now, now)
+            ctx = contexts.get(channel_id)
+            if ctx is None:
+                ctx = contexts[channel_id] = FakeContext(FakeChannel(channel_id, FakeGuild(guild_id)), stats)
+                manager.start_game(ctx, channel_id, sys.maxsize)
+            task = asyncio.ensure_future(manager.process_message(FakeMessage(ctx.channel, FakeAuthor(author_id), content, now)))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        manager.scheduler.run_due()
+        processed += len(events)
+
+    if in_flight:
+        await asyncio.gather(*in_flight)
+    results.put((processed, time.process_time()))
+
+
+def _gateway_events(guilds, channels, users, messages, duration):
+    from loadtest import ANSWERS, CHATTER, _typo
+
+    random.seed(0)
+    events = []
+    for i in range(messages):
+        guild = random.randrange(guilds)
+        channel = guild * channels + random.randrange(channels)
+        content = random.choice(CHATTER) if random.random() < 0.7 else _typo(random.choice(ANSWERS))
+        events.append((i * duration / messages, guild << 22, channel, channel * users + random.randrange(users), content))
+    return events
+
+
+def bench_gateway(max_workers=None, guilds=64, channels=4, users=20, messages=200_000, duration=600.0, chunk=500):
+    from bank import export_bank
+    from loadtest import ANSWERS
+    from question import Question
+
+    max_workers = max_workers or os.cpu_count()
+    events = _gateway_events(guilds, channels, users, messages, duration)
+
+    with tempfile.TemporaryDirectory() as directory:
+        bank_path = os.path.join(directory, 'questions.bank')
+        export_bank([Question(f'Synthetic question {i}?', ANSWERS[i % len(ANSWERS)]) for i in range(10_000)], bank_path)
+
+        workers = 1
+        while True:
+            routed = [[] for _ in range(workers)]
+            for event in events:
+                routed[shard_for(event[1], workers)].append(event)
+
+            results = multiprocessing.Queue()
+            inboxes = [multiprocessing.Queue() for _ in range(workers)]
+            processes = [multiprocessing.Process(target=run_gateway_worker, args=(inboxes[i], results, bank_path))
+                         for i in range(workers)]
+            for process in processes:
+                process.start()
+            for _ in processes:
+                results.get()
+
+            start = time.perf_counter()
+            for i, shard_events in enumerate(routed):
+                for j in range(0, len(shard_events), chunk):
+                    inboxes[i].put(shard_events[j:j + chunk])
+                inboxes[i].put(None)
+            reports = [results.get() for _ in processes]
+            elapsed = time.perf_counter() - start
+            for process in processes:
+                process.join()
+
+            busiest = max(len(shard_events) for shard_events in routed)
+            print(f'gateway {workers} worker(s): {messages / elapsed:,.0f} messages/s, busiest shard {busiest:,} messages, '
+                  f'{sum(cpu for _, cpu in reports):.1f}s cpu')
+            if workers >= max_workers:
+                break
+            workers = min(workers * 2, max_workers)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Run the bot as one process per shard plus a single writer')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help='run the sharded bot')
+    run_parser.add_argument('--shards', type=int, default=os.cpu_count())
+    run_parser.add_argument('--store', default='questions.db')
+    run_parser.add_argument('--leaderboard', default=LEADERBOARD_PATH)
+    run_parser.add_argument('--bank', default='questions.bank')
+    run_parser.add_argument('--no-refresh', action='store_true')
+    bench_parser = commands.add_parser('bench', help='measure throughput from 1 to N workers against a local gateway')
+    bench_parser.add_argument('--workers', type=int, default=None, help='most workers to try')
+    bench_parser.add_argument('--messages', type=int, default=200_000)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        run(args.shards, args.store, args.leaderboard, os.path.abspath(args.bank), not args.no_refresh)
+    else:
+        bench_gateway(args.workers, messages=args.messages)
+
+
+if __name__ == '__main__':
+    # go through the module so the process targets pickle as shard.*, not __main__.*
+    import shard
+
+    shard.main(sys.argv[1:])
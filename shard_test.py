@@ -0,0 +1,105 @@
+import os
+import queue
+import tempfile
+import threading
+import unittest
+
+from leaderboard import Leaderboard, channel_scope
+from question import Question
+from shard import STOP, RemoteStore, ShardLeaderboard, run_writer, shard_for
+from store import QuestionStore
+
+
+class TestShard(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store_path = os.path.join(self.directory.name, 'questions.db')
+        self.leaderboard_path = os.path.join(self.directory.name, 'leaderboard.db')
+        self.bank_path = os.path.join(self.directory.name, 'questions.bank')
+        self.writes = queue.Queue()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def start_writer(self):
+        writer = threading.Thread(target=run_writer, args=(self.writes, self.store_path, self.leaderboard_path, self.bank_path))
+        writer.start()
+        return writer
+
+    def test_guilds_stay_on_one_shard(self):
+        guilds = [(i << 22) | 12345 for i in range(100)]
+        self.assertEqual({shard_for(guild, 4) for guild in guilds}, {0, 1, 2, 3})
+        self.assertEqual(shard_for(guilds[5], 4), shard_for(guilds[5] + 1, 4))
+
+    async def test_writes_go_through_the_writer(self):
+        questions = [Question(f'Question {i}?', f'Answer {i}') for i in range(5)]
+        store = QuestionStore(self.store_path, None)
+        store.replace_all(questions)
+        store.close()
+
+        first = ShardLeaderboard(self.writes, 0, self.leaderboard_path)
+        second = ShardLeaderboard(self.writes, 1, self.leaderboard_path)
+        writer = self.start_writer()
+
+        RemoteStore(self.writes).ignore(questions[2].get_id())
+        first.add(1, 10 << 22, 100, 'alice', 10)
+        second.add(2, 11 << 22, 200, 'bob', 5)
+        await first.flush()
+        await second.flush()
+        # not committed yet, or already committed, the board counts the batch once
+        first.add(1, 10 << 22, 100, 'alice', 3)
+        self.assertEqual(first.top(channel_scope(1)), [('alice', 13)])
+
+        self.writes.put((STOP,))
+        writer.join()
+        first.close()
+        second.close()
+
+        board = Leaderboard(self.leaderboard_path)
+        self.assertEqual(board.top(channel_scope(1)), [('alice', 10)])
+        self.assertEqual(board.top(channel_scope(2)), [('bob', 5)])
+        board.close()
+        ignored = [q.get_answer() for q in QuestionStore(self.store_path, None).load() if q.is_ignored()]
+        self.assertEqual(ignored, ['Answer 2'])
+
+    async def test_board_read_after_commit_counts_batches_once(self):
+        board = ShardLeaderboard(self.writes, 0, self.leaderboard_path)
+        board.add(1, None, 100, 'alice', 10)
+        await board.flush()
+        self.writes.put((STOP,))
+        self.start_writer().join()
+
+        self.assertEqual(board.top(channel_scope(1)), [('alice', 10)])
+        board.close()
+
+        # a restarted worker carries on numbering after the committed batches
+        self.assertEqual(ShardLeaderboard(self.writes, 0, self.leaderboard_path)._seq, 1)
+
+    async def test_committed_batches_are_forgotten(self):
+        board = ShardLeaderboard(self.writes, 0, self.leaderboard_path)
+        board.add(1, None, 100, 'alice', 10)
+        await board.flush()
+        self.writes.put((STOP,))
+        self.start_writer().join()
+
+        board.add(1, None, 100, 'alice', 5)
+        await board.flush()
+        self.assertEqual([seq for seq, _ in board._sent], [2])
+        board.close()
+
+    async def test_closing_sends_what_was_not_flushed(self):
+        board = ShardLeaderboard(self.writes, 0, self.leaderboard_path)
+        writer = self.start_writer()
+        board.add(1, None, 100, 'alice', 10)
+        board.close()
+        self.writes.put((STOP,))
+        writer.join()
+
+        board = Leaderboard(self.leaderboard_path)
+        self.assertEqual(board.top(channel_scope(1)), [('alice', 10)])
+        board.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import os
+import time
+
+from game import GameState
+
+SNAPSHOT_PATH = 'games.snapshot'
+# how often live games are saved, a crash loses at most this much of a game
+SNAPSHOT_SECONDS = 2
+VERSION = 2
+
+
+# a restored game only has the channel to talk to, games use ctx.send, ctx.channel and ctx.guild
+class ChannelContext:
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.guild = getattr(channel, 'guild', None)
+
+    async def send(self, message):
+        return await self.channel.send(message)
+
+
+# game times are saved as wall clock times, offset is how far the wall clock is ahead of the games'
+def _offset(manager, wall_clock):
+    return wall_clock() - manager.clock()
+
+
+def take_snapshot(manager, wall_clock=time.time, refreshed_at=None, offset=None):
+    if offset is None:
+        offset = _offset(manager, wall_clock)
+    games = []
+    for channel_id, game in manager.games.items():
+        # a finished game has nothing to carry on
+        if game.state == GameState.OVER:
+            continue
+        snapshot = game.snapshot(offset)
+        snapshot['channel'] = channel_id
+        games.append(snapshot)
+    return {'version': VERSION, 'saved_at': wall_clock(), 'refreshed_at': refreshed_at, 'games': games}
+
+
+def _encode(snapshot):
+    return json.dumps(snapshot, separators=(',', ':')).encode()
+
+
+# the old file stays in place until the new one is complete
+def _write(path, data):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+
+
+def write_snapshot(snapshot, path=SNAPSHOT_PATH):
+    _write(path, _encode(snapshot))
+
+
+def read_snapshot(path=SNAPSHOT_PATH):
+    try:
+        with open(path, 'rb') as f:
+            snapshot = json.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f'Failed to read game snapshot: {e!r}')
+        return None
+    if snapshot.get('version') != VERSION:
+        return None
+    return snapshot
+
+
+# puts the saved games back on their channels. timers keep their wall clock deadlines, so the
+# time the bot was down counts, a game whose state ran out meanwhile moves on right away
+def restore_games(manager, snapshot, get_channel, wall_clock=time.time):
+    offset = _offset(manager, wall_clock)
+    restored = 0
+    for game in snapshot['games']:
+        channel = get_channel(game['channel'])
+        if channel is None:
+            print(f'Channel {game["channel"]} is gone, not restoring its game')
+            continue
+        try:
+            manager.restore_game(ChannelContext(channel), game['channel'], game, offset)
+            restored += 1
+        except Exception as e:
+            print(f'Failed to restore game in channel {game["channel"]}: {e!r}')
+    return restored
+
+
+# saving is a walk over the live games on the loop, the write happens in a thread and is
+# skipped while no game moved. the offset is taken once so unchanged games encode the same
+async def snapshot_every(manager, path=SNAPSHOT_PATH, interval=SNAPSHOT_SECONDS, refreshed_at=lambda: None):
+    loop = asyncio.get_event_loop()
+    offset = _offset(manager, time.time)
+    last = None
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            snapshot = take_snapshot(manager, refreshed_at=refreshed_at(), offset=offset)
+            # the save time alone does not make it a new snapshot
+            state = _encode([snapshot['games'], snapshot['refreshed_at']])
+            if state == last:
+                continue
+            await loop.run_in_executor(None, _write, path, _encode(snapshot))
+            last = state
+        except Exception as e:
+            print(f'Failed to save game snapshot: {e!r}')
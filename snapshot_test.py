@@ -0,0 +1,129 @@
+import asyncio
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from game import GameManager, GameState, NO_HINT_DELAY
+from game_test import StubAuthor, StubContext, StubMessage
+from question import Question, Question_Database
+from snapshot import read_snapshot, restore_games, snapshot_every, take_snapshot, write_snapshot
+
+CHANNEL = 1234
+QUESTIONS = [('What is the capital of France?', 'Paris'), ('What is the capital of Italy?', 'Rome'),
+             ('What is the capital of Spain?', 'Madrid')]
+
+# answers the first question, waits for the second and its snapshot, then dies without cleaning up
+GAME = f'''
+import asyncio, os, signal, sys
+import game
+from game import GameManager, GameState
+from game_test import StubAuthor, StubContext, StubMessage
+from question import Question, Question_Database
+from snapshot import snapshot_every
+
+async def until(condition):
+    while not condition():
+        await asyncio.sleep(0.01)
+
+async def main():
+    Question_Database.questions = [Question(q, a) for q, a in {QUESTIONS!r}]
+    game.STATE_DELAYS[GameState.BEFORE_QUESTION] = 0
+    manager = GameManager()
+    manager.start_game(StubContext(), {CHANNEL}, 3)
+    trivia = manager.games[{CHANNEL}]
+    asyncio.ensure_future(manager.scheduler.run())
+    asyncio.ensure_future(snapshot_every(manager, sys.argv[1], interval=0.01))
+
+    await until(lambda: trivia.state == GameState.AWAIT_ANSWER)
+    await manager.process_message(StubMessage({CHANNEL}, StubAuthor(7, 'alice'), trivia.question.get_answer()))
+    await until(lambda: trivia.question_counter == 1 and trivia.state == GameState.AWAIT_ANSWER)
+    await asyncio.sleep(0.1)
+    print(trivia.question.get_question(), flush=True)
+    os.kill(os.getpid(), signal.SIGKILL)
+
+asyncio.get_event_loop().run_until_complete(main())
+'''
+
+
+class TestSnapshot(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'games.snapshot')
+        Question_Database.questions = [Question(q, a) for q, a in QUESTIONS]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    async def test_resumes_a_killed_game(self):
+        killed = subprocess.run([sys.executable, '-c', GAME, self.path], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(killed.returncode, -signal.SIGKILL, killed.stderr)
+        asked = killed.stdout.strip()
+
+        started = time.monotonic()
+        manager = GameManager()
+        channel = StubContext()
+        self.assertEqual(restore_games(manager, read_snapshot(self.path), {CHANNEL: channel}.get), 1)
+        game = manager.games[CHANNEL]
+        await game.outbox.flush()
+        # the question is up again without a scrape or a new deal
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(channel.sent, [f'Question 2:\n{asked}'])
+
+        self.assertEqual((game.question_counter, game.state), (1, GameState.AWAIT_ANSWER))
+        self.assertEqual(game.score_board, {7: {'name': 'alice', 'score': 10}})
+        # the hint timer carries on with what was left of it
+        remaining = manager.scheduler._deadlines[game] - manager.clock()
+        self.assertTrue(0 < remaining < NO_HINT_DELAY, remaining)
+
+        answer = dict(QUESTIONS)[asked]
+        await manager.process_message(StubMessage(CHANNEL, StubAuthor(8, 'bob'), answer))
+        await game.outbox.flush()
+        self.assertEqual(channel.sent[-1], f'Correct answer bob! Answer: {answer}')
+
+    async def test_downtime_is_taken_off_the_timers(self):
+        manager = GameManager()
+        manager.start_game(StubContext(), CHANNEL, 2)
+        manager.start_game(StubContext(), CHANNEL + 1, 1)
+        await manager.stop_game(CHANNEL + 1)
+        write_snapshot(take_snapshot(manager, wall_clock=lambda: 1000), self.path)
+
+        restored = GameManager()
+        snapshot = read_snapshot(self.path)
+        # finished games are not saved
+        self.assertEqual([game['channel'] for game in snapshot['games']], [CHANNEL])
+        self.assertEqual(restore_games(restored, snapshot, {}.get), 0)
+        snapshot = read_snapshot(self.path)
+        self.assertEqual(restore_games(restored, snapshot, {CHANNEL: StubContext()}.get, wall_clock=lambda: 1100), 1)
+        game = restored.games[CHANNEL]
+        self.assertEqual((game.state, game.num_questions, game.question), (GameState.BEFORE_QUESTION, 2, None))
+        self.assertLessEqual(game.next_deadline(), restored.clock())
+
+    async def test_unchanged_games_are_not_written_again(self):
+        manager = GameManager()
+        manager.start_game(StubContext(), CHANNEL, 2)
+        saving = asyncio.ensure_future(snapshot_every(manager, self.path, interval=0.01))
+        try:
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if os.path.exists(self.path):
+                    break
+            os.remove(self.path)
+            await asyncio.sleep(0.1)
+            # the game is still waiting for its first question
+            self.assertFalse(os.path.exists(self.path))
+
+            manager.games[CHANNEL].last_state -= 1
+            await asyncio.sleep(0.1)
+            self.assertTrue(os.path.exists(self.path))
+        finally:
+            saving.cancel()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import pickle
+import sqlite3
+import threading
+
+from journal import ANSWERED, ASKED, IGNORE, PROGRESS_SCHEMA, applied_seq, save_applied_seq
+from question import Question
+
+STORE_PATH = 'questions.db'
+PICKLE_PATH = 'questions.pkl'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    details TEXT,
+    ignored INTEGER NOT NULL DEFAULT 0,
+    category TEXT,
+    difficulty TEXT
+)
+'''
+
+STATS_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS question_stats (
+    id INTEGER PRIMARY KEY,
+    asked INTEGER NOT NULL DEFAULT 0,
+    answered INTEGER NOT NULL DEFAULT 0,
+    answer_seconds REAL NOT NULL DEFAULT 0
+)
+'''
+
+STATS_UPSERT = '''
+INSERT INTO question_stats VALUES (?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET asked = asked + excluded.asked, answered = answered + excluded.answered,
+    answer_seconds = answer_seconds + excluded.answer_seconds
+'''
+
+# columns added after the first schema, older stores get them on open
+ADDED_COLUMNS = [('category', 'TEXT'), ('difficulty', 'TEXT')]
+
+
+def _row(question):
+    return (question.get_id(), question.get_question(), question.get_answer(), question.get_details(), int(question.is_ignored()),
+            question.get_category(), question.get_difficulty())
+
+
+# questions keyed by their stable id, so ignoring one is a single row update
+class QuestionStore:
+
+    def __init__(self, path=STORE_PATH, pickle_path=PICKLE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(SCHEMA)
+        self._migrate()
+        self._connection.execute(STATS_SCHEMA)
+        self._connection.execute(PROGRESS_SCHEMA)
+
+        if pickle_path and not len(self) and os.path.exists(pickle_path):
+            self.migrate_from_pickle(pickle_path)
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM questions').fetchone()[0]
+
+    def _migrate(self):
+        columns = {row[1] for row in self._connection.execute('PRAGMA table_info(questions)')}
+        with self._connection:
+            for name, kind in ADDED_COLUMNS:
+                if name not in columns:
+                    self._connection.execute(f'ALTER TABLE questions ADD COLUMN {name} {kind}')
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def migrate_from_pickle(self, pickle_path):
+        with open(pickle_path, 'rb') as f:
+            questions = pickle.load(f)
+        self.replace_all(questions)
+        return len(questions)
+
+    def load(self):
+        with self._lock:
+            rows = self._connection.execute('SELECT question, answer, details, ignored, category, difficulty FROM questions').fetchall()
+
+        questions = []
+        for question, answer, details, ignored, category, difficulty in rows:
+            q = Question(question, answer, details, category, difficulty)
+            if ignored:
+                q.ignore_question()
+            questions.append(q)
+        return questions
+
+    def replace_all(self, questions):
+        with self._lock, self._connection:
+            self._connection.execute('DELETE FROM questions')
+            self._connection.executemany('INSERT OR REPLACE INTO questions VALUES (?, ?, ?, ?, ?, ?, ?)', map(_row, questions))
+
+    # new questions only, rows already stored keep their ignore flag
+    def insert(self, questions):
+        with self._lock, self._connection:
+            self._connection.executemany('INSERT OR IGNORE INTO questions VALUES (?, ?, ?, ?, ?, ?, ?)', map(_row, questions))
+
+    def ignore(self, question_id):
+        with self._lock, self._connection:
+            self._connection.execute('UPDATE questions SET ignored = 1 WHERE id = ?', (question_id,))
+
+    # (asked, answered, seconds to answer) of a question
+    def stats(self, question_id):
+        with self._lock:
+            row = self._connection.execute('SELECT asked, answered, answer_seconds FROM question_stats WHERE id = ?',
+                                           (question_id,)).fetchone()
+        return row or (0, 0, 0.0)
+
+    def journal_seq(self):
+        with self._lock:
+            return applied_seq(self._connection)
+
+    # records of a journal.Journal up to seq, in one transaction with the progress
+    def apply_journal(self, records, seq):
+        ignored = []
+        stats = {}
+        for record in records:
+            if record[0] == IGNORE:
+                ignored.append((record[1],))
+            elif record[0] in (ASKED, ANSWERED):
+                asked, answered, seconds = stats.get(record[1], (0, 0, 0.0))
+                if record[0] == ASKED:
+                    stats[record[1]] = (asked + 1, answered, seconds)
+                else:
+                    stats[record[1]] = (asked, answered + 1, seconds + record[2])
+
+        with self._lock, self._connection:
+            self._connection.executemany('UPDATE questions SET ignored = 1 WHERE id = ?', ignored)
+            self._connection.executemany(STATS_UPSERT, [(question_id, *counts) for question_id, counts in stats.items()])
+            save_applied_seq(self._connection, seq)
@@ -0,0 +1,124 @@
+import os
+import pickle
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+from bank import MappedBank, export_bank
+from dedup import merge_questions, new_questions
+from question import Question
+from store import QuestionStore
+
+
+# Question as it was before __slots__, pickled under its name with a plain __dict__ as the state
+class LegacyQuestion:
+
+    def __init__(self, question, answer, details=None, ignore=False):
+        self.question = question
+        self.answer = answer
+        self.ignore = ignore
+        self.details = details
+
+
+LegacyQuestion.__module__ = 'question'
+LegacyQuestion.__qualname__ = 'Question'
+
+
+class TestQuestionStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'questions.db')
+        self.pickle_path = os.path.join(self.directory.name, 'questions.pkl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_migrates_pickle(self):
+        questions = [LegacyQuestion("Capital of France?", "Paris", "(city)"), LegacyQuestion("2 + 2?", "4", ignore=True)]
+        with open(self.pickle_path, 'wb') as f, mock.patch('question.Question', LegacyQuestion):
+            pickle.dump(questions, f)
+
+        loaded = QuestionStore(self.path, self.pickle_path).load()
+        loaded = {q.get_answer(): q for q in loaded}
+        self.assertEqual(loaded['Paris'].get_details(), '(city)')
+        self.assertFalse(loaded['Paris'].is_ignored())
+        self.assertTrue(loaded['4'].is_ignored())
+
+    def test_ignore_updates_single_question(self):
+        questions = [Question(f"Question {i}?", f"Answer {i}") for i in range(10)]
+        store = QuestionStore(self.path, None)
+        store.replace_all(questions)
+        store.ignore(questions[3].get_id())
+        store.close()
+
+        ignored = [q.get_answer() for q in QuestionStore(self.path, None).load() if q.is_ignored()]
+        self.assertEqual(ignored, ['Answer 3'])
+
+    def test_adds_category_columns_to_older_stores(self):
+        connection = sqlite3.connect(self.path)
+        connection.execute('CREATE TABLE questions (id INTEGER PRIMARY KEY, question TEXT NOT NULL, answer TEXT NOT NULL, '
+                           'details TEXT, ignored INTEGER NOT NULL DEFAULT 0)')
+        connection.execute("INSERT INTO questions VALUES (1, 'Old question?', 'old', NULL, 0)")
+        connection.commit()
+        connection.close()
+
+        store = QuestionStore(self.path, None)
+        store.insert([Question("Capital of France?", "Paris", None, "Geography", "easy")])
+        loaded = {q.get_answer(): q for q in store.load()}
+        self.assertIsNone(loaded['old'].get_category())
+        self.assertEqual((loaded['Paris'].get_category(), loaded['Paris'].get_difficulty()), ('Geography', 'easy'))
+        store.close()
+
+
+class TestMerge(unittest.TestCase):
+
+    def test_collapses_duplicates_and_keeps_ignores(self):
+        scraped = [Question("Capital of France?", "Paris"), Question("CAPITAL OF FRANCE ?", "paris."), Question("2 + 2?", "4")]
+        stored = [Question("Capital of France?", "Paris"), Question("Old question?", "old")]
+        stored[0].ignore_question()
+
+        merged, stats = merge_questions(scraped, stored)
+        self.assertEqual([q.get_answer() for q in merged], ['Paris', '4', 'old'])
+        self.assertTrue(merged[0].is_ignored())
+        self.assertEqual(stats['duplicates'], 1)
+        self.assertEqual(stats['kept'], 1)
+
+    def test_near_duplicates(self):
+        scraped = [Question("Which is the capital of France?", "Paris"), Question("The capital of France is which?", "Paris")]
+        self.assertEqual(len(merge_questions(scraped, [])[0]), 2)
+        self.assertEqual(len(merge_questions(scraped, [], near_duplicates=True)[0]), 1)
+
+    def test_new_questions_skip_stored_copies(self):
+        stored = [Question("Capital of France?", "Paris")]
+        scraped = [Question("CAPITAL OF FRANCE ?", "paris."), Question("2 + 2?", "4"), Question("2 + 2 ?", "4")]
+        self.assertEqual([q.get_answer() for q in new_questions(scraped, stored)], ['4'])
+
+
+class TestMappedBank(unittest.TestCase):
+
+    def test_round_trip(self):
+        questions = [Question("Capital of France?", "Paris", "(city)", "Geography", "easy"), Question("Ça va?", "Très bien"),
+                     Question("2 + 2?", "4", None, "Science: Mathematics", "hard")]
+        questions[2].ignore_question()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'questions.bank')
+            export_bank(questions, path)
+            bank = MappedBank(path)
+
+            self.assertEqual(len(bank), 3)
+            self.assertEqual([q.get_answer() for q in bank], ['Paris', 'Très bien', '4'])
+            self.assertEqual(bank[0].get_details(), '(city)')
+            self.assertIsNone(bank[1].get_details())
+            self.assertEqual([q.is_ignored() for q in bank], [False, False, True])
+            self.assertEqual([(q.get_category(), q.get_difficulty()) for q in bank],
+                             [('Geography', 'easy'), (None, None), ('Science: Mathematics', 'hard')])
+
+            bank.mark_ignored(bank[0])
+            self.assertTrue(bank[0].is_ignored())
+            bank.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
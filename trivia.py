@@ -1,20 +1,40 @@
 import asyncio
 import os
+import time
+import typing
 
+import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 
 load_dotenv()
 TOKEN = os.getenv('TOKEN')
 
+from catalog import describe_filter, parse_filter
 from game import GameManager
+from journal import Journal
+from leaderboard import ALL_TIME, JOURNAL_PATH, LEADERBOARD_PATH, JournaledLeaderboard, channel_scope, guild_scope, week_period
+from metrics import metrics
+from question import Question_Database
+import shard
+from snapshot import SNAPSHOT_PATH, read_snapshot, restore_games, snapshot_every, take_snapshot, write_snapshot
 
+# a scrape this recent is not done again when the bot restarts
+REFRESH_SECONDS = 6 * 60 * 60
 
-bot = commands.Bot(command_prefix='!')
+
+# set by shard.py, each process then only gets the events of its own guilds
+SHARD_ID = os.getenv('SHARD_ID')
+SHARD_COUNT = os.getenv('SHARD_COUNT')
+if SHARD_COUNT:
+    bot = commands.Bot(command_prefix='!', shard_id=int(SHARD_ID), shard_count=int(SHARD_COUNT))
+else:
+    bot = commands.Bot(command_prefix='!')
 
 @bot.event
 async def on_ready():
     print(f'{bot.user} has connected to Discord!')
+    restore()
 
     for guild in bot.guilds:
         print(
@@ -30,35 +50,87 @@ async def on_error(event, *args, **kwargs):
     with open('err.log', 'a') as f:
         f.write(f'Exception in {event}: {args[0]}\n')
 
-manager = GameManager()
+# set up by main(). pool workers in process match mode re-import this script as __mp_main__
+# and must not open the journals or start a bot of their own
+leaderboard = None
+manager = None
 
-@bot.command(name='start', help='Starts a new trivia game')
-async def start_game(ctx, num_questions=10):
-    guild = ctx.message.guild.name
-    channel = ctx.message.channel.name
+# games in flight when the bot went down carry on from the last snapshot, each shard keeps its own
+SNAPSHOT = os.getenv('GAME_SNAPSHOT', SNAPSHOT_PATH if SHARD_ID is None else f'games.{SHARD_ID}.snapshot')
+warm_start = None
 
-    started = manager.start_game(ctx, guild, channel, num_questions)
+# on_ready runs again on every reconnect, the games are only restored once
+def restore():
+    global warm_start
+    if warm_start is None:
+        return
+    restored = restore_games(manager, warm_start, bot.get_channel)
+    warm_start = None
+    if restored:
+        print(f'Restored {restored} games from the last snapshot')
+
+# !start 10, !start 10 science, !start 10 history hard
+@bot.command(name='start', help='Starts a new trivia game, add category words and/or easy, medium or hard to filter questions')
+async def start_game(ctx, num_questions=10, *options):
+    question_filter = parse_filter(options)
+    kind = '' if question_filter is None else f' {describe_filter(question_filter)}'
+    if question_filter is not None and not Question_Database.matching(question_filter):
+        await ctx.send(f'No{kind} questions found')
+        return
+    started = manager.start_game(ctx, ctx.channel.id, num_questions, question_filter)
     if started:
-        await ctx.send(f'Starting game with {num_questions} questions')
+        await ctx.send(f'Starting game with {num_questions}{kind} questions')
 
 @bot.command(name='stop', help='Stops the current game')
 async def stop_game(ctx):
-    guild = ctx.message.guild.name
-    channel = ctx.message.channel.name
-
-    stopped = await manager.stop_game(guild, channel)
+    stopped = await manager.stop_game(ctx.channel.id)
     if stopped:
         await ctx.send('Stopped game')
 
 @bot.command(name='ignore', help='Ignore question')
 async def ignore_question(ctx):
-    guild = ctx.message.guild.name
-    channel = ctx.message.channel.name
-
-    question = await manager.ignore_question(guild, channel)
+    question = await manager.ignore_question(ctx.channel.id)
     if question:
         await ctx.send(f'Ignored question: {question.get_question()}, answer: {question.get_answer()}')
 
+# !top 10, !top week, !top 10 guild week
+def _board(ctx, options):
+    scope = guild_scope(ctx.guild.id) if 'guild' in options and ctx.guild else channel_scope(ctx.channel.id)
+    period = week_period(leaderboard.clock()) if 'week' in options else ALL_TIME
+    return scope, period
+
+@bot.command(name='top', help='Shows the best players, add guild and/or week to change the board')
+async def show_top(ctx, n: typing.Optional[int] = 10, *options):
+    scope, period = _board(ctx, options)
+    top = leaderboard.top(scope, min(n, 50), period)
+    if not top:
+        await ctx.send('No scores yet')
+        return
+    await ctx.send('\n'.join(f'{i}. {name} - {score} pts' for i, (name, score) in enumerate(top, 1)))
+
+@bot.command(name='rank', help='Shows the rank of a player, add guild and/or week to change the board')
+async def show_rank(ctx, member: typing.Optional[discord.Member] = None, *options):
+    member = member or ctx.author
+    scope, period = _board(ctx, options)
+    rank = leaderboard.rank(scope, member.id, period)
+    if rank is None:
+        await ctx.send(f'{member.name} has no points yet')
+        return
+    await ctx.send(f'{member.name} is #{rank[0]} of {rank[2]} with {rank[1]} pts')
+
+@bot.command(name='stats', help='Shows live bot metrics')
+@commands.has_permissions(administrator=True)
+async def show_stats(ctx):
+    if not metrics.enabled:
+        await ctx.send('Metrics are disabled, set TRIVIA_METRICS=1 to enable them')
+        return
+
+    snapshot = metrics.snapshot()
+    lines = [f'{name}: {value}' for name, value in sorted(snapshot['counters'].items())]
+    for name, histogram in sorted(snapshot['histograms'].items()):
+        lines.append(f'{name}: {histogram["count"]} calls, p50 <= {histogram["p50"] * 1000:g}ms, p99 <= {histogram["p99"] * 1000:g}ms')
+    await ctx.send('\n'.join(lines) or 'No metrics recorded yet')
+
 @bot.event
 async def on_message(message):
     if bot.user == message.author:
@@ -68,11 +140,67 @@ async def on_message(message):
 
 async def game_loop():
     await bot.wait_until_ready()
-    while not bot.is_closed():
-        for game in manager.games.values():
-            await game.advance_game()
-        await asyncio.sleep(1)
-
-
-bot.loop.create_task(game_loop())
-bot.run(TOKEN)
+    await manager.scheduler.run()
+
+# games can start from the last snapshot right away, fresh questions are swapped in once scraped
+async def load_questions():
+    Question_Database.bank_path = os.getenv('QUESTION_BANK')
+    # FULL_SCRAPE=1 downloads everything again instead of only what changed
+    Question_Database.incremental = not os.getenv('FULL_SCRAPE')
+    await Question_Database.load()
+    # the writer process refreshes the bank for all shards
+    if shard.writer_queue is not None:
+        await Question_Database.watch_bank()
+        return
+    # a restart shortly after a scrape uses the saved bank until the next one is due
+    if Question_Database.refreshed_at is not None:
+        await asyncio.sleep(Question_Database.refreshed_at + REFRESH_SECONDS - time.time())
+    try:
+        await Question_Database.refresh()
+    except Exception as e:
+        print(f'Failed to refresh questions: {e!r}')
+
+async def export_metrics():
+    await metrics.serve(port=int(os.getenv('METRICS_PORT', 9100)))
+    if os.getenv('METRICS_DUMP'):
+        bot.loop.create_task(metrics.dump_json(os.getenv('METRICS_DUMP')))
+    await metrics.sample_loop_lag()
+
+def main():
+    global leaderboard, manager, warm_start
+
+    # a shard worker sends its writes to the writer process
+    if shard.writer_queue is not None:
+        leaderboard = shard.ShardLeaderboard(shard.writer_queue, int(SHARD_ID), os.getenv('LEADERBOARD_PATH', LEADERBOARD_PATH))
+        Question_Database.store = shard.RemoteStore(shard.writer_queue)
+    else:
+        # scores, ignores and question stats are journaled and folded into the databases in the background
+        leaderboard = JournaledLeaderboard(os.getenv('LEADERBOARD_PATH', LEADERBOARD_PATH), os.getenv('LEADERBOARD_JOURNAL', JOURNAL_PATH))
+        Question_Database.journal = Journal(os.getenv('QUESTION_JOURNAL', 'questions.journal'), Question_Database._get_store())
+    manager = GameManager(leaderboard=leaderboard)
+
+    warm_start = read_snapshot(SNAPSHOT)
+    if warm_start is not None:
+        Question_Database.refreshed_at = warm_start['refreshed_at']
+
+    if metrics.enabled:
+        bot.loop.create_task(export_metrics())
+    bot.loop.create_task(load_questions())
+    bot.loop.create_task(leaderboard.flush_every())
+    bot.loop.create_task(game_loop())
+    bot.loop.create_task(snapshot_every(manager, SNAPSHOT, refreshed_at=lambda: Question_Database.refreshed_at))
+    bot.run(TOKEN)
+
+    # a deploy picks the games up where this run left them
+    try:
+        write_snapshot(take_snapshot(manager, refreshed_at=Question_Database.refreshed_at), SNAPSHOT)
+    except Exception as e:
+        print(f'Failed to save game snapshot: {e!r}')
+
+    # whatever is still journaled goes into the databases before exiting
+    if Question_Database.journal is not None:
+        Question_Database.journal.close()
+    leaderboard.close()
+
+if __name__ == '__main__':
+    main()
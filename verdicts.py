@@ -0,0 +1,90 @@
+import os
+import time
+from collections import OrderedDict
+
+from metrics import metrics
+
+VERDICT_CACHE_SIZE = int(os.getenv('VERDICT_CACHE_SIZE', 100_000))
+VERDICT_CACHE_TTL = float(os.getenv('VERDICT_CACHE_TTL', 600))
+
+
+# verdicts of guesses already matched against a question, shared by every game of a manager
+# so the same wrong guess in many channels is matched once. keys are (question id, guess.lower()),
+# lowercasing is the only change to a guess that can never change its verdict
+class VerdictCache:
+
+    def __init__(self, size=VERDICT_CACHE_SIZE, ttl=VERDICT_CACHE_TTL, clock=time.monotonic):
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        # (question id, guess) -> (verdict, expires), least recently used first
+        self.entries = OrderedDict()
+        # question id -> guesses cached for it, to drop them all when it leaves rotation
+        self.guesses = {}
+        # question id -> number of games it is up in
+        self.refcounts = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, question_id, guess):
+        key = (question_id, guess.lower())
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[1] > self.clock():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                metrics.inc('verdict_cache_hits')
+                return entry[0]
+            self._evict(key)
+        self.misses += 1
+        metrics.inc('verdict_cache_misses')
+        return None
+
+    def put(self, question_id, guess, verdict):
+        key = (question_id, guess.lower())
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        else:
+            self.guesses.setdefault(question_id, set()).add(key[1])
+        self.entries[key] = (verdict, self.clock() + self.ttl)
+        while len(self.entries) > self.size:
+            self._evict(next(iter(self.entries)))
+
+    def _evict(self, key):
+        del self.entries[key]
+        guesses = self.guesses[key[0]]
+        guesses.discard(key[1])
+        if not guesses:
+            del self.guesses[key[0]]
+
+    # known verdicts by lowered guess up to the first known correct one, and the guesses
+    # before it that still have to be matched, one per lowered guess
+    def lookup(self, question_id, guesses):
+        known = {}
+        misses = []
+        for guess in guesses:
+            key = guess.lower()
+            if key in known:
+                continue
+            verdict = known[key] = self.get(question_id, guess)
+            if verdict is None:
+                misses.append(guess)
+            elif verdict:
+                break
+        return known, misses
+
+    # a game holds the question it has up, its verdicts go once no game does
+    def acquire(self, question_id):
+        self.refcounts[question_id] = self.refcounts.get(question_id, 0) + 1
+
+    def release(self, question_id):
+        count = self.refcounts.get(question_id, 0) - 1
+        if count > 0:
+            self.refcounts[question_id] = count
+            return
+        self.refcounts.pop(question_id, None)
+        for guess in self.guesses.pop(question_id, ()):
+            del self.entries[(question_id, guess)]
@@ -0,0 +1,52 @@
+import unittest
+
+from loadtest import VirtualClock
+from verdicts import VerdictCache
+
+
+class TestVerdictCache(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock()
+        self.cache = VerdictCache(size=3, ttl=10, clock=self.clock)
+
+    def test_guesses_differing_in_case_share_a_verdict(self):
+        self.cache.put(1, 'Paris', True)
+        self.assertTrue(self.cache.get(1, 'PARIS'))
+        self.assertIsNone(self.cache.get(2, 'paris'))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_least_recently_used_and_expired_entries_go(self):
+        for guess in ('a', 'b', 'c'):
+            self.cache.put(1, guess, False)
+        self.cache.get(1, 'a')
+        self.cache.put(1, 'd', False)
+        self.assertIsNone(self.cache.get(1, 'b'))
+        self.assertFalse(self.cache.get(1, 'a'))
+
+        self.clock.now = 10
+        self.assertIsNone(self.cache.get(1, 'a'))
+        self.assertEqual(len(self.cache), 2)
+
+    def test_verdicts_go_when_the_last_game_releases_the_question(self):
+        self.cache.acquire(1)
+        self.cache.acquire(1)
+        self.cache.put(1, 'london', False)
+        self.cache.put(2, 'london', False)
+
+        self.cache.release(1)
+        self.assertFalse(self.cache.get(1, 'london'))
+        self.cache.release(1)
+        self.assertIsNone(self.cache.get(1, 'london'))
+        self.assertEqual(len(self.cache), 1)
+
+    def test_lookup_stops_at_the_first_known_correct_guess(self):
+        self.cache.put(1, 'london', False)
+        self.cache.put(1, 'paris', True)
+        known, misses = self.cache.lookup(1, ['rome', 'London', 'ROME', 'paris', 'berlin'])
+        self.assertEqual(known, {'rome': None, 'london': False, 'paris': True})
+        self.assertEqual(misses, ['rome'])
+
+
+if __name__ == '__main__':
+    unittest.main()